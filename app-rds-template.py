@@ -3,13 +3,17 @@
 
 import boto3
 import json
+import threading
+import time
 from datetime import date
-from flask import Flask, render_template, redirect, url_for, request, flash, session
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey, func, select
+from flask import Flask, render_template, redirect, url_for, request, flash, session, g, jsonify
+from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, func, select
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
 import os
 from functools import wraps
 
+from base_donnees import creer_moteur, statistiques_pool
+
 # ============================================================================
 # Configuration AWS et Secrets Manager
 # ============================================================================
@@ -53,11 +57,8 @@ print(f"Database: {DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'SQLit
 # SQLAlchemy Configuration
 # ============================================================================
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # Important pour RDS - teste la connexion avant usage
-    echo=False
-)
+# Profil 'prod' pour RDS (pool dimensionné, pre-ping, recyclage), 'dev' pour SQLite
+engine = creer_moteur(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 db_session = scoped_session(SessionLocal)
@@ -171,41 +172,73 @@ def get_db():
     """Retourne une session de base de données"""
     return db_session
 
+@app.teardown_appcontext
+def remove_session(exception=None):
+    # Rend la connexion au pool à la fin de chaque requête
+    db_session.remove()
+
 # ============================================================================
 # Authentication
 # ============================================================================
 
-def current_user():
-    """Retourne l'utilisateur actuel depuis la session"""
-    user_id = session.get('user_id')
-    if not user_id:
-        return None
-    
+# Utilisateurs en cache quelques secondes, par (type de compte, id)
+DUREE_CACHE_UTILISATEUR = 30
+_utilisateurs = {}
+_verrou_utilisateurs = threading.Lock()
+
+def charger_utilisateur(user_id, role=None):
+    """Lit le compte en une requête : la table est déduite du rôle en session"""
     db = get_db()
-    # Chercher d'abord dans Utilisateur (admin/enseignant)
-    user = db.query(Utilisateur).filter(Utilisateur.id == user_id).first()
-    if user:
-        return {
-            "id": user.id,
-            "nom": user.nom,
-            "email": user.email,
-            "role": user.role,
-            "type": "utilisateur"
-        }
-    
+    if role != "etudiant":
+        # Chercher d'abord dans Utilisateur (admin/enseignant)
+        user = db.execute(
+            select(Utilisateur.id, Utilisateur.nom, Utilisateur.email, Utilisateur.role)
+            .where(Utilisateur.id == user_id)
+        ).first()
+        if user:
+            return {"id": user.id, "nom": user.nom, "email": user.email, "role": user.role, "type": "utilisateur"}
+        if role:
+            return None
+
     # Sinon dans Etudiant
-    etudiant = db.query(Etudiant).filter(Etudiant.id == user_id).first()
+    etudiant = db.execute(
+        select(Etudiant.id, Etudiant.nom, Etudiant.email).where(Etudiant.id == user_id)
+    ).first()
     if etudiant:
-        return {
-            "id": etudiant.id,
-            "nom": etudiant.nom,
-            "email": etudiant.email,
-            "role": "etudiant",
-            "type": "etudiant"
-        }
-    
+        return {"id": etudiant.id, "nom": etudiant.nom, "email": etudiant.email, "role": "etudiant", "type": "etudiant"}
     return None
 
+def invalider_utilisateur(user_id=None, role=None):
+    """À appeler après une modification de profil ou de rôle (sans argument : tout le cache)"""
+    with _verrou_utilisateurs:
+        if user_id is None:
+            _utilisateurs.clear()
+        else:
+            _utilisateurs.pop((role == "etudiant", user_id), None)
+
+def current_user():
+    """Retourne l'utilisateur actuel depuis la session, résolu une fois par requête"""
+    if "current_user" in g:
+        return g.current_user
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+
+    role = session.get('user_role')
+    cle = (role == "etudiant", user_id)
+    maintenant = time.monotonic()
+    with _verrou_utilisateurs:
+        entree = _utilisateurs.get(cle)
+    if entree and entree[0] > maintenant:
+        user = entree[1]
+    else:
+        user = charger_utilisateur(user_id, role)
+        if user:
+            with _verrou_utilisateurs:
+                _utilisateurs[cle] = (maintenant + DUREE_CACHE_UTILISATEUR, user)
+    g.current_user = user
+    return user
+
 def login_required(role=None):
     """Décorateur pour vérifier l'authentification et le rôle"""
     def decorator(fn):
@@ -241,6 +274,7 @@ def login():
         # Vérifier dans Utilisateur
         user = db.query(Utilisateur).filter(Utilisateur.email == email).first()
         if user and user.password_hash == password:
+            invalider_utilisateur(user.id, user.role)
             session['user_id'] = user.id
             session['user_role'] = user.role
             flash(f"Bienvenue {user.nom}!", "success")
@@ -252,6 +286,7 @@ def login():
         # Vérifier dans Etudiant
         etudiant = db.query(Etudiant).filter(Etudiant.email == email).first()
         if etudiant and etudiant.password_hash == password:
+            invalider_utilisateur(etudiant.id, "etudiant")
             session['user_id'] = etudiant.id
             session['user_role'] = "etudiant"
             flash(f"Bienvenue {etudiant.nom}!", "success")
@@ -263,6 +298,8 @@ def login():
 
 @app.route("/logout")
 def logout():
+    if session.get('user_id'):
+        invalider_utilisateur(session['user_id'], session.get('user_role'))
     session.clear()
     flash("Vous êtes déconnecté.", "success")
     return redirect(url_for('login'))
@@ -271,6 +308,12 @@ def logout():
 # Routes Admin (exemple)
 # ============================================================================
 
+@app.route("/admin/pool")
+@login_required(role=("admin",))
+def admin_pool():
+    """Statistiques du pool de connexions (supervision)"""
+    return jsonify(statistiques_pool(engine))
+
 @app.route("/admin/dashboard")
 @login_required(role=("admin",))
 def admin_dashboard():
@@ -1,4 +1,14 @@
-from datetime import date
+import hmac
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import partial
+
+import click
 
 from flask import (
     Flask,
@@ -8,20 +18,40 @@ from flask import (
     request,
     flash,
     session,
+    jsonify,
 )
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import check_password_hash, generate_password_hash
 from sqlalchemy import (
-    create_engine,
     Column,
     Integer,
     String,
     Date,
+    DateTime,
     Float,
     ForeignKey,
+    Index,
+    UniqueConstraint,
+    and_,
+    case,
+    delete,
+    distinct,
+    event,
     func,
+    insert,
+    inspect,
+    literal,
     select,
+    true,
+    union_all,
+    update,
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
 
+from base_donnees import creer_moteur, statistiques_pool
+from pagination_cle import PAR_PAGE, PAR_PAGE_MAX, paginer
+from reponses_http import conditionnel, installer_compression
+
 
 Base = declarative_base()
 
@@ -78,6 +108,7 @@ class Matiere(Base):
     filiere = relationship("Filiere", back_populates="matieres")
     specialite = relationship("Specialite", back_populates="matieres")
     devoirs = relationship("Devoir", back_populates="matiere", cascade="all, delete-orphan")
+    moyennes = relationship("MoyenneCache", cascade="all, delete-orphan")
 
 
 class Devoir(Base):
@@ -107,6 +138,7 @@ class Etudiant(Base):
     filiere = relationship("Filiere", back_populates="etudiants")
     specialite = relationship("Specialite", back_populates="etudiants")
     notes = relationship("Note", back_populates="etudiant", cascade="all, delete-orphan")
+    moyennes = relationship("MoyenneCache", cascade="all, delete-orphan")
 
 
 class Utilisateur(Base):
@@ -119,6 +151,23 @@ class Utilisateur(Base):
     role = Column(String, nullable=False)  # admin, enseignant
 
 
+class Identifiant(Base):
+    """Identifiants de connexion des deux tables de comptes (utilisateur, etudiant)"""
+    __tablename__ = "identifiant"
+
+    id = Column(Integer, primary_key=True)
+    email = Column(String, nullable=False)  # en minuscules
+    mot_de_passe_hash = Column(String, nullable=False)
+    type_compte = Column(String, nullable=False)  # utilisateur, etudiant
+    compte_id = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)  # admin, enseignant, etudiant
+
+    __table_args__ = (
+        Index("uq_identifiant_email", "email", unique=True),
+        UniqueConstraint("type_compte", "compte_id"),
+    )
+
+
 class Note(Base):
     __tablename__ = "note"
 
@@ -131,13 +180,1240 @@ class Note(Base):
     devoir = relationship("Devoir", back_populates="notes")
 
 
+class MoyenneCache(Base):
+    __tablename__ = "moyenne_cache"
+
+    id = Column(Integer, primary_key=True)
+    etudiant_id = Column(Integer, ForeignKey("etudiant.id"), nullable=False)
+    matiere_id = Column(Integer, ForeignKey("matiere.id"), nullable=False)
+    somme = Column(Float, nullable=False, default=0.0)  # somme des notes (devoirs non pondérés)
+    nb_notes = Column(Integer, nullable=False, default=0)
+    moyenne = Column(Float)
+    statut = Column(String, nullable=False, default="Non notée")
+
+    __table_args__ = (UniqueConstraint("etudiant_id", "matiere_id"),)
+
+
+class ExportJob(Base):
+    __tablename__ = "export_job"
+
+    id = Column(Integer, primary_key=True)
+    type = Column(String, nullable=False)  # notes, filiere, etudiant, releve
+    parametres = Column(String, nullable=False, default="{}")  # JSON, clés triées
+    statut = Column(String, nullable=False, default="en_attente")  # en_attente, en_cours, termine, erreur, expire
+    version_notes = Column(Integer)  # generation_notes au moment de la génération
+    fichier = Column(String)
+    nom_fichier = Column(String)
+    erreur = Column(String)
+    date_creation = Column(DateTime, default=datetime.utcnow)
+    date_fin = Column(DateTime)
+
+
+class CelluleStatistique(Base):
+    """Agrégats des notes d'une cellule filière x spécialité x semestre x matière"""
+    __tablename__ = "cellule_statistique"
+
+    id = Column(Integer, primary_key=True)
+    filiere_id = Column(Integer)  # filière et spécialité de l'étudiant (None si non renseignées)
+    specialite_id = Column(Integer)
+    semestre_id = Column(Integer)
+    matiere_id = Column(Integer, nullable=False, index=True)
+    nb_notes = Column(Integer, nullable=False, default=0)
+    somme = Column(Float, nullable=False, default=0.0)
+    somme_carres = Column(Float, nullable=False, default=0.0)
+    minimum = Column(Float)
+    maximum = Column(Float)
+    # Couples (étudiant, matière) par statut, d'après le cache des moyennes
+    nb_validees = Column(Integer, nullable=False, default=0)
+    nb_a_rattraper = Column(Integer, nullable=False, default=0)
+    nb_non_validees = Column(Integer, nullable=False, default=0)
+    date_maj = Column(DateTime, default=datetime.utcnow)
+
+
+class CubeEnAttente(Base):
+    """Matière dont les cellules sont à recalculer (None : tout le cube)"""
+    __tablename__ = "cube_en_attente"
+
+    id = Column(Integer, primary_key=True)
+    matiere_id = Column(Integer)
+
+
+class GenerationCatalogue(Base):
+    """Compteur (une ligne) incrémenté par toute écriture du catalogue"""
+    __tablename__ = "generation_catalogue"
+
+    id = Column(Integer, primary_key=True)
+    valeur = Column(Integer, nullable=False, default=0)
+
+
+class GenerationNotes(Base):
+    """Compteur (une ligne) incrémenté par toute écriture des notes"""
+    __tablename__ = "generation_notes"
+
+    id = Column(Integer, primary_key=True)
+    valeur = Column(Integer, nullable=False, default=0)
+
+
+# --------- Agrégation des moyennes ----------
+
+def statut_matiere(moyenne, matiere):
+    """Statut d'une matière selon sa moyenne, son seuil et son caractère rattrapable."""
+    if moyenne is None:
+        return "Non notée"
+    if moyenne >= matiere.seuil_validation:
+        return "Validée"
+    if matiere.rattrapable:
+        return "À rattraper"
+    return "Non validée"
+
+
+def maj_cache_moyenne(db, etudiant_id, matiere_id, valeur, sens=1):
+    """Ajoute (sens=1) ou retire (sens=-1) une note du cache des moyennes, sans commit."""
+    entree = (
+        db.query(MoyenneCache)
+        .filter_by(etudiant_id=etudiant_id, matiere_id=matiere_id)
+        .first()
+    )
+    if entree is None:
+        if sens < 0:
+            return
+        entree = MoyenneCache(etudiant_id=etudiant_id, matiere_id=matiere_id, somme=0.0, nb_notes=0)
+        db.add(entree)
+        db.flush()
+
+    entree.nb_notes += sens
+    if entree.nb_notes <= 0:
+        db.delete(entree)
+        db.flush()
+        return
+    entree.somme += sens * valeur
+    moyenne = entree.somme / entree.nb_notes
+    entree.moyenne = round(moyenne, 2)
+    entree.statut = statut_matiere(moyenne, db.get(Matiere, matiere_id))
+
+
+def reconstruire_cache_moyennes(db, etudiant_ids=None, matiere_ids=None):
+    """Recalcule le cache depuis les notes en une requête groupée, sans commit."""
+    query = (
+        select(Note.etudiant_id, Devoir.matiere_id, func.sum(Note.valeur), func.count(Note.id))
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .group_by(Note.etudiant_id, Devoir.matiere_id)
+    )
+    suppression = delete(MoyenneCache)
+    if etudiant_ids is not None:
+        etudiant_ids = list(etudiant_ids)
+        query = query.where(Note.etudiant_id.in_(etudiant_ids))
+        suppression = suppression.where(MoyenneCache.etudiant_id.in_(etudiant_ids))
+    if matiere_ids is not None:
+        matiere_ids = [m for m in matiere_ids if m is not None]
+        query = query.where(Devoir.matiere_id.in_(matiere_ids))
+        suppression = suppression.where(MoyenneCache.matiere_id.in_(matiere_ids))
+
+    db.flush()
+    matieres = {m.id: m for m in db.query(Matiere).all()}
+    entrees = []
+    for etudiant_id, matiere_id, somme, nb in db.execute(query):
+        moyenne = somme / nb
+        entrees.append(
+            {
+                "etudiant_id": etudiant_id,
+                "matiere_id": matiere_id,
+                "somme": somme,
+                "nb_notes": nb,
+                "moyenne": round(moyenne, 2),
+                "statut": statut_matiere(moyenne, matieres[matiere_id]),
+            }
+        )
+    db.execute(suppression)
+    if entrees:
+        db.execute(insert(MoyenneCache), entrees)
+
+
+def moyennes_etudiants(db, etudiant_ids):
+    """Moyennes par matière et moyenne générale pour un lot d'étudiants.
+
+    Une seule lecture du cache : la grille étudiants x matières est jointe
+    (jointure externe) aux agrégats matérialisés par (étudiant, matière).
+    Retourne {etudiant_id: (resultats, moyenne_generale)}.
+    """
+    etudiant_ids = list(etudiant_ids)
+    if not etudiant_ids:
+        return {}
+
+    rows = db.execute(
+        select(Etudiant.id, Matiere, MoyenneCache.somme, MoyenneCache.nb_notes, MoyenneCache.statut)
+        .select_from(Etudiant)
+        .join(Matiere, true())
+        .outerjoin(
+            MoyenneCache,
+            and_(MoyenneCache.etudiant_id == Etudiant.id, MoyenneCache.matiere_id == Matiere.id),
+        )
+        .where(Etudiant.id.in_(etudiant_ids))
+        .order_by(Etudiant.id, Matiere.id)
+    ).all()
+
+    resultats = {}
+    totaux = {}
+    for etudiant_id, matiere, somme, nb, statut in rows:
+        moyenne = somme / nb if nb else None
+        resultats.setdefault(etudiant_id, []).append(
+            {
+                "matiere": matiere,
+                "moyenne": round(moyenne, 2) if moyenne is not None else None,
+                "statut": statut or statut_matiere(moyenne, matiere),
+            }
+        )
+        total = totaux.setdefault(etudiant_id, [0.0, 0])
+        if nb:
+            total[0] += somme
+            total[1] += nb
+
+    moyennes = {}
+    for etudiant_id, lignes in resultats.items():
+        somme, nb = totaux[etudiant_id]
+        moyenne_generale = somme / nb if nb else None
+        moyennes[etudiant_id] = (lignes, round(moyenne_generale, 2) if moyenne_generale else None)
+    return moyennes
+
+
+# --------- Exports en flux ----------
+
+TAILLE_LOT_EXPORT = 1000  # lignes lues par aller-retour avec la base
+TAILLE_BLOC_EXPORT = 64 * 1024  # octets envoyés par morceau
+ECHANTILLON_LARGEURS = 500  # lignes examinées pour la largeur des colonnes
+
+
+def largeurs_colonnes(entetes, echantillon, maximum=50):
+    """Largeur de chaque colonne d'après les en-têtes et un échantillon de lignes."""
+    largeurs = [len(str(h)) for h in entetes]
+    for ligne in echantillon:
+        for i, valeur in enumerate(ligne):
+            if valeur is not None:
+                largeurs[i] = max(largeurs[i], len(str(valeur)))
+    return [min(largeur + 2, maximum) for largeur in largeurs]
+
+
+def classeur_en_flux(titre, entetes, lignes, fichier=None):
+    """Écrit un classeur en mode write-only dans fichier (par défaut un fichier temporaire).
+
+    Les lignes sont consommées une seule fois ; seules les ECHANTILLON_LARGEURS
+    premières restent en mémoire, le temps de fixer la largeur des colonnes.
+    """
+    from itertools import chain, islice
+    from tempfile import TemporaryFile
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    from openpyxl.utils import get_column_letter
+
+    lignes = iter(lignes)
+    echantillon = list(islice(lignes, ECHANTILLON_LARGEURS))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titre)
+    for i, largeur in enumerate(largeurs_colonnes(entetes, echantillon), start=1):
+        ws.column_dimensions[get_column_letter(i)].width = largeur
+
+    ligne_entete = []
+    for h in entetes:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="4A90E2", end_color="4A90E2", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center")
+        ligne_entete.append(cell)
+    ws.append(ligne_entete)
+    for ligne in chain(echantillon, lignes):
+        ws.append(ligne)
+
+    if fichier is None:
+        fichier = TemporaryFile()
+    wb.save(fichier)
+    fichier.seek(0)
+    return fichier
+
+
+def flux_csv(entetes, lignes, delimiter=";", taille_lot=TAILLE_LOT_EXPORT):
+    """Produit le CSV encodé en UTF-8, un bloc d'octets par lot de lignes."""
+    import csv
+    from io import StringIO
+    from itertools import islice
+
+    tampon = StringIO()
+    writer = csv.writer(tampon, delimiter=delimiter)
+    writer.writerow(entetes)
+    lignes = iter(lignes)
+    while True:
+        lot = list(islice(lignes, taille_lot))
+        writer.writerows(lot)
+        bloc = tampon.getvalue()
+        if bloc:
+            yield bloc.encode("utf-8")
+        if not lot:
+            break
+        tampon.seek(0)
+        tampon.truncate()
+
+
+def flux_gzip(blocs, niveau=6):
+    """Compresse un flux de blocs d'octets au format gzip, au fil de l'eau."""
+    import zlib
+
+    compresseur = zlib.compressobj(niveau, zlib.DEFLATED, 31)
+    for bloc in blocs:
+        sortie = compresseur.compress(bloc)
+        if sortie:
+            yield sortie
+    yield compresseur.flush()
+
+
+def flux_fichier(fichier, taille_bloc=TAILLE_BLOC_EXPORT):
+    """Envoie un fichier par blocs puis le ferme (un TemporaryFile est alors supprimé)."""
+    try:
+        while True:
+            bloc = fichier.read(taille_bloc)
+            if not bloc:
+                break
+            yield bloc
+    finally:
+        fichier.close()
+
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def styler_entete(cellules):
+    from openpyxl.styles import Font, PatternFill, Alignment
+
+    for cell in cellules:
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="4A90E2", end_color="4A90E2", fill_type="solid")
+        cell.alignment = Alignment(horizontal="center")
+
+
+def ajuster_largeurs(ws):
+    for column in ws.columns:
+        max_length = 0
+        column_letter = column[0].column_letter
+        for cell in column:
+            try:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(cell.value)
+            except:
+                pass
+        adjusted_width = min(max_length + 2, 50)
+        ws.column_dimensions[column_letter].width = adjusted_width
+
+
+# --------- Générateurs d'exports ----------
+# Chaque générateur écrit le classeur dans `fichier` (objet binaire ouvert)
+# et retourne le nom proposé au téléchargement. Ils servent aussi bien aux
+# routes synchrones qu'aux jobs exécutés dans le pool de processus.
+
+def export_notes(db, fichier):
+    headers = ["Étudiant", "Filière", "Spécialité", "Matière", "Semestre", "Devoir", "Type", "Date", "Note"]
+    query = (
+        db.query(
+            Etudiant.nom,
+            Filiere.nom,
+            Specialite.code,
+            Matiere.nom,
+            Semestre.nom,
+            Devoir.nom,
+            Devoir.type,
+            Devoir.date,
+            Note.valeur
+        )
+        .join(Note, Note.etudiant_id == Etudiant.id)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .join(Matiere, Devoir.matiere_id == Matiere.id)
+        .outerjoin(Filiere, Etudiant.filiere_id == Filiere.id)
+        .outerjoin(Specialite, Etudiant.specialite_id == Specialite.id)
+        .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
+        .order_by(Etudiant.nom, Matiere.nom)
+        .yield_per(TAILLE_LOT_EXPORT)
+    )
+    lignes = (
+        [
+            r[0],  # Étudiant
+            r[1] or "-",  # Filière
+            r[2] or "-",  # Spécialité
+            r[3],  # Matière
+            r[4] or "-",  # Semestre
+            r[5],  # Devoir
+            r[6],  # Type
+            r[7].strftime("%d/%m/%Y") if r[7] else "-",  # Date
+            r[8]  # Note
+        ]
+        for r in query
+    )
+    classeur_en_flux("Notes", headers, lignes, fichier)
+    return "notes_completes.xlsx"
+
+
+def export_notes_filiere(db, fichier, filiere_id):
+    filiere = db.get(Filiere, filiere_id)
+    if not filiere:
+        raise LookupError("Filière introuvable.")
+
+    headers = ["Étudiant", "Spécialité", "Matière", "Semestre", "Devoir", "Type", "Date", "Note"]
+    query = (
+        db.query(
+            Etudiant.nom,
+            Specialite.code,
+            Matiere.nom,
+            Semestre.nom,
+            Devoir.nom,
+            Devoir.type,
+            Devoir.date,
+            Note.valeur
+        )
+        .join(Note, Note.etudiant_id == Etudiant.id)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .join(Matiere, Devoir.matiere_id == Matiere.id)
+        .filter(Etudiant.filiere_id == filiere_id)
+        .outerjoin(Specialite, Etudiant.specialite_id == Specialite.id)
+        .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
+        .order_by(Etudiant.nom, Matiere.nom)
+        .yield_per(TAILLE_LOT_EXPORT)
+    )
+    lignes = (
+        [
+            r[0], r[1] or "-", r[2], r[3] or "-", r[4], r[5],
+            r[6].strftime("%d/%m/%Y") if r[6] else "-", r[7]
+        ]
+        for r in query
+    )
+    classeur_en_flux(f"Notes {filiere.nom}", headers, lignes, fichier)
+    return f"notes_{filiere.nom}.xlsx"
+
+
+def export_releve(db, fichier, etudiant_id):
+    from openpyxl import Workbook
+
+    etudiant = db.get(Etudiant, etudiant_id)
+    if not etudiant:
+        raise LookupError("Étudiant introuvable.")
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Relevé de notes"
+
+    # En-têtes
+    ws.append([f"Relevé de notes - {etudiant.nom}"])
+    ws.append([f"Filière: {etudiant.filiere.nom if etudiant.filiere else '-'}"])
+    ws.append([f"Spécialité: {etudiant.specialite.nom if etudiant.specialite else '-'}"])
+    ws.append([])
+
+    headers = ["Matière", "Semestre", "Devoir", "Type", "Date", "Note"]
+    ws.append(headers)
+    styler_entete(ws[5])
+
+    # Données
+    rows = (
+        db.query(
+            Matiere.nom,
+            Semestre.nom,
+            Devoir.nom,
+            Devoir.type,
+            Devoir.date,
+            Note.valeur
+        )
+        .select_from(Note)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .join(Matiere, Devoir.matiere_id == Matiere.id)
+        .filter(Note.etudiant_id == etudiant_id)
+        .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
+        .order_by(Matiere.nom, Devoir.date)
+        .all()
+    )
+    for r in rows:
+        ws.append([
+            r[0], r[1] or "-", r[2], r[3],
+            r[4].strftime("%d/%m/%Y") if r[4] else "-", r[5]
+        ])
+
+    ajuster_largeurs(ws)
+    wb.save(fichier)
+    return f"releve_{etudiant.nom.replace(' ', '_')}.xlsx"
+
+
+def export_releve_etudiant(db, fichier, etudiant_id, semestre_id=None):
+    from openpyxl import Workbook
+
+    etudiant = db.get(Etudiant, etudiant_id)
+    if not etudiant:
+        raise LookupError("Étudiant introuvable.")
+
+    wb = Workbook()
+    ws = wb.active
+
+    semestre = db.get(Semestre, semestre_id) if semestre_id else None
+    if semestre_id:
+        ws.title = f"Notes {semestre.nom if semestre else 'Semestre'}"
+        titre_semestre = f" - {semestre.nom}" if semestre else ""
+    else:
+        ws.title = "Mes notes"
+        titre_semestre = ""
+
+    # Informations étudiant
+    ws.append([f"Relevé de notes{titre_semestre} - {etudiant.nom}"])
+    ws.append([f"Filière: {etudiant.filiere.nom if etudiant.filiere else '-'}"])
+    ws.append([f"Spécialité: {etudiant.specialite.nom if etudiant.specialite else '-'}"])
+    ws.append([])
+
+    headers = ["Matière", "Code", "Semestre", "Devoir", "Type", "Date", "Note"]
+    ws.append(headers)
+    styler_entete(ws[5])
+
+    # Données filtrées
+    query = (
+        db.query(
+            Matiere.nom,
+            Matiere.code,
+            Semestre.nom,
+            Devoir.nom,
+            Devoir.type,
+            Devoir.date,
+            Note.valeur
+        )
+        .select_from(Note)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .join(Matiere, Devoir.matiere_id == Matiere.id)
+        .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
+        .filter(Note.etudiant_id == etudiant_id)
+    )
+
+    if semestre_id:
+        query = query.filter(Matiere.semestre_id == semestre_id)
+
+    rows = query.order_by(Matiere.nom, Devoir.date).all()
+
+    for r in rows:
+        ws.append([
+            r[0], r[1], r[2] or "-", r[3], r[4],
+            r[5].strftime("%d/%m/%Y") if r[5] else "-", r[6]
+        ])
+
+    # Moyennes par matière
+    resultats, moyenne_generale = moyennes_etudiants(db, [etudiant_id]).get(etudiant_id, ([], None))
+    noms_semestres = dict(db.query(Semestre.id, Semestre.nom).all())
+    ws.append([])
+    ws.append(["Matière", "Code", "Semestre", "Moyenne", "Statut"])
+    styler_entete(ws[ws.max_row])
+    for r in resultats:
+        m = r["matiere"]
+        if r["moyenne"] is None or (semestre_id and m.semestre_id != semestre_id):
+            continue
+        ws.append([
+            m.nom, m.code, noms_semestres.get(m.semestre_id, "-"), r["moyenne"], r["statut"]
+        ])
+    if not semestre_id:
+        ws.append(["Moyenne générale", "", "", moyenne_generale if moyenne_generale is not None else "-"])
+
+    ajuster_largeurs(ws)
+    wb.save(fichier)
+    return f"notes_{semestre.nom if semestre_id and semestre else 'completes'}_{etudiant.nom.replace(' ', '_')}.xlsx"
+
+
+GENERATEURS_EXPORT = {
+    "notes": export_notes,
+    "filiere": export_notes_filiere,
+    "etudiant": export_releve,
+    "releve": export_releve_etudiant,
+}
+
+
+def reponse_export(db, type_export, **parametres):
+    """Génère un export dans un fichier temporaire et le renvoie en flux."""
+    from tempfile import TemporaryFile
+    from flask import Response
+
+    fichier = TemporaryFile()
+    try:
+        nom = GENERATEURS_EXPORT[type_export](db, fichier, **parametres)
+    except Exception:
+        fichier.close()
+        raise
+    taille = fichier.seek(0, os.SEEK_END)
+    fichier.seek(0)
+    return Response(
+        flux_fichier(fichier),
+        mimetype=MIME_XLSX,
+        headers={
+            "Content-Disposition": f"attachment;filename={nom}",
+            "Content-Length": str(taille),
+        },
+        direct_passthrough=True,
+    )
+
+
+# --------- Jobs d'export en arrière-plan ----------
+
+STATUTS_ACTIFS = ("en_attente", "en_cours", "termine")
+
+
+def suivre_notes(db, contexte):
+    """Incrémente generation_notes dans la transaction de toute écriture d'une
+    note ou d'un devoir changé de matière."""
+    for objet in (*db.new, *db.dirty, *db.deleted):
+        if isinstance(objet, Note) or (
+            isinstance(objet, Devoir) and inspect(objet).attrs.matiere_id.history.has_changes()
+        ):
+            db.connection().execute(
+                update(GenerationNotes).values(valeur=GenerationNotes.valeur + 1)
+            )
+            return
+
+
+def version_notes(db):
+    return db.scalar(select(GenerationNotes.valeur))
+
+
+def demander_export(db, type_export, parametres):
+    """Retourne (job, a_soumettre).
+
+    Un job en attente ou en cours pour le même export est partagé ; un
+    artefact terminé est réutilisé tant qu'aucune note n'a été écrite depuis
+    sa génération. Sinon un nouveau job est créé (et validé) : à soumettre au pool.
+    """
+    cle = json.dumps(parametres, sort_keys=True)
+    existant = (
+        db.query(ExportJob)
+        .filter(
+            ExportJob.type == type_export,
+            ExportJob.parametres == cle,
+            ExportJob.statut.in_(STATUTS_ACTIFS),
+        )
+        .order_by(ExportJob.id.desc())
+        .first()
+    )
+    if existant is not None:
+        if existant.statut != "termine":
+            return existant, False
+        if (
+            existant.version_notes == version_notes(db)
+            and existant.fichier
+            and os.path.exists(existant.fichier)
+        ):
+            return existant, False
+
+    job = ExportJob(type=type_export, parametres=cle, statut="en_attente")
+    db.add(job)
+    db.commit()
+    return job, True
+
+
+def executer_export(job_id, database_uri, dossier):
+    """Point d'entrée des processus du pool : génère l'export d'un job.
+
+    Le processus ouvre sa propre connexion ; le fichier est écrit sous un nom
+    temporaire puis renommé, les artefacts plus anciens du même export sont
+    supprimés.
+    """
+    from sqlalchemy.orm import Session
+
+    engine = creer_moteur(database_uri, profil="worker")
+    try:
+        with Session(engine) as db:
+            job = db.get(ExportJob, job_id)
+            if job is None:
+                return
+            job.statut = "en_cours"
+            db.commit()
+
+            parametres = json.loads(job.parametres)
+            chemin = os.path.join(dossier, f"export_{job.id}.xlsx")
+            try:
+                # Version relevée avant lecture : une note modifiée pendant
+                # la génération invalidera l'artefact à la prochaine demande.
+                version = version_notes(db)
+                with open(chemin + ".part", "wb") as fichier:
+                    nom = GENERATEURS_EXPORT[job.type](db, fichier, **parametres)
+                os.replace(chemin + ".part", chemin)
+            except Exception as e:
+                db.rollback()
+                if os.path.exists(chemin + ".part"):
+                    os.remove(chemin + ".part")
+                job.statut = "erreur"
+                job.erreur = str(e)
+            else:
+                anciens = (
+                    db.query(ExportJob)
+                    .filter(
+                        ExportJob.type == job.type,
+                        ExportJob.parametres == job.parametres,
+                        ExportJob.statut == "termine",
+                        ExportJob.id != job.id,
+                    )
+                    .all()
+                )
+                for ancien in anciens:
+                    if ancien.fichier and os.path.exists(ancien.fichier):
+                        os.remove(ancien.fichier)
+                    ancien.statut = "expire"
+                job.statut = "termine"
+                job.version_notes = version
+                job.fichier = chemin
+                job.nom_fichier = nom
+            job.date_fin = datetime.utcnow()
+            db.commit()
+    finally:
+        engine.dispose()
+
+
+# --------- Pagination par clé ----------
+
+def page_notes(db, args):
+    """Page des notes (tri par étudiant) décrite par ?curseur=&par_page=&filtres"""
+    query = (
+        select(
+            Note.id.label("id"),
+            Etudiant.nom.label("etudiant"),
+            Devoir.nom.label("devoir"),
+            Matiere.nom.label("matiere"),
+            Note.valeur.label("valeur"),
+        )
+        .join(Etudiant, Note.etudiant_id == Etudiant.id)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .join(Matiere, Devoir.matiere_id == Matiere.id)
+    )
+    for parametre, colonne in (
+        ("etudiant_id", Note.etudiant_id),
+        ("devoir_id", Note.devoir_id),
+        ("matiere_id", Devoir.matiere_id),
+        ("filiere_id", Etudiant.filiere_id),
+    ):
+        valeur = args.get(parametre)
+        if valeur:
+            if not valeur.isdigit():
+                raise ValueError(f"Identifiant invalide : {valeur}")
+            query = query.where(colonne == int(valeur))
+    try:
+        par_page = min(max(int(args.get("par_page") or PAR_PAGE), 1), PAR_PAGE_MAX)
+    except ValueError:
+        raise ValueError("par_page doit être un entier")
+    page = paginer(db, query, [(Etudiant.nom, False), (Note.id, False)], "etudiant", args.get("curseur"), par_page)
+    return page.lignes, page.suivant, page.precedent
+
+
+# --------- Identifiants ----------
+
+# Remplace le mot de passe en clair d'un compte dont l'identifiant est migré
+MOT_DE_PASSE_MIGRE = "!"
+TAILLE_LOT_IDENTIFIANTS = 500
+_comptes = {"utilisateur": Utilisateur, "etudiant": Etudiant}
+_anciens_restants = {"valeur": True, "expire": 0.0}
+
+
+def normaliser_email(email):
+    return (email or "").strip().lower()
+
+
+def resoudre_identifiant(db, email):
+    """(type_compte, compte_id, role, mot_de_passe_hash, nom) en une lecture indexée, ou None"""
+    return db.execute(
+        select(
+            Identifiant.type_compte,
+            Identifiant.compte_id,
+            Identifiant.role,
+            Identifiant.mot_de_passe_hash,
+            func.coalesce(Utilisateur.nom, Etudiant.nom).label("nom"),
+        )
+        .outerjoin(
+            Utilisateur,
+            and_(Identifiant.type_compte == "utilisateur", Utilisateur.id == Identifiant.compte_id),
+        )
+        .outerjoin(
+            Etudiant,
+            and_(Identifiant.type_compte == "etudiant", Etudiant.id == Identifiant.compte_id),
+        )
+        .where(Identifiant.email == normaliser_email(email))
+    ).first()
+
+
+def creer_identifiant(db, type_compte, compte, mot_de_passe_hash):
+    """Identifiant d'un compte (le mot de passe en clair est effacé), sans commit"""
+    compte.mot_de_passe = MOT_DE_PASSE_MIGRE
+    db.add(Identifiant(
+        email=normaliser_email(compte.email),
+        mot_de_passe_hash=mot_de_passe_hash,
+        type_compte=type_compte,
+        compte_id=compte.id,
+        role=compte.role if type_compte == "utilisateur" else "etudiant",
+    ))
+
+
+def anciens_identifiants_restants(db, duree=60):
+    """Vrai tant que des comptes gardent un mot de passe en clair (valeur gardée duree s)"""
+    if _anciens_restants["expire"] < time.monotonic():
+        _anciens_restants["valeur"] = any(
+            db.query(modele.id).filter(modele.mot_de_passe != MOT_DE_PASSE_MIGRE).first()
+            for modele in _comptes.values()
+        )
+        _anciens_restants["expire"] = time.monotonic() + duree
+    return _anciens_restants["valeur"]
+
+
+def connexion_ancienne(db, email, mot_de_passe):
+    """Compte non encore migré dont le mot de passe en clair correspond
+
+    Le compte est migré sur-le-champ (commit) et retourné comme par
+    resoudre_identifiant ; None sinon.
+    """
+    email = normaliser_email(email)
+    candidats = db.execute(union_all(
+        select(literal("utilisateur").label("type_compte"), Utilisateur.id, Utilisateur.mot_de_passe)
+        .where(func.lower(Utilisateur.email) == email, Utilisateur.mot_de_passe != MOT_DE_PASSE_MIGRE),
+        select(literal("etudiant").label("type_compte"), Etudiant.id, Etudiant.mot_de_passe)
+        .where(func.lower(Etudiant.email) == email, Etudiant.mot_de_passe != MOT_DE_PASSE_MIGRE),
+    )).all()
+    for type_compte, compte_id, en_clair in candidats:
+        if hmac.compare_digest(en_clair.encode(), mot_de_passe.encode()):
+            compte = db.get(_comptes[type_compte], compte_id)
+            try:
+                creer_identifiant(db, type_compte, compte, generate_password_hash(mot_de_passe))
+                db.commit()
+            except IntegrityError:
+                # Email déjà pris par l'autre table : connexion sans migration
+                db.rollback()
+                compte = db.get(_comptes[type_compte], compte_id)
+            role = compte.role if type_compte == "utilisateur" else "etudiant"
+            return type_compte, compte.id, role, None, compte.nom
+    return None
+
+
+def _hacher_lot(mots_de_passe):
+    return [generate_password_hash(m) for m in mots_de_passe]
+
+
+def migrer_identifiants(db, taille_lot=TAILLE_LOT_IDENTIFIANTS, processus=None, journal=None):
+    """Hache par lots les mots de passe en clair et crée les identifiants
+
+    Chaque lot est validé séparément : l'application reste en service et
+    les comptes pas encore migrés se connectent par connexion_ancienne.
+    Retourne {'migres': n, 'conflits': [emails déjà utilisés par l'autre table]}.
+    """
+    rapport = {"migres": 0, "conflits": []}
+    processus = processus or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=processus) if processus > 1 else None
+    try:
+        for type_compte, modele in _comptes.items():
+            dernier = 0
+            while True:
+                comptes = (
+                    db.query(modele)
+                    .filter(modele.mot_de_passe != MOT_DE_PASSE_MIGRE, modele.id > dernier)
+                    .order_by(modele.id)
+                    .limit(taille_lot)
+                    .all()
+                )
+                if not comptes:
+                    break
+                dernier = comptes[-1].id
+                mots = [c.mot_de_passe for c in comptes]
+                if pool:
+                    morceau = max(1, len(mots) // (processus * 4))
+                    lots = [mots[i:i + morceau] for i in range(0, len(mots), morceau)]
+                    hachages = [h for lot in pool.map(_hacher_lot, lots) for h in lot]
+                else:
+                    hachages = _hacher_lot(mots)
+
+                emails = {normaliser_email(c.email) for c in comptes}
+                pris = set(db.scalars(select(Identifiant.email).where(Identifiant.email.in_(emails))))
+                for compte, hachage in zip(comptes, hachages):
+                    email = normaliser_email(compte.email)
+                    if email in pris:
+                        rapport["conflits"].append(email)
+                        continue
+                    pris.add(email)
+                    creer_identifiant(db, type_compte, compte, hachage)
+                    rapport["migres"] += 1
+                db.commit()
+                if journal:
+                    journal(type_compte, rapport["migres"])
+    finally:
+        if pool:
+            pool.shutdown()
+    _anciens_restants["expire"] = 0.0
+    return rapport
+
+
+# --------- Pages conditionnelles (ETag) ----------
+
+# Les notes sont suivies par le compteur generation_notes, le catalogue
+# (matières, devoirs, semestres, fiches) par generation_catalogue ; chacun est
+# incrémenté dans la transaction de l'écriture qui le modifie : tous les
+# workers voient la même version.
+MODELES_CATALOGUE = (Filiere, Specialite, Semestre, Matiere, Devoir, Etudiant)
+
+
+def suivre_catalogue(db, contexte):
+    for objet in (*db.new, *db.dirty, *db.deleted):
+        if isinstance(objet, MODELES_CATALOGUE):
+            db.connection().execute(
+                update(GenerationCatalogue).values(valeur=GenerationCatalogue.valeur + 1)
+            )
+            return
+
+
+def version_etudiant(db):
+    """Version des pages de résultats des étudiants, pour l'ETag"""
+    return (
+        version_notes(db),
+        db.scalar(select(GenerationCatalogue.valeur)),
+    )
+
+
+# --------- Compteurs du tableau de bord ----------
+
+# Tous les totaux du tableau de bord admin en un seul SELECT (sous-requêtes
+# scalaires), gardés en mémoire jusqu'au commit d'une écriture qui les change.
+MODELES_COMPTES = (Matiere, Devoir, Etudiant, Note)
+DUREE_COMPTEURS = 300  # secondes
+_compteurs = {"valeur": None, "expire": 0.0, "generation": 0}
+
+
+def compter_tableau_bord(db):
+    """{'matieres', 'devoirs', 'etudiants', 'notes', 'moyenne_generale'} en une requête"""
+    ligne = db.execute(select(
+        select(func.count(Matiere.id)).scalar_subquery().label("matieres"),
+        select(func.count(Devoir.id)).scalar_subquery().label("devoirs"),
+        select(func.count(Etudiant.id)).scalar_subquery().label("etudiants"),
+        select(func.count(Note.id)).scalar_subquery().label("notes"),
+        select(func.avg(Note.valeur)).scalar_subquery().label("moyenne_generale"),
+    )).one()
+    compteurs = dict(ligne._mapping)
+    if compteurs["moyenne_generale"] is not None:
+        compteurs["moyenne_generale"] = round(compteurs["moyenne_generale"], 2)
+    return compteurs
+
+
+def compteurs_tableau_bord(db, duree=DUREE_COMPTEURS):
+    maintenant = time.monotonic()
+    if _compteurs["valeur"] is not None and _compteurs["expire"] > maintenant:
+        return _compteurs["valeur"]
+    generation = _compteurs["generation"]
+    valeur = compter_tableau_bord(db)
+    if generation == _compteurs["generation"]:
+        _compteurs.update(valeur=valeur, expire=maintenant + duree)
+    return valeur
+
+
+def noter_compteurs(db, contexte):
+    if any(isinstance(objet, MODELES_COMPTES) for objet in (*db.new, *db.dirty, *db.deleted)):
+        db.info["compteurs_modifies"] = True
+
+
+def invalider_compteurs(db):
+    if db.info.pop("compteurs_modifies", False):
+        _compteurs["generation"] += 1
+        _compteurs["valeur"] = None
+
+
+# --------- Cube de statistiques ----------
+
+# Les notes sont agrégées par cellule filière x spécialité x semestre x matière
+# (effectif, somme, somme des carrés, extrêmes, statuts) en un passage groupé
+# rangé dans cellule_statistique ; coupes et consolidations se calculent
+# ensuite en mémoire à partir des cellules. Chaque écriture inscrit les
+# matières touchées dans cube_en_attente, dans sa propre transaction : la
+# lecture suivante, quel que soit le processus qui la sert, recalcule leurs
+# cellules.
+DIMENSIONS_CUBE = ("filiere_id", "specialite_id", "semestre_id", "matiere_id")
+MESURES_CUBE = (
+    "nb_notes", "somme", "somme_carres", "minimum", "maximum",
+    "nb_validees", "nb_a_rattraper", "nb_non_validees",
+)
+_cube = {"cellules": [], "version": None}
+_verrou_cube = threading.Lock()
+
+
+def requete_cube():
+    """Agrégats de toutes les cellules en une requête groupée sur les notes"""
+
+    def compter_statut(statut):
+        # Couples (étudiant, matière) distincts de la cellule ayant ce statut
+        return func.count(distinct(case((MoyenneCache.statut == statut, Note.etudiant_id))))
+
+    return (
+        select(
+            Etudiant.filiere_id,
+            Etudiant.specialite_id,
+            Matiere.semestre_id,
+            Matiere.id.label("matiere_id"),
+            func.count(Note.id).label("nb_notes"),
+            func.sum(Note.valeur).label("somme"),
+            func.sum(Note.valeur * Note.valeur).label("somme_carres"),
+            func.min(Note.valeur).label("minimum"),
+            func.max(Note.valeur).label("maximum"),
+            compter_statut("Validée").label("nb_validees"),
+            compter_statut("À rattraper").label("nb_a_rattraper"),
+            compter_statut("Non validée").label("nb_non_validees"),
+        )
+        .select_from(Note)
+        .join(Etudiant, Note.etudiant_id == Etudiant.id)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .join(Matiere, Devoir.matiere_id == Matiere.id)
+        .outerjoin(
+            MoyenneCache,
+            and_(MoyenneCache.etudiant_id == Note.etudiant_id, MoyenneCache.matiere_id == Matiere.id),
+        )
+        .group_by(Etudiant.filiere_id, Etudiant.specialite_id, Matiere.semestre_id, Matiere.id)
+    )
+
+
+def rafraichir_cube(db, matiere_ids=None):
+    """Recalcule les cellules (toutes, ou celles des matières données), sans commit."""
+    query = requete_cube()
+    suppression = delete(CelluleStatistique)
+    if matiere_ids is not None:
+        matiere_ids = [m for m in matiere_ids if m is not None]
+        query = query.where(Matiere.id.in_(matiere_ids))
+        suppression = suppression.where(CelluleStatistique.matiere_id.in_(matiere_ids))
+
+    db.flush()
+    maintenant = datetime.utcnow()
+    cellules = [dict(ligne._mapping, date_maj=maintenant) for ligne in db.execute(query)]
+    db.execute(suppression)
+    if cellules:
+        db.execute(insert(CelluleStatistique), cellules)
+
+
+def noter_cube(db, contexte):
+    devoirs, matieres, tout = set(), set(), False
+    for objet in (*db.new, *db.dirty, *db.deleted):
+        if isinstance(objet, Note):
+            devoirs.update(inspect(objet).attrs.devoir_id.history.sum())
+        elif isinstance(objet, Devoir):
+            matieres.update(inspect(objet).attrs.matiere_id.history.sum())
+        elif isinstance(objet, Matiere):
+            matieres.add(objet.id)
+        elif isinstance(objet, Etudiant) and objet not in db.new:
+            etat = inspect(objet)
+            tout = tout or objet in db.deleted or any(
+                etat.attrs[colonne].history.has_changes() for colonne in ("filiere_id", "specialite_id")
+            )
+    if not (devoirs or matieres or tout):
+        return
+    connexion = db.connection()
+    devoirs.discard(None)
+    if devoirs:
+        matieres.update(connexion.scalars(select(Devoir.matiere_id).where(Devoir.id.in_(devoirs))))
+    matieres.discard(None)
+    lignes = [{"matiere_id": None}] if tout else [{"matiere_id": m} for m in matieres]
+    if lignes:
+        connexion.execute(insert(CubeEnAttente), lignes)
+
+
+def cube_statistiques(db):
+    """Cellules du cube à jour (liste de dicts), servies depuis la mémoire
+
+    Les cellules des matières inscrites dans cube_en_attente sont recalculées
+    (commit) ; la copie en mémoire n'est relue que si la table a changé, y
+    compris du fait d'un autre processus.
+    """
+    with _verrou_cube:
+        en_attente = db.execute(select(CubeEnAttente.id, CubeEnAttente.matiere_id)).all()
+        # Notes ajoutées ou supprimées hors de l'ORM (SQL direct) : tout recalculer
+        nb_notes, nb_cube = db.execute(select(
+            select(func.count(Note.id)).scalar_subquery(),
+            select(func.coalesce(func.sum(CelluleStatistique.nb_notes), 0)).scalar_subquery(),
+        )).one()
+        if en_attente or nb_notes != nb_cube:
+            try:
+                matieres = {m for _, m in en_attente}
+                if en_attente:
+                    # Lignes réclamées avant le calcul : un autre worker qui les a
+                    # lues en même temps attend ce commit, puis n'en supprime aucune
+                    reclamees = db.execute(
+                        delete(CubeEnAttente).where(CubeEnAttente.id <= max(i for i, _ in en_attente))
+                    ).rowcount
+                    if not reclamees:
+                        matieres = set()
+                if nb_notes != nb_cube or None in matieres:
+                    rafraichir_cube(db)
+                elif matieres:
+                    rafraichir_cube(db, matieres)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+        version = tuple(db.execute(
+            select(func.count(CelluleStatistique.id), func.max(CelluleStatistique.date_maj))
+        ).one())
+        if version != _cube["version"]:
+            colonnes = [getattr(CelluleStatistique, nom) for nom in DIMENSIONS_CUBE + MESURES_CUBE]
+            _cube["cellules"] = [dict(ligne) for ligne in db.execute(select(*colonnes)).mappings()]
+            _cube["version"] = version
+        return _cube["cellules"]
+
+
+def consolider(cellules, par=(), **coupe):
+    """Consolide les cellules sur les dimensions par, après une coupe
+
+    coupe : valeurs imposées de dimensions (filiere_id=1, semestre_id=2...).
+    Retourne {tuple des valeurs de par: mesures}, mesures complétées de
+    moyenne et ecart_type (None sans note).
+    """
+    resultats = {}
+    for cellule in cellules:
+        if any(cellule[dimension] != valeur for dimension, valeur in coupe.items()):
+            continue
+        cle = tuple(cellule[dimension] for dimension in par)
+        cumul = resultats.get(cle)
+        if cumul is None:
+            resultats[cle] = {mesure: cellule[mesure] for mesure in MESURES_CUBE}
+            continue
+        for mesure in MESURES_CUBE:
+            if mesure == "minimum":
+                cumul[mesure] = min(cumul[mesure], cellule[mesure])
+            elif mesure == "maximum":
+                cumul[mesure] = max(cumul[mesure], cellule[mesure])
+            else:
+                cumul[mesure] += cellule[mesure]
+
+    for mesures in resultats.values():
+        nb = mesures["nb_notes"]
+        moyenne = mesures["somme"] / nb if nb else None
+        mesures["moyenne"] = moyenne
+        mesures["ecart_type"] = (
+            max(mesures["somme_carres"] / nb - moyenne * moyenne, 0.0) ** 0.5 if nb else None
+        )
+    return resultats
+
+
+# --------- Histogrammes des notes ----------
+
+# Répartition des notes par tranches calculée par la base : un CASE range
+# chaque note dans sa tranche et un GROUP BY compte, seules les tranches
+# remontent. Les résultats sont gardés par (portée, bornes) au plus
+# DUREE_HISTOGRAMMES secondes, et moins si la génération des compteurs
+# (incrémentée au commit d'une écriture sur les notes, devoirs, étudiants ou
+# matières dans ce processus) change : la durée borne le retard sur les
+# écritures des autres workers.
+BORNES_NOTES = (0, 5, 10, 15, 20)
+PORTEES_HISTOGRAMME = {
+    "devoir_id": Note.devoir_id,
+    "matiere_id": Devoir.matiere_id,
+    "filiere_id": Etudiant.filiere_id,
+    "specialite_id": Etudiant.specialite_id,
+    "session": Devoir.session,
+}
+TRANCHES_MAX = 100
+TAILLE_MAX_HISTOGRAMMES = 256
+DUREE_HISTOGRAMMES = 30  # secondes
+_histogrammes = {}
+
+
+def bornes_uniformes(largeur, minimum=0, maximum=20):
+    """Bornes de tranches de même largeur couvrant [minimum, maximum]"""
+    if largeur <= 0:
+        raise ValueError("La largeur des tranches doit être positive")
+    if (maximum - minimum) / largeur > TRANCHES_MAX:
+        raise ValueError(f"Au plus {TRANCHES_MAX} tranches")
+    bornes = [minimum]
+    while bornes[-1] < maximum:
+        bornes.append(min(bornes[-1] + largeur, maximum))
+    return tuple(bornes)
+
+
+def lire_portee(args):
+    """(portée, bornes) décrites par ?devoir_id=&matiere_id=&filiere_id=&specialite_id=&session=&largeur=|bornes="""
+    portee = {}
+    for parametre in PORTEES_HISTOGRAMME:
+        valeur = args.get(parametre)
+        if not valeur:
+            continue
+        if parametre != "session":
+            if not valeur.isdigit():
+                raise ValueError(f"Identifiant invalide : {valeur}")
+            valeur = int(valeur)
+        portee[parametre] = valeur
+    try:
+        if args.get("bornes"):
+            bornes = tuple(sorted({float(b) for b in args["bornes"].split(",")}))
+            if not 2 <= len(bornes) <= TRANCHES_MAX + 1:
+                raise ValueError(f"Il faut entre 2 et {TRANCHES_MAX + 1} bornes")
+        elif args.get("largeur"):
+            bornes = bornes_uniformes(float(args["largeur"]))
+        else:
+            bornes = BORNES_NOTES
+    except ValueError as e:
+        raise ValueError(f"Tranches invalides : {e}")
+    if not all(math.isfinite(borne) for borne in bornes):
+        raise ValueError("Tranches invalides : bornes non finies")
+    return portee, bornes
+
+
+def _libelle(valeur):
+    return f"{valeur:g}"
+
+
+def calculer_histogramme(db, portee, bornes=BORNES_NOTES):
+    """Nombre de notes par tranche en une requête groupée
+
+    Tranche i : bornes[i] <= valeur < bornes[i + 1] ; la dernière inclut sa
+    borne haute, les valeurs hors bornes vont dans la tranche la plus proche.
+    """
+    if len(bornes) == 2:
+        tranche = literal(0)  # CASE sans WHEN est refusé par SQLite
+    else:
+        tranche = case(
+            *[(Note.valeur < borne, i) for i, borne in enumerate(bornes[1:-1])],
+            else_=len(bornes) - 2,
+        )
+    query = (
+        select(tranche.label("tranche"), func.count(Note.id))
+        .select_from(Note)
+        .join(Devoir, Note.devoir_id == Devoir.id)
+        .group_by(tranche)
+    )
+    if "filiere_id" in portee or "specialite_id" in portee:
+        query = query.join(Etudiant, Note.etudiant_id == Etudiant.id)
+    for parametre, valeur in portee.items():
+        query = query.where(PORTEES_HISTOGRAMME[parametre] == valeur)
+
+    nombres = dict(db.execute(query).all())
+    return [
+        {
+            "tranche": f"{_libelle(bas)}-{_libelle(haut)}",
+            "min": bas,
+            "max": haut,
+            "nombre": nombres.get(i, 0),
+        }
+        for i, (bas, haut) in enumerate(zip(bornes, bornes[1:]))
+    ]
+
+
+def histogramme(db, portee, bornes=BORNES_NOTES):
+    """Histogramme de la portée, depuis le cache s'il est encore valable"""
+    cle = (tuple(sorted(portee.items())), tuple(bornes))
+    generation = _compteurs["generation"]
+    maintenant = time.monotonic()
+    entree = _histogrammes.get(cle)
+    if entree is not None and entree[0] == generation and entree[1] > maintenant:
+        return entree[2]
+    valeur = calculer_histogramme(db, portee, bornes)
+    if len(_histogrammes) >= TAILLE_MAX_HISTOGRAMMES:
+        _histogrammes.clear()
+    _histogrammes[cle] = (generation, maintenant + DUREE_HISTOGRAMMES, valeur)
+    return valeur
+
+
 def create_app():
     app = Flask(__name__)
     app.config["SECRET_KEY"] = "change-this-secret-key"
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///student_grades.db"
+    app.config["EXPORT_FOLDER"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports")
+    app.config["EXPORT_WORKERS"] = 2
+    os.makedirs(app.config["EXPORT_FOLDER"], exist_ok=True)
 
-    engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"], echo=False, future=True)
+    app.config["DB_PROFIL"] = os.environ.get("DB_PROFIL")
+
+    engine = creer_moteur(app.config["SQLALCHEMY_DATABASE_URI"], app.config["DB_PROFIL"])
     Base.metadata.create_all(engine)
+    installer_compression(app)
 
     # Seed : données initiales si la base est vide
     with engine.connect() as conn:
@@ -145,7 +1421,8 @@ def create_app():
         
         # Vérifier si les données existent déjà
         r = conn.execute(text("SELECT COUNT(*) FROM utilisateur")).scalar()
-        if r == 0:
+        base_neuve = r == 0
+        if base_neuve:
             # Créer admin
             conn.execute(text(
                 "INSERT INTO utilisateur (nom, email, mot_de_passe, role) VALUES "
@@ -274,6 +1551,38 @@ def create_app():
             conn.commit()
 
     SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
+    # Suivi des écritures limité aux sessions de cette application
+    event.listen(SessionLocal, "after_flush", suivre_catalogue)
+    event.listen(SessionLocal, "after_flush", suivre_notes)
+    event.listen(SessionLocal, "after_flush", noter_compteurs)
+    event.listen(SessionLocal, "after_commit", invalider_compteurs)
+    event.listen(SessionLocal, "after_flush", noter_cube)
+
+    # Cache des moyennes : construit au premier démarrage sur une base existante
+    db = SessionLocal()
+    if db.query(GenerationCatalogue.id).first() is None:
+        db.add(GenerationCatalogue(id=1, valeur=0))
+        db.commit()
+    if db.query(GenerationNotes.id).first() is None:
+        db.add(GenerationNotes(id=1, valeur=0))
+        db.commit()
+    if base_neuve:
+        migrer_identifiants(db, processus=1)
+    if db.query(MoyenneCache.id).first() is None and db.query(Note.id).first() is not None:
+        reconstruire_cache_moyennes(db)
+        db.commit()
+    if db.query(CelluleStatistique.id).first() is None and db.query(Note.id).first() is not None:
+        rafraichir_cube(db)
+        db.commit()
+
+    # Jobs d'export interrompus par un arrêt du serveur
+    db.query(ExportJob).filter(ExportJob.statut.in_(("en_attente", "en_cours"))).update(
+        {"statut": "erreur", "erreur": "Interrompu par un redémarrage du serveur."},
+        synchronize_session=False,
+    )
+    db.commit()
+    SessionLocal.remove()
+    exports_pool = {}
 
     def get_db():
         db = SessionLocal()
@@ -331,33 +1640,22 @@ def create_app():
             email = request.form.get("email", "").strip().lower()
             mot_de_passe = request.form.get("mot_de_passe", "").strip()
 
-            # Chercher d'abord dans les utilisateurs (admin/enseignant)
-            user = (
-                db.query(Utilisateur)
-                .filter(Utilisateur.email == email, Utilisateur.mot_de_passe == mot_de_passe)
-                .first()
-            )
-            if user:
-                session["user_id"] = user.id
-                session["role"] = user.role
-                session["type"] = "utilisateur"
-                session["nom"] = user.nom
+            # Une lecture indexée sur l'email résout le type de compte et le rôle
+            compte = resoudre_identifiant(db, email)
+            if compte and not check_password_hash(compte.mot_de_passe_hash, mot_de_passe):
+                compte = None
+            if compte is None and anciens_identifiants_restants(db):
+                compte = connexion_ancienne(db, email, mot_de_passe)
+
+            if compte:
+                type_compte, compte_id, role, _, nom = compte
+                session["user_id"] = compte_id
+                session["role"] = role
+                session["type"] = type_compte
+                session["nom"] = nom
                 flash("Connexion réussie.", "success")
-                if user.role in ("admin", "enseignant"):
+                if role in ("admin", "enseignant"):
                     return redirect(url_for("admin_dashboard"))
-
-            # Sinon, chercher dans les étudiants
-            etu = (
-                db.query(Etudiant)
-                .filter(Etudiant.email == email, Etudiant.mot_de_passe == mot_de_passe)
-                .first()
-            )
-            if etu:
-                session["user_id"] = etu.id
-                session["role"] = "etudiant"
-                session["type"] = "etudiant"
-                session["nom"] = etu.nom
-                flash("Connexion réussie.", "success")
                 return redirect(url_for("student_dashboard"))
 
             flash("Identifiants invalides.", "danger")
@@ -376,12 +1674,11 @@ def create_app():
     @login_required(role=("admin", "enseignant"))
     def admin_dashboard():
         db = get_db()
-        total_matieres = db.query(Matiere).count()
-        total_devoirs = db.query(Devoir).count()
-        total_etudiants = db.query(Etudiant).count()
-
-        moyenne_generale = db.query(func.avg(Note.valeur)).scalar()
-        moyenne_generale = round(moyenne_generale, 2) if moyenne_generale is not None else None
+        compteurs = compteurs_tableau_bord(db)
+        total_matieres = compteurs["matieres"]
+        total_devoirs = compteurs["devoirs"]
+        total_etudiants = compteurs["etudiants"]
+        moyenne_generale = compteurs["moyenne_generale"]
 
         # Statistiques par filière
         etudiants_par_filiere = (
@@ -400,18 +1697,10 @@ def create_app():
         )
 
         # Répartition des notes
-        all_notes = db.query(Note.valeur).all()
-        ranges = {"0-5": 0, "5-10": 0, "10-15": 0, "15-20": 0}
-        for (v,) in all_notes:
-            if v < 5:
-                ranges["0-5"] += 1
-            elif v < 10:
-                ranges["5-10"] += 1
-            elif v < 15:
-                ranges["10-15"] += 1
-            else:
-                ranges["15-20"] += 1
-        repartition_notes = [type("Row", (), {"range": k, "count": v})() for k, v in ranges.items() if v > 0]
+        repartition_notes = [
+            type("Row", (), {"range": t["tranche"], "count": t["nombre"]})()
+            for t in histogramme(db, {}) if t["nombre"] > 0
+        ]
 
         # Moyenne par matière
         matieres_difficiles = (
@@ -442,6 +1731,11 @@ def create_app():
 
     # --------- CRUD Matières ----------
 
+    @app.route("/admin/pool")
+    @login_required(role=("admin",))
+    def admin_pool():
+        return jsonify(statistiques_pool(engine))
+
     @app.route("/admin/matieres")
     @login_required(role=("admin", "enseignant"))
     def admin_matieres():
@@ -508,6 +1802,7 @@ def create_app():
             matiere.specialite_id = int(specialite_id) if specialite_id else None
             matiere.seuil_validation = float(request.form.get("seuil_validation") or 10)
             matiere.rattrapable = 1 if request.form.get("rattrapable") == "on" else 0
+            reconstruire_cache_moyennes(db, matiere_ids=[matiere.id])
             db.commit()
             flash("Matière mise à jour.", "success")
             return redirect(url_for("admin_matieres"))
@@ -601,7 +1896,10 @@ def create_app():
             devoir.date = date.fromisoformat(date_str)
             devoir.type = request.form.get("type", "Écrit")
             devoir.session = request.form.get("session", "Normale")
+            ancienne_matiere_id = devoir.matiere_id
             devoir.matiere_id = int(request.form.get("matiere_id"))
+            if devoir.matiere_id != ancienne_matiere_id:
+                reconstruire_cache_moyennes(db, matiere_ids=[ancienne_matiere_id, devoir.matiere_id])
             db.commit()
             flash("Devoir mis à jour.", "success")
             return redirect(url_for("admin_devoirs"))
@@ -619,6 +1917,7 @@ def create_app():
         devoir = db.get(Devoir, devoir_id)
         if devoir:
             db.delete(devoir)
+            reconstruire_cache_moyennes(db, matiere_ids=[devoir.matiere_id])
             db.commit()
             flash("Devoir supprimé.", "info")
         return redirect(url_for("admin_devoirs"))
@@ -629,14 +1928,11 @@ def create_app():
     @login_required(role=("admin", "enseignant"))
     def admin_notes():
         db = get_db()
-        notes = (
-            db.query(Note)
-            .join(Etudiant, Note.etudiant_id == Etudiant.id)
-            .join(Devoir, Note.devoir_id == Devoir.id)
-            .join(Matiere, Devoir.matiere_id == Matiere.id)
-            .order_by(Etudiant.nom)
-            .all()
-        )
+        try:
+            notes, suivant, precedent = page_notes(db, request.args)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("admin_notes"))
         etudiants = db.query(Etudiant).order_by(Etudiant.nom).all()
         devoirs = (
             db.query(Devoir)
@@ -647,11 +1943,22 @@ def create_app():
         return render_template(
             "admin/notes.html",
             notes=notes,
+            suivant=suivant,
+            precedent=precedent,
             etudiants=etudiants,
             devoirs=devoirs,
             user=current_user(),
         )
 
+    @app.route("/admin/api/notes")
+    @login_required(role=("admin", "enseignant"))
+    def admin_api_notes():
+        try:
+            notes, suivant, precedent = page_notes(get_db(), request.args)
+        except ValueError as e:
+            return jsonify({"erreur": str(e)}), 400
+        return jsonify({"items": notes, "suivant": suivant, "precedent": precedent})
+
     @app.route("/admin/notes/nouveau", methods=["POST"])
     @login_required(role=("admin", "enseignant"))
     def admin_note_new():
@@ -665,11 +1972,14 @@ def create_app():
             .filter(Note.etudiant_id == etudiant_id, Note.devoir_id == devoir_id)
             .first()
         )
+        matiere_id = db.query(Devoir.matiere_id).filter(Devoir.id == devoir_id).scalar()
         if note:
+            maj_cache_moyenne(db, etudiant_id, matiere_id, note.valeur, -1)
             note.valeur = valeur
         else:
             note = Note(etudiant_id=etudiant_id, devoir_id=devoir_id, valeur=valeur)
             db.add(note)
+        maj_cache_moyenne(db, etudiant_id, matiere_id, valeur)
         db.commit()
         flash("Note enregistrée.", "success")
         return redirect(url_for("admin_notes"))
@@ -680,6 +1990,7 @@ def create_app():
         db = get_db()
         note = db.get(Note, note_id)
         if note:
+            maj_cache_moyenne(db, note.etudiant_id, note.devoir.matiere_id, note.valeur, -1)
             db.delete(note)
             db.commit()
             flash("Note supprimée.", "info")
@@ -827,23 +2138,34 @@ def create_app():
             if role == "etudiant":
                 filiere_id = request.form.get("filiere_id") or None
                 specialite_id = request.form.get("specialite_id") or None
-                etu = Etudiant(
+                compte = Etudiant(
                     nom=nom,
                     email=email,
-                    mot_de_passe=mot_de_passe,
+                    mot_de_passe=MOT_DE_PASSE_MIGRE,
                     filiere_id=int(filiere_id) if filiere_id else None,
                     specialite_id=int(specialite_id) if specialite_id else None
                 )
-                db.add(etu)
             else:
-                user = Utilisateur(
+                compte = Utilisateur(
                     nom=nom,
                     email=email,
-                    mot_de_passe=mot_de_passe,
+                    mot_de_passe=MOT_DE_PASSE_MIGRE,
                     role=role,
                 )
-                db.add(user)
-            db.commit()
+            try:
+                db.add(compte)
+                db.flush()
+                creer_identifiant(
+                    db,
+                    "etudiant" if role == "etudiant" else "utilisateur",
+                    compte,
+                    generate_password_hash(mot_de_passe),
+                )
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                flash("Cet email est déjà utilisé.", "danger")
+                return redirect(url_for("admin_utilisateur_new"))
             flash("Utilisateur créé.", "success")
             return redirect(url_for("admin_utilisateurs"))
         filieres = db.query(Filiere).order_by(Filiere.nom).all()
@@ -865,6 +2187,10 @@ def create_app():
         else:
             obj = db.get(Utilisateur, user_id)
         if obj:
+            db.query(Identifiant).filter(
+                Identifiant.type_compte == ("etudiant" if type == "etudiant" else "utilisateur"),
+                Identifiant.compte_id == obj.id,
+            ).delete(synchronize_session=False)
             db.delete(obj)
             db.commit()
             flash("Utilisateur supprimé.", "info")
@@ -883,346 +2209,265 @@ def create_app():
             .group_by(Etudiant.id)
             .all()
         )
-        moyenne_generale = db.query(func.avg(Note.valeur)).scalar()
-        moyenne_generale = round(moyenne_generale, 2) if moyenne_generale else None
-
-        # Statut des matières par nombre
+        cellules = cube_statistiques(db)
+        total = consolider(cellules).get(())
+        moyenne_generale = round(total["moyenne"], 2) if total else None
+
+        def arrondir(mesures):
+            return {
+                cle: round(valeur, 2) if isinstance(valeur, float) else valeur
+                for cle, valeur in mesures.items()
+            }
+
+        # Statut des matières d'après leur moyenne
+        par_matiere = consolider(cellules, ("matiere_id",))
+        matieres = db.query(Matiere).order_by(Matiere.nom).all()
         stats_matieres = []
-        matieres = db.query(Matiere).all()
         for m in matieres:
-            moyenne_matiere = (
-                db.query(func.avg(Note.valeur))
-                .join(Devoir, Note.devoir_id == Devoir.id)
-                .filter(Devoir.matiere_id == m.id)
-                .scalar()
-            )
-            if moyenne_matiere is None:
-                statut = "Non notée"
-            elif moyenne_matiere >= m.seuil_validation:
-                statut = "Validée"
-            elif m.rattrapable:
-                statut = "À rattraper"
-            else:
-                statut = "Non validée"
+            mesures = par_matiere.get((m.id,))
+            moyenne_matiere = mesures["moyenne"] if mesures else None
             stats_matieres.append(
                 {
                     "nom": m.nom,
                     "moyenne": round(moyenne_matiere, 2) if moyenne_matiere is not None else None,
-                    "statut": statut,
+                    "statut": statut_matiere(moyenne_matiere, m),
+                    "mesures": arrondir(mesures) if mesures else None,
                 }
             )
+        matieres_difficiles = sorted(
+            (s for s in stats_matieres if s["moyenne"] is not None), key=lambda s: s["moyenne"]
+        )[:5]
+
+        def par_dimension(dimension, noms, defaut):
+            lignes = [
+                dict(arrondir(mesures), nom=noms.get(cle[0], defaut))
+                for cle, mesures in consolider(cellules, (dimension,)).items()
+            ]
+            return sorted(lignes, key=lambda ligne: ligne["nom"])
+
+        filieres = db.query(Filiere).order_by(Filiere.nom).all()
+        specialites = db.query(Specialite).order_by(Specialite.code).all()
+        stats_filieres = par_dimension("filiere_id", {f.id: f.nom for f in filieres}, "Sans filière")
+        stats_specialites = par_dimension(
+            "specialite_id", {sp.id: sp.code for sp in specialites}, "Sans spécialité"
+        )
+
+        try:
+            portee, bornes = lire_portee(request.args)
+        except ValueError as e:
+            flash(str(e), "danger")
+            portee, bornes = {}, BORNES_NOTES
+        repartition = histogramme(db, portee, bornes)
 
         return render_template(
             "admin/statistiques.html",
             moyenne_par_etudiant=moyenne_par_etudiant,
             moyenne_generale=moyenne_generale,
             stats_matieres=stats_matieres,
+            matieres_difficiles=matieres_difficiles,
+            stats_filieres=stats_filieres,
+            stats_specialites=stats_specialites,
+            repartition=repartition,
+            portee=portee,
+            filieres=filieres,
+            specialites=specialites,
+            matieres=matieres,
             user=current_user(),
         )
 
+    @app.route("/admin/api/histogramme")
+    @login_required(role=("admin", "enseignant"))
+    def admin_api_histogramme():
+        try:
+            portee, bornes = lire_portee(request.args)
+        except ValueError as e:
+            return jsonify({"erreur": str(e)}), 400
+        tranches = histogramme(get_db(), portee, bornes)
+        return jsonify({
+            "portee": portee,
+            "bornes": list(bornes),
+            "total": sum(t["nombre"] for t in tranches),
+            "tranches": tranches,
+        })
+
     # Export CSV/Excel
     @app.route("/admin/export/csv")
     @login_required(role=("admin", "enseignant"))
     def admin_export_csv():
-        import csv
-        from io import StringIO
-        from flask import Response
+        from flask import Response, stream_with_context
 
-        db = get_db()
-        output = StringIO()
-        writer = csv.writer(output, delimiter=";")
-        writer.writerow(["Etudiant", "Matière", "Devoir", "Note"])
-        rows = (
-            db.query(Etudiant.nom, Matiere.nom, Devoir.nom, Note.valeur)
-            .join(Note, Note.etudiant_id == Etudiant.id)
-            .join(Devoir, Note.devoir_id == Devoir.id)
-            .join(Matiere, Devoir.matiere_id == Matiere.id)
-            .all()
-        )
-        for r in rows:
-            writer.writerow(r)
-        output.seek(0)
-        return Response(
-            output.read(),
-            mimetype="text/csv",
-            headers={"Content-Disposition": "attachment;filename=notes.csv"},
-        )
+        filiere_id = request.args.get("filiere_id", type=int)
+        semestre_id = request.args.get("semestre_id", type=int)
+        session_devoir = request.args.get("session") or None
+        compresser = request.args.get("gzip") == "1"
+
+        def lignes():
+            db = get_db()
+            query = (
+                db.query(Etudiant.nom, Matiere.nom, Devoir.nom, Note.valeur)
+                .join(Note, Note.etudiant_id == Etudiant.id)
+                .join(Devoir, Note.devoir_id == Devoir.id)
+                .join(Matiere, Devoir.matiere_id == Matiere.id)
+            )
+            if filiere_id:
+                query = query.filter(Etudiant.filiere_id == filiere_id)
+            if semestre_id:
+                query = query.filter(Matiere.semestre_id == semestre_id)
+            if session_devoir:
+                query = query.filter(Devoir.session == session_devoir)
+            yield from query.yield_per(TAILLE_LOT_EXPORT)
+
+        flux = flux_csv(["Etudiant", "Matière", "Devoir", "Note"], lignes())
+        headers = {"Content-Disposition": "attachment;filename=notes.csv"}
+        mimetype = "text/csv"
+        if compresser:
+            flux = flux_gzip(flux)
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                headers["Vary"] = "Accept-Encoding"
+            else:
+                headers["Content-Disposition"] = "attachment;filename=notes.csv.gz"
+                mimetype = "application/gzip"
+
+        return Response(stream_with_context(flux), mimetype=mimetype, headers=headers)
 
     @app.route("/admin/export/excel")
     @login_required(role=("admin", "enseignant"))
     def admin_export_excel():
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from flask import Response
-        from io import BytesIO
-
-        db = get_db()
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Notes"
-
-        # En-têtes
-        headers = ["Étudiant", "Filière", "Spécialité", "Matière", "Semestre", "Devoir", "Type", "Date", "Note"]
-        ws.append(headers)
-        
-        # Style des en-têtes
-        for cell in ws[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="4A90E2", end_color="4A90E2", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center")
-
-        # Données
-        rows = (
-            db.query(
-                Etudiant.nom,
-                Filiere.nom,
-                Specialite.code,
-                Matiere.nom,
-                Semestre.nom,
-                Devoir.nom,
-                Devoir.type,
-                Devoir.date,
-                Note.valeur
-            )
-            .join(Note, Note.etudiant_id == Etudiant.id)
-            .join(Devoir, Note.devoir_id == Devoir.id)
-            .join(Matiere, Devoir.matiere_id == Matiere.id)
-            .outerjoin(Filiere, Etudiant.filiere_id == Filiere.id)
-            .outerjoin(Specialite, Etudiant.specialite_id == Specialite.id)
-            .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
-            .order_by(Etudiant.nom, Matiere.nom)
-            .all()
-        )
-        for r in rows:
-            ws.append([
-                r[0],  # Étudiant
-                r[1] or "-",  # Filière
-                r[2] or "-",  # Spécialité
-                r[3],  # Matière
-                r[4] or "-",  # Semestre
-                r[5],  # Devoir
-                r[6],  # Type
-                r[7].strftime("%d/%m/%Y") if r[7] else "-",  # Date
-                r[8]  # Note
-            ])
-
-        # Ajuster la largeur des colonnes
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return Response(
-            output.read(),
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": "attachment;filename=notes_completes.xlsx"},
-        )
+        return reponse_export(get_db(), "notes")
 
     @app.route("/admin/export/excel/filiere/<int:filiere_id>")
     @login_required(role=("admin", "enseignant"))
     def admin_export_excel_filiere(filiere_id):
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from flask import Response
-        from io import BytesIO
-
         db = get_db()
-        filiere = db.get(Filiere, filiere_id)
-        if not filiere:
+        if not db.get(Filiere, filiere_id):
             flash("Filière introuvable.", "danger")
             return redirect(url_for("admin_statistiques"))
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = f"Notes {filiere.nom}"
-
-        # En-têtes
-        headers = ["Étudiant", "Spécialité", "Matière", "Semestre", "Devoir", "Type", "Date", "Note"]
-        ws.append(headers)
-        
-        # Style
-        for cell in ws[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="4A90E2", end_color="4A90E2", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center")
-
-        # Données filtrées par filière
-        rows = (
-            db.query(
-                Etudiant.nom,
-                Specialite.code,
-                Matiere.nom,
-                Semestre.nom,
-                Devoir.nom,
-                Devoir.type,
-                Devoir.date,
-                Note.valeur
-            )
-            .join(Note, Note.etudiant_id == Etudiant.id)
-            .join(Devoir, Note.devoir_id == Devoir.id)
-            .join(Matiere, Devoir.matiere_id == Matiere.id)
-            .filter(Etudiant.filiere_id == filiere_id)
-            .outerjoin(Specialite, Etudiant.specialite_id == Specialite.id)
-            .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
-            .order_by(Etudiant.nom, Matiere.nom)
-            .all()
-        )
-        for r in rows:
-            ws.append([
-                r[0], r[1] or "-", r[2], r[3] or "-", r[4], r[5],
-                r[6].strftime("%d/%m/%Y") if r[6] else "-", r[7]
-            ])
-
-        # Ajuster largeur
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return Response(
-            output.read(),
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment;filename=notes_{filiere.nom}.xlsx"},
-        )
+        return reponse_export(db, "filiere", filiere_id=filiere_id)
 
     @app.route("/admin/export/excel/etudiant/<int:etudiant_id>")
     @login_required(role=("admin", "enseignant"))
     def admin_export_excel_etudiant(etudiant_id):
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from flask import Response
-        from io import BytesIO
-
         db = get_db()
-        etudiant = db.get(Etudiant, etudiant_id)
-        if not etudiant:
+        if not db.get(Etudiant, etudiant_id):
             flash("Étudiant introuvable.", "danger")
             return redirect(url_for("admin_utilisateurs"))
+        return reponse_export(db, "etudiant", etudiant_id=etudiant_id)
 
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Relevé de notes"
+    # --------- Exports en arrière-plan ----------
 
-        # En-têtes
-        ws.append([f"Relevé de notes - {etudiant.nom}"])
-        ws.append([f"Filière: {etudiant.filiere.nom if etudiant.filiere else '-'}"])
-        ws.append([f"Spécialité: {etudiant.specialite.nom if etudiant.specialite else '-'}"])
-        ws.append([])
-        
-        headers = ["Matière", "Semestre", "Devoir", "Type", "Date", "Note"]
-        ws.append(headers)
-        
-        # Style
-        for cell in ws[5]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="4A90E2", end_color="4A90E2", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center")
-
-        # Données
-        rows = (
-            db.query(
-                Matiere.nom,
-                Semestre.nom,
-                Devoir.nom,
-                Devoir.type,
-                Devoir.date,
-                Note.valeur
-            )
-            .join(Note, Note.devoir_id == Devoir.id)
-            .join(Devoir, Note.devoir_id == Devoir.id)
-            .join(Matiere, Devoir.matiere_id == Matiere.id)
-            .filter(Note.etudiant_id == etudiant_id)
-            .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
-            .order_by(Matiere.nom, Devoir.date)
-            .all()
-        )
-        for r in rows:
-            ws.append([
-                r[0], r[1] or "-", r[2], r[3],
-                r[4].strftime("%d/%m/%Y") if r[4] else "-", r[5]
-            ])
-
-        # Ajuster largeur
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return Response(
-            output.read(),
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment;filename=releve_{etudiant.nom.replace(' ', '_')}.xlsx"},
+    def soumettre_export(job_id):
+        if "pool" not in exports_pool:
+            exports_pool["pool"] = ProcessPoolExecutor(max_workers=app.config["EXPORT_WORKERS"])
+        future = exports_pool["pool"].submit(
+            executer_export, job_id, app.config["SQLALCHEMY_DATABASE_URI"], app.config["EXPORT_FOLDER"]
         )
+        future.add_done_callback(partial(signaler_echec_export, job_id))
+
+    def signaler_echec_export(job_id, future):
+        # Processus du pool tué ou pool arrêté : le job ne doit pas rester en cours
+        if future.cancelled() or future.exception() is None:
+            return
+        db = SessionLocal.session_factory()
+        try:
+            job = db.get(ExportJob, job_id)
+            if job and job.statut in ("en_attente", "en_cours"):
+                job.statut = "erreur"
+                job.erreur = str(future.exception())
+                job.date_fin = datetime.utcnow()
+                db.commit()
+        finally:
+            db.close()
+
+    def job_json(job):
+        return {
+            "id": job.id,
+            "type": job.type,
+            "parametres": json.loads(job.parametres),
+            "statut": job.statut,
+            "erreur": job.erreur,
+            "date_creation": job.date_creation.isoformat() if job.date_creation else None,
+            "date_fin": job.date_fin.isoformat() if job.date_fin else None,
+            "statut_url": url_for("export_job_statut", job_id=job.id),
+            "telechargement_url": (
+                url_for("export_job_telecharger", job_id=job.id) if job.statut == "termine" else None
+            ),
+        }
+
+    def lancer_export(type_export, parametres):
+        db = get_db()
+        job, a_soumettre = demander_export(db, type_export, parametres)
+        if a_soumettre:
+            soumettre_export(job.id)
+        return jsonify(job_json(job)), 200 if job.statut == "termine" else 202
+
+    def acces_export(job):
+        user = current_user()
+        if user["role"] in ("admin", "enseignant"):
+            return True
+        return job.type == "releve" and json.loads(job.parametres).get("etudiant_id") == user["id"]
+
+    @app.route("/admin/exports", methods=["POST"])
+    @login_required(role=("admin", "enseignant"))
+    def admin_export_job():
+        db = get_db()
+        type_export = request.form.get("type", "notes")
+        if type_export == "notes":
+            parametres = {}
+        elif type_export == "filiere":
+            filiere_id = request.form.get("filiere_id", type=int)
+            if not filiere_id or not db.get(Filiere, filiere_id):
+                return jsonify({"erreur": "Filière introuvable."}), 404
+            parametres = {"filiere_id": filiere_id}
+        elif type_export == "etudiant":
+            etudiant_id = request.form.get("etudiant_id", type=int)
+            if not etudiant_id or not db.get(Etudiant, etudiant_id):
+                return jsonify({"erreur": "Étudiant introuvable."}), 404
+            parametres = {"etudiant_id": etudiant_id}
+        else:
+            return jsonify({"erreur": f"Type d'export inconnu : {type_export}"}), 400
+        return lancer_export(type_export, parametres)
+
+    @app.route("/etudiant/exports", methods=["POST"])
+    @login_required(role=("etudiant",))
+    def student_export_job():
+        semestre_id = request.form.get("semestre_id", type=int)
+        return lancer_export("releve", {"etudiant_id": current_user()["id"], "semestre_id": semestre_id})
+
+    @app.route("/exports/<int:job_id>")
+    @login_required(role=("admin", "enseignant", "etudiant"))
+    def export_job_statut(job_id):
+        job = get_db().get(ExportJob, job_id)
+        if not job or not acces_export(job):
+            return jsonify({"erreur": "Export introuvable."}), 404
+        return jsonify(job_json(job))
+
+    @app.route("/exports/<int:job_id>/telecharger")
+    @login_required(role=("admin", "enseignant", "etudiant"))
+    def export_job_telecharger(job_id):
+        from flask import send_file
+
+        job = get_db().get(ExportJob, job_id)
+        if not job or not acces_export(job):
+            return jsonify({"erreur": "Export introuvable."}), 404
+        if job.statut != "termine" or not job.fichier or not os.path.exists(job.fichier):
+            return jsonify(job_json(job)), 409
+        return send_file(job.fichier, mimetype=MIME_XLSX, as_attachment=True, download_name=job.nom_fichier)
 
     # --------- Interface Étudiant ----------
 
     def calcul_moyennes_etudiant(db, etudiant_id):
-        matieres = db.query(Matiere).all()
-        resultats = []
-        for m in matieres:
-            moyenne = (
-                db.query(func.avg(Note.valeur))
-                .join(Devoir, Note.devoir_id == Devoir.id)
-                .filter(Devoir.matiere_id == m.id, Note.etudiant_id == etudiant_id)
-                .scalar()
-            )
-            if moyenne is None:
-                statut = "Non notée"
-            elif moyenne >= m.seuil_validation:
-                statut = "Validée"
-            elif m.rattrapable:
-                statut = "À rattraper"
-            else:
-                statut = "Non validée"
-            resultats.append(
-                {
-                    "matiere": m,
-                    "moyenne": round(moyenne, 2) if moyenne is not None else None,
-                    "statut": statut,
-                }
-            )
-        # Moyenne générale
-        moyenne_generale = (
-            db.query(func.avg(Note.valeur)).filter(Note.etudiant_id == etudiant_id).scalar()
-        )
-        moyenne_generale = round(moyenne_generale, 2) if moyenne_generale else None
-        return resultats, moyenne_generale
+        return moyennes_etudiants(db, [etudiant_id]).get(etudiant_id, ([], None))
+
+    def version_pages_etudiant():
+        user = current_user()
+        if not user or user["role"] != "etudiant":
+            return None
+        return version_etudiant(get_db())
 
     @app.route("/etudiant/dashboard")
     @login_required(role=("etudiant",))
+    @conditionnel(version_pages_etudiant)
     def student_dashboard():
         db = get_db()
         user = current_user()
@@ -1287,6 +2532,7 @@ def create_app():
 
     @app.route("/etudiant/resultats")
     @login_required(role=("etudiant",))
+    @conditionnel(version_pages_etudiant)
     def student_resultats():
         db = get_db()
         user = current_user()
@@ -1316,97 +2562,41 @@ def create_app():
     @app.route("/etudiant/export/excel")
     @login_required(role=("etudiant",))
     def student_export_excel():
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from flask import Response
-        from io import BytesIO
+        return reponse_export(
+            get_db(),
+            "releve",
+            etudiant_id=current_user()["id"],
+            semestre_id=request.args.get("semestre_id", type=int),
+        )
 
-        db = get_db()
-        user = current_user()
-        etudiant = db.get(Etudiant, user["id"])
-        
-        # Récupérer le semestre filtré
-        semestre_id = request.args.get("semestre_id", type=int)
-        
-        wb = Workbook()
-        ws = wb.active
-        
-        if semestre_id:
-            semestre = db.get(Semestre, semestre_id)
-            ws.title = f"Notes {semestre.nom if semestre else 'Semestre'}"
-            titre_semestre = f" - {semestre.nom}" if semestre else ""
-        else:
-            ws.title = "Mes notes"
-            titre_semestre = ""
-
-        # Informations étudiant
-        ws.append([f"Relevé de notes{titre_semestre} - {etudiant.nom}"])
-        ws.append([f"Filière: {etudiant.filiere.nom if etudiant.filiere else '-'}"])
-        ws.append([f"Spécialité: {etudiant.specialite.nom if etudiant.specialite else '-'}"])
-        ws.append([])
-        
-        headers = ["Matière", "Code", "Semestre", "Devoir", "Type", "Date", "Note"]
-        ws.append(headers)
-        
-        # Style
-        for cell in ws[5]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="4A90E2", end_color="4A90E2", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center")
+    # --------- Commandes ----------
 
-        # Données filtrées
-        query = (
-            db.query(
-                Matiere.nom,
-                Matiere.code,
-                Semestre.nom,
-                Devoir.nom,
-                Devoir.type,
-                Devoir.date,
-                Note.valeur
+    @app.cli.command("migrer-identifiants")
+    @click.option("--lot", default=TAILLE_LOT_IDENTIFIANTS, show_default=True, help="Comptes par transaction")
+    @click.option("--processus", type=int, default=None, help="Processus de hachage (défaut : nombre de CPU)")
+    def migrer_identifiants_commande(lot, processus):
+        """Hache les mots de passe en clair, par lots, sans arrêter l'application"""
+        db = SessionLocal()
+        try:
+            rapport = migrer_identifiants(
+                db, lot, processus, journal=lambda type_compte, n: click.echo(f"{type_compte} : {n} comptes migrés...")
             )
-            .select_from(Note)
-            .join(Devoir, Note.devoir_id == Devoir.id)
-            .join(Matiere, Devoir.matiere_id == Matiere.id)
-            .outerjoin(Semestre, Matiere.semestre_id == Semestre.id)
-            .filter(Note.etudiant_id == user["id"])
-        )
-        
-        if semestre_id:
-            query = query.filter(Matiere.semestre_id == semestre_id)
-            
-        rows = query.order_by(Matiere.nom, Devoir.date).all()
-        
-        for r in rows:
-            ws.append([
-                r[0], r[1], r[2] or "-", r[3], r[4],
-                r[5].strftime("%d/%m/%Y") if r[5] else "-", r[6]
-            ])
-
-        # Ajuster largeur
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        filename = f"notes_{semestre.nom if semestre_id and semestre else 'completes'}_{etudiant.nom.replace(' ', '_')}.xlsx"
-        
-        return Response(
-            output.read(),
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment;filename={filename}"},
-        )
+        finally:
+            db.close()
+        click.echo(f"{rapport['migres']} comptes migrés.")
+        for email in rapport["conflits"]:
+            click.echo(f"Email en double, compte laissé à l'ancienne connexion : {email}", err=True)
+
+    @app.cli.command("reconstruire-statistiques")
+    def reconstruire_statistiques_commande():
+        """Recalcule toutes les cellules du cube de statistiques"""
+        db = SessionLocal()
+        try:
+            rafraichir_cube(db)
+            db.commit()
+            click.echo(f"{db.query(CelluleStatistique).count()} cellules calculées.")
+        finally:
+            db.close()
 
     return app
 
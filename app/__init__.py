@@ -2,9 +2,10 @@
 Configuration et import des modèles
 """
 import os
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
 
+from base_donnees import creer_moteur
+
 # Configuration
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATABASE_URI = f'sqlite:///{os.path.join(BASE_DIR, "supnum_share.db")}'
@@ -17,8 +18,8 @@ ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'zip'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(EXPORT_FOLDER, exist_ok=True)
 
-# Moteur de base de données
-engine = create_engine(DATABASE_URI, echo=False)
+# Moteur de base de données (profil choisi par DB_PROFIL, voir base_donnees.py)
+engine = creer_moteur(DATABASE_URI)
 Session = scoped_session(sessionmaker(bind=engine))
 
 # Importer les modèles
@@ -32,10 +33,12 @@ from .models import (
     Devoir,
     Etudiant,
     Note,
+    MoyenneCache,
     Document,
     DocumentVote,
     DocumentComment,
     Message,
+    Blob,
     Notification,
 )
 
@@ -54,10 +57,12 @@ __all__ = [
     'Devoir',
     'Etudiant',
     'Note',
+    'MoyenneCache',
     'Document',
     'DocumentVote',
     'DocumentComment',
     'Message',
+    'Blob',
     'Notification',
     'UPLOAD_FOLDER',
     'EXPORT_FOLDER',
@@ -2,13 +2,18 @@
 Models package - définit toutes les classes de base de données
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey, Boolean, DateTime, Text
+from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey, Boolean, DateTime, Text, UniqueConstraint, Index
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
 from datetime import datetime
+import os
 from werkzeug.security import generate_password_hash, check_password_hash
 
 Base = declarative_base()
 
+# Méthode et coût des nouveaux hachages ; les mots de passe hachés autrement
+# sont rehachés à la connexion suivante (voir app/utils/mots_de_passe.py)
+METHODE_MOT_DE_PASSE = os.environ.get('METHODE_MOT_DE_PASSE', 'scrypt:32768:8:1')
+
 # Modèles d'authentification et utilisateurs
 class User(Base):
     __tablename__ = "users"
@@ -31,7 +36,7 @@ class User(Base):
     
     def set_password(self, password):
         """Hash et stocke le mot de passe"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=METHODE_MOT_DE_PASSE)
     
     def check_password(self, password):
         """Vérifie le mot de passe"""
@@ -112,6 +117,11 @@ class Matiere(Base):
     devoirs = relationship("Devoir", back_populates="matiere", cascade="all, delete-orphan")
     notes = relationship("Note", back_populates="matiere", cascade="all, delete-orphan")
     documents = relationship("Document", back_populates="matiere")
+    moyennes = relationship("MoyenneCache", back_populates="matiere", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_matieres_semestre", "semestre_id"),
+    )
     
     def __repr__(self):
         return f"<Matiere {self.nom}>"
@@ -151,6 +161,7 @@ class Etudiant(Base):
     specialite = relationship("Specialite", back_populates="etudiants")
     semestre = relationship("Semestre")
     notes = relationship("Note", back_populates="etudiant", cascade="all, delete-orphan")
+    moyennes = relationship("MoyenneCache", back_populates="etudiant", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Etudiant {self.user.prenom} {self.user.nom}>"
@@ -171,10 +182,44 @@ class Note(Base):
     matiere = relationship("Matiere", back_populates="notes")
     devoir = relationship("Devoir", back_populates="notes")
     
+    __table_args__ = (
+        # Une seule note par étudiant et par devoir (les notes sans devoir ne sont pas concernées)
+        Index("uq_notes_etudiant_devoir", "etudiant_id", "devoir_id", unique=True),
+        Index("ix_notes_etudiant_matiere", "etudiant_id", "matiere_id"),
+        Index("ix_notes_matiere", "matiere_id"),
+        Index("ix_notes_devoir", "devoir_id"),
+    )
+    
     def __repr__(self):
         return f"<Note {self.valeur}>"
 
 
+class MoyenneCache(Base):
+    """Agrégats des notes par (étudiant, matière), tenus à jour à chaque écriture de note"""
+    __tablename__ = "moyenne_cache"
+    
+    id = Column(Integer, primary_key=True)
+    etudiant_id = Column(Integer, ForeignKey("etudiants.id"), nullable=False)
+    matiere_id = Column(Integer, ForeignKey("matieres.id"), nullable=False)
+    somme_ponderee = Column(Float, nullable=False, default=0.0)  # somme valeur * coefficient du devoir
+    somme_coefficients = Column(Float, nullable=False, default=0.0)
+    somme_notes = Column(Float, nullable=False, default=0.0)  # somme simple, notes sans devoir incluses
+    nb_notes = Column(Integer, nullable=False, default=0)
+    moyenne = Column(Float)  # moyenne pondérée arrondie, None si non évaluable
+    statut = Column(String(20), nullable=False, default="Non évalué")
+    date_modification = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    etudiant = relationship("Etudiant", back_populates="moyennes")
+    matiere = relationship("Matiere", back_populates="moyennes")
+    
+    __table_args__ = (
+        UniqueConstraint("etudiant_id", "matiere_id", name="uq_moyenne_cache_etudiant_matiere"),
+    )
+    
+    def __repr__(self):
+        return f"<MoyenneCache {self.etudiant_id}/{self.matiere_id}: {self.moyenne}>"
+
+
 # Modèles pour le module Cours & Archives
 class Document(Base):
     __tablename__ = "documents"
@@ -198,6 +243,12 @@ class Document(Base):
     votes = relationship("DocumentVote", back_populates="document", cascade="all, delete-orphan")
     commentaires = relationship("DocumentComment", back_populates="document", cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # Documents d'une promotion, du plus récent au plus ancien
+        Index("ix_documents_promotion_date", "semestre_id", "filiere_id", "specialite_id", "date_upload"),
+        Index("ix_documents_date", "date_upload"),
+    )
+    
     def moyenne_votes(self):
         """Calcule la moyenne des votes"""
         if not self.votes:
@@ -222,7 +273,7 @@ class DocumentVote(Base):
     
     __table_args__ = (
         # Un étudiant ne peut voter qu'une fois par document
-        # Sera géré au niveau applicatif
+        Index("uq_document_votes_document_etudiant", "document_id", "etudiant_id", unique=True),
     )
     
     def __repr__(self):
@@ -260,6 +311,10 @@ class Notification(Base):
     
     user = relationship("User", back_populates="notifications")
     
+    __table_args__ = (
+        Index("ix_notifications_user_lue", "user_id", "lue"),
+    )
+    
     def __repr__(self):
         return f"<Notification {self.titre}>"
 
@@ -290,10 +345,34 @@ class Message(Base):
     semestre = relationship("Semestre")
     document = relationship("Document")
     
+    __table_args__ = (
+        # Fil public d'un semestre, du plus récent au plus ancien
+        Index("ix_messages_type_semestre_date", "type_message", "semestre_id", "date_creation"),
+    )
+    
     def __repr__(self):
         return f"<Message {self.contenu[:50]}>"
 
 
+class Blob(Base):
+    """Contenu d'un fichier déposé, stocké une seule fois sous son empreinte SHA-256
+
+    nb_references compte les Document et Message dont fichier_path désigne ce
+    contenu ; la commande fichiers-gc le recalcule et supprime les contenus
+    qui ne sont plus référencés.
+    """
+    __tablename__ = "blobs"
+    
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    taille = Column(Integer, nullable=False)
+    nb_references = Column(Integer, nullable=False, default=0)
+    date_creation = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<Blob {self.sha256[:12]} ({self.nb_references} réf.)>"
+
+
 __all__ = [
     'Base',
     'User',
@@ -304,9 +383,11 @@ __all__ = [
     'Devoir',
     'Etudiant',
     'Note',
+    'MoyenneCache',
     'Document',
     'DocumentVote',
     'DocumentComment',
     'Message',
+    'Blob',
     'Notification',
 ]
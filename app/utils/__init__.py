@@ -8,6 +8,26 @@ from .helpers import (
     PDFExporter,
     allowed_file,
     format_file_size,
+    donnees_releve,
+    lignes_releve,
+)
+from .moyennes import (
+    NotesColonnes,
+    moyennes_matieres,
+    moyennes_semestre,
+)
+from .moyenne_cache import (
+    ajouter_note,
+    retirer_note,
+    reconstruire_cache,
+    reconstruire_si_vide,
+    moyennes_etudiant,
+    resume_etudiant,
+)
+from .releves import (
+    charger_cohorte,
+    rendre_releve,
+    generer_releves,
 )
 
 __all__ = [
@@ -17,4 +37,18 @@ __all__ = [
     'PDFExporter',
     'allowed_file',
     'format_file_size',
+    'donnees_releve',
+    'lignes_releve',
+    'NotesColonnes',
+    'moyennes_matieres',
+    'moyennes_semestre',
+    'ajouter_note',
+    'retirer_note',
+    'reconstruire_cache',
+    'reconstruire_si_vide',
+    'moyennes_etudiant',
+    'resume_etudiant',
+    'charger_cohorte',
+    'rendre_releve',
+    'generer_releves',
 ]
@@ -0,0 +1,188 @@
+"""
+Stockage des fichiers déposés adressé par contenu
+Chaque contenu est rangé une seule fois sous la clé blobs/ab/cd/<sha256>
+(deux niveaux de sous-dossiers pour garder des répertoires courts) du
+backend de stockage (disque local, S3, voir stockage.py) : le même cours
+partagé par toute une promotion n'occupe qu'un objet. Document et Message
+gardent leur nom d'origine (filename) et désignent le contenu par sa clé
+dans fichier_path ; la table blobs compte ces références.
+
+Le compteur est incrémenté dans la transaction qui crée la ligne ; la
+commande fichiers-gc le recalcule depuis Document et Message, puis supprime
+les contenus qui ne sont plus référencés depuis plus de DELAI_GC secondes
+(un dépôt en cours n'est jamais collecté).
+"""
+
+import hashlib
+import os
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import UPLOAD_FOLDER
+from app.models import Blob, Document, Message
+from .depot import TAILLE_BLOC, enregistrer
+from .stockage import StockageLocal, stockage_par_defaut
+
+PREFIXE = 'blobs/'
+DELAI_GC = 3600  # secondes
+
+
+def cle_blob(sha256):
+    return f"{PREFIXE}{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def empreinte_blob(cle):
+    """SHA-256 du contenu désigné par une clé blobs/ab/cd/<sha256>, sinon None"""
+    if not cle or not cle.startswith(PREFIXE) or cle.count('/') != 3:
+        return None
+    return cle.rsplit('/', 1)[1]
+
+
+def referencer(db, sha256, taille, nombre=1):
+    """Ajoute nombre références au contenu sha256 (ligne créée au besoin), sans commit"""
+    blob = db.query(Blob).filter_by(sha256=sha256).first()
+    if blob is None:
+        try:
+            with db.begin_nested():
+                db.add(Blob(sha256=sha256, taille=taille, nb_references=nombre))
+            return
+        except IntegrityError:
+            # Créé entre-temps par un dépôt concurrent du même contenu
+            blob = db.query(Blob).filter_by(sha256=sha256).one()
+    blob.nb_references = Blob.nb_references + nombre
+
+
+def deposer(db, fichier, taille_max=None, stockage=None):
+    """Enregistre un FileStorage dans le stockage et le référence
+
+    Retourne un FichierDepose dont chemin est la clé à ranger dans fichier_path.
+    """
+    stockage = stockage or stockage_par_defaut()
+    depot = enregistrer(fichier, lambda sha256: stockage.destination(cle_blob(sha256)), taille_max)
+    cle = cle_blob(depot.sha256)
+    stockage.recevoir(cle, depot.chemin)
+    referencer(db, depot.sha256, depot.taille)
+    depot.chemin = cle
+    return depot
+
+
+def _hacher(chemin):
+    empreinte = hashlib.sha256()
+    with open(chemin, 'rb') as f:
+        for bloc in iter(lambda: f.read(TAILLE_BLOC), b''):
+            empreinte.update(bloc)
+    return empreinte.hexdigest()
+
+
+def importer_anciens(db, stockage=None):
+    """Range dans le stockage les fichiers déposés avant lui (uuid_nom sur le disque)
+
+    Retourne (fichiers importés, octets libérés par les doublons). Commit à la
+    fin ; un fichier n'est supprimé qu'une fois son contenu en place.
+    """
+    stockage = stockage or stockage_par_defaut()
+    disque = StockageLocal(UPLOAD_FOLDER)
+    importes, liberes = 0, 0
+    for modele in (Document, Message):
+        lignes = db.query(modele).filter(modele.fichier_path.isnot(None)).all()
+        for ligne in lignes:
+            ancien = disque.chemin(ligne.fichier_path)
+            if empreinte_blob(ligne.fichier_path) or not os.path.isfile(ancien):
+                continue
+            sha256 = _hacher(ancien)
+            cle = cle_blob(sha256)
+            taille = os.path.getsize(ancien)
+            if stockage.existe(cle):
+                liberes += taille
+            stockage.recevoir(cle, ancien)
+            ligne.fichier_path = cle
+            referencer(db, sha256, taille)
+            db.flush()
+            importes += 1
+    db.commit()
+    return importes, liberes
+
+
+def compter_references(db):
+    """{sha256: nombre de Document et Message qui le désignent}"""
+    references = {}
+    for modele in (Document, Message):
+        requete = (
+            select(modele.fichier_path, func.count(modele.id))
+            .where(modele.fichier_path.startswith(PREFIXE))
+            .group_by(modele.fichier_path)
+        )
+        for cle, nombre in db.execute(requete):
+            sha256 = empreinte_blob(cle)
+            if sha256:
+                references[sha256] = references.get(sha256, 0) + nombre
+    return references
+
+
+def collecter(db, delai=DELAI_GC, simulation=False, stockage=None):
+    """Recalcule les références et supprime les contenus orphelins
+
+    Retourne le rapport : contenus référencés, supprimés, octets libérés,
+    octets économisés par la déduplication (références en plus de la
+    première) et contenus référencés introuvables dans le stockage.
+    """
+    stockage = stockage or stockage_par_defaut()
+    references = compter_references(db)
+    presents = {
+        empreinte_blob(cle): (taille, date) for cle, taille, date in stockage.lister(PREFIXE)
+        if empreinte_blob(cle)
+    }
+    limite = time.time() - delai
+    rapport = {'references': 0, 'supprimes': 0, 'octets_liberes': 0, 'octets_economises': 0, 'manquants': 0}
+
+    blobs = {blob.sha256: blob for blob in db.query(Blob).all()}
+    for sha256 in references.keys() - blobs.keys():
+        # Compteur perdu : la ligne est recréée d'après le contenu stocké
+        if sha256 in presents and not simulation:
+            blobs[sha256] = Blob(sha256=sha256, taille=presents[sha256][0], nb_references=0)
+            db.add(blobs[sha256])
+
+    for sha256, blob in blobs.items():
+        nombre = references.get(sha256, 0)
+        blob.nb_references = nombre
+        if nombre:
+            rapport['references'] += 1
+            rapport['octets_economises'] += blob.taille * (nombre - 1)
+            rapport['manquants'] += sha256 not in presents
+            continue
+        if sha256 in presents and presents[sha256][1] > limite:
+            continue
+        if not simulation:
+            stockage.supprimer(cle_blob(sha256))
+            db.delete(blob)
+        rapport['supprimes'] += 1
+        rapport['octets_liberes'] += blob.taille
+
+    # Contenus stockés sans ligne ni référence (dépôt abandonné avant commit)
+    for sha256, (taille, date) in presents.items():
+        if sha256 in blobs or sha256 in references or date > limite:
+            continue
+        if not simulation:
+            stockage.supprimer(cle_blob(sha256))
+        rapport['supprimes'] += 1
+        rapport['octets_liberes'] += taille
+
+    if simulation:
+        db.rollback()
+    else:
+        db.commit()
+    return rapport
+
+
+__all__ = [
+    'PREFIXE',
+    'cle_blob',
+    'collecter',
+    'compter_references',
+    'deposer',
+    'empreinte_blob',
+    'importer_anciens',
+    'referencer',
+]
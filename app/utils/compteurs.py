@@ -0,0 +1,112 @@
+"""
+Compteurs du tableau de bord administrateur
+Tous les totaux (utilisateurs par rôle, matières, devoirs, notes, moyenne
+générale) sont lus en une seule instruction SELECT faite de sous-requêtes
+scalaires : un aller-retour avec la base au lieu d'un count() par carte.
+
+Le résultat est gardé en mémoire et invalidé après le commit de toute
+transaction qui a écrit un utilisateur, une fiche étudiant, une matière, un
+devoir ou une note (écouteurs installés par suivre()). Comme pour les
+fragments, l'invalidation ne touche que le processus courant : la durée de
+vie de l'entrée borne le retard des autres workers.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, func, select
+
+from app.models import Devoir, Etudiant, Matiere, Note, User
+
+DUREE = 300  # secondes
+MODELES_SUIVIS = (User, Etudiant, Matiere, Devoir, Note)
+
+
+def _nombre(modele, *conditions):
+    return select(func.count(modele.id)).where(*conditions).scalar_subquery()
+
+
+def requete_compteurs():
+    """SELECT unique qui ramène tous les compteurs sur une ligne"""
+    return select(
+        _nombre(User, User.role == 'etudiant', User.actif.is_(True)).label('etudiants'),
+        _nombre(Matiere).label('matieres'),
+        _nombre(User, User.role == 'admin', User.actif.is_(True)).label('admins'),
+        _nombre(User).label('total'),
+        _nombre(Devoir).label('devoirs'),
+        _nombre(Note).label('notes'),
+        select(func.avg(Note.valeur)).scalar_subquery().label('moyenne_generale'),
+    )
+
+
+def compter(db):
+    """{'etudiants', 'matieres', 'admins', 'total', 'devoirs', 'notes', 'moyenne_generale'}"""
+    compteurs = dict(db.execute(requete_compteurs()).one()._mapping)
+    if compteurs['moyenne_generale'] is not None:
+        compteurs['moyenne_generale'] = round(compteurs['moyenne_generale'], 2)
+    return compteurs
+
+
+class CompteursTableauBord:
+    """Compteurs en cache, partagés par les threads d'un worker"""
+
+    def __init__(self, duree=DUREE):
+        self.duree = duree
+        self._valeur = None
+        self._expire = 0.0
+        self._generation = 0
+        self._verrou = threading.Lock()
+
+    def obtenir(self, db):
+        maintenant = time.monotonic()
+        with self._verrou:
+            if self._valeur is not None and self._expire > maintenant:
+                return dict(self._valeur)
+            generation = self._generation
+
+        valeur = compter(db)
+        with self._verrou:
+            # Une écriture validée pendant le calcul rend la valeur douteuse : pas de mise en cache
+            if self._generation == generation:
+                self._valeur = valeur
+                self._expire = maintenant + self.duree
+        return dict(valeur)
+
+    def invalider(self):
+        with self._verrou:
+            self._generation += 1
+            self._valeur = None
+
+    def suivre(self, sessions):
+        """Invalide le cache après chaque commit qui modifie un des MODELES_SUIVIS
+
+        sessions : classe Session, sessionmaker ou scoped_session à écouter.
+        """
+        @event.listens_for(sessions, 'after_flush')
+        def _noter(db, contexte):
+            if any(isinstance(objet, MODELES_SUIVIS) for objet in (*db.new, *db.dirty, *db.deleted)):
+                db.info['compteurs_modifies'] = True
+
+        @event.listens_for(sessions, 'do_orm_execute')
+        def _noter_en_masse(etat):
+            # insert(Note) / update(Note) exécutés en masse (import de notes)
+            if (etat.is_insert or etat.is_update or etat.is_delete) and etat.bind_mapper is not None \
+                    and issubclass(etat.bind_mapper.class_, MODELES_SUIVIS):
+                etat.session.info['compteurs_modifies'] = True
+
+        @event.listens_for(sessions, 'after_commit')
+        def _invalider(db):
+            if db.info.pop('compteurs_modifies', False):
+                self.invalider()
+
+        @event.listens_for(sessions, 'after_soft_rollback')
+        def _oublier(db, transaction):
+            if transaction.parent is None:
+                db.info.pop('compteurs_modifies', None)
+
+
+__all__ = [
+    'CompteursTableauBord',
+    'compter',
+    'requete_compteurs',
+]
@@ -0,0 +1,159 @@
+"""
+Réception des fichiers déposés
+Le corps multipart est écrit directement dans un fichier temporaire du
+dossier de destination, bloc par bloc, pendant l'analyse de la requête : la
+taille et l'empreinte SHA-256 sont calculées au passage et la limite est
+vérifiée à chaque bloc, sans attendre la fin du transfert. Le fichier n'est
+renommé à son nom définitif (rename atomique, même système de fichiers)
+qu'une fois la requête validée ; sinon il est supprimé à la fin de la
+requête.
+
+Installation : app.request_class = RequeteDepot ; la vue appelle ensuite
+enregistrer(request.files['fichier'], chemin).
+"""
+
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+TAILLE_BLOC = 64 * 1024  # octets
+
+
+class FichierDepose:
+    """Métadonnées d'un fichier enregistré"""
+
+    __slots__ = ('chemin', 'taille', 'sha256')
+
+    def __init__(self, chemin, taille, sha256):
+        self.chemin = chemin
+        self.taille = taille
+        self.sha256 = sha256
+
+    def __repr__(self):
+        return f"<FichierDepose {self.chemin} ({self.taille} octets)>"
+
+
+class FluxDepot:
+    """Fichier temporaire qui hache et compte ce qu'on y écrit"""
+
+    def __init__(self, dossier, taille_max=None):
+        descripteur, self.chemin_temporaire = tempfile.mkstemp(prefix='.depot-', suffix='.part', dir=dossier)
+        self._fichier = os.fdopen(descripteur, 'w+b')
+        self._empreinte = hashlib.sha256()
+        self.taille_max = taille_max
+        self.taille = 0
+
+    def write(self, donnees):
+        self.taille += len(donnees)
+        if self.taille_max is not None and self.taille > self.taille_max:
+            self.abandonner()
+            raise RequestEntityTooLarge()
+        self._empreinte.update(donnees)
+        return self._fichier.write(donnees)
+
+    def read(self, *args):
+        return self._fichier.read(*args)
+
+    def readline(self, *args):
+        return self._fichier.readline(*args)
+
+    def seek(self, *args):
+        return self._fichier.seek(*args)
+
+    def tell(self):
+        return self._fichier.tell()
+
+    @property
+    def sha256(self):
+        return self._empreinte.hexdigest()
+
+    @property
+    def closed(self):
+        return self._fichier.closed
+
+    def finaliser(self, destination):
+        """Renomme le fichier temporaire en destination et retourne ses métadonnées"""
+        self._fichier.flush()
+        os.fsync(self._fichier.fileno())
+        self._fichier.close()
+        os.replace(self.chemin_temporaire, destination)
+        self.chemin_temporaire = None
+        return FichierDepose(destination, self.taille, self.sha256)
+
+    def abandonner(self):
+        if not self._fichier.closed:
+            self._fichier.close()
+        if self.chemin_temporaire:
+            try:
+                os.remove(self.chemin_temporaire)
+            except FileNotFoundError:
+                pass
+            self.chemin_temporaire = None
+
+    close = abandonner
+
+
+class RequeteDepot(Request):
+    """Requête Flask dont les fichiers multipart vont droit dans UPLOAD_FOLDER"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        flux = FluxDepot(current_app.config['UPLOAD_FOLDER'], current_app.config.get('MAX_CONTENT_LENGTH'))
+        self.__dict__.setdefault('_flux_depot', []).append(flux)
+        return flux
+
+    def close(self):
+        super().close()
+        # Fichiers non enregistrés, y compris ceux d'un transfert interrompu
+        for flux in self.__dict__.pop('_flux_depot', ()):
+            flux.abandonner()
+
+
+def enregistrer(fichier, destination, taille_max=None, dossier=None):
+    """Enregistre un FileStorage sous destination ; FichierDepose(chemin, taille, sha256)
+
+    destination peut être une fonction de l'empreinte SHA-256 (stockage
+    adressé par contenu) ; si le fichier existe déjà, le nouveau contenu,
+    identique, est abandonné. Sans RequeteDepot (tests, autre application), le
+    flux est recopié par blocs dans un fichier temporaire de dossier (par
+    défaut celui de destination) avec les mêmes contrôles.
+    """
+    flux = fichier.stream
+    if not isinstance(flux, FluxDepot) or flux.closed:
+        source = flux
+        if dossier is None:
+            dossier = os.path.dirname(destination) if isinstance(destination, str) else current_app.config['UPLOAD_FOLDER']
+        flux = FluxDepot(dossier or '.', taille_max)
+        try:
+            source.seek(0)
+        except (AttributeError, OSError):
+            pass
+        for bloc in iter(lambda: source.read(TAILLE_BLOC), b''):
+            flux.write(bloc)
+    elif taille_max is not None and flux.taille > taille_max:
+        flux.abandonner()
+        raise RequestEntityTooLarge()
+
+    if callable(destination):
+        destination = destination(flux.sha256)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.exists(destination):
+            flux.abandonner()
+            os.utime(destination)  # contenu de nouveau utilisé : épargné par le ramasse-miettes
+            return FichierDepose(destination, flux.taille, flux.sha256)
+    try:
+        return flux.finaliser(destination)
+    except OSError:
+        flux.abandonner()
+        raise
+
+
+__all__ = [
+    'TAILLE_BLOC',
+    'FichierDepose',
+    'FluxDepot',
+    'RequeteDepot',
+    'enregistrer',
+]
@@ -0,0 +1,63 @@
+"""
+Cache des fragments de pages rendus côté serveur
+Un fragment (tableau de notes, liste des matières d'un semestre...) est
+rangé sous (espace, clé) ; toute écriture qui le concerne invalide son
+espace entier. Un numéro de génération par espace empêche de ranger un
+fragment calculé avant une invalidation survenue pendant le calcul.
+
+L'invalidation ne touche que le processus courant : la durée de vie des
+entrées borne le retard des autres workers et des imports en ligne de
+commande.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+TAILLE_MAX = 512
+DUREE = 60  # secondes
+
+
+class CacheFragments:
+    """Cache LRU {(espace, clé): valeur} partagé par les threads"""
+
+    def __init__(self, taille_max=TAILLE_MAX, duree=DUREE):
+        self.taille_max = taille_max
+        self.duree = duree
+        self._entrees = OrderedDict()
+        self._generations = {}
+        self._verrou = threading.Lock()
+
+    def obtenir(self, espace, cle, calcul):
+        """Valeur en cache, ou calcul() rangé sous (espace, clé)"""
+        maintenant = time.monotonic()
+        with self._verrou:
+            entree = self._entrees.get((espace, cle))
+            if entree is not None and entree[0] > maintenant:
+                self._entrees.move_to_end((espace, cle))
+                return entree[1]
+            generation = self._generations.get(espace, 0)
+
+        valeur = calcul()
+        with self._verrou:
+            if self._generations.get(espace, 0) == generation:
+                self._entrees[(espace, cle)] = (maintenant + self.duree, valeur)
+                self._entrees.move_to_end((espace, cle))
+                while len(self._entrees) > self.taille_max:
+                    self._entrees.popitem(last=False)
+        return valeur
+
+    def invalider(self, *espaces):
+        """Oublie les fragments des espaces donnés (tous si aucun)"""
+        with self._verrou:
+            if not espaces:
+                espaces = {espace for espace, _ in self._entrees} | set(self._generations)
+            for espace in espaces:
+                self._generations[espace] = self._generations.get(espace, 0) + 1
+            for cle in [c for c in self._entrees if c[0] in espaces]:
+                del self._entrees[cle]
+
+
+__all__ = [
+    'CacheFragments',
+]
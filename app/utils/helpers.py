@@ -13,6 +13,8 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib import colors
 import os
 
+from .moyennes import NotesColonnes, moyennes_matieres, moyennes_semestre
+
 
 class MoyenneCalculator:
     """Calcule les moyennes et les statuts"""
@@ -23,12 +25,8 @@ class MoyenneCalculator:
         if not notes:
             return None
         
-        total_coeff = sum(n.devoir.coefficient for n in notes if n.devoir)
-        if total_coeff == 0:
-            return None
-        
-        total = sum(n.valeur * n.devoir.coefficient for n in notes if n.devoir)
-        return round(total / total_coeff, 2)
+        colonnes = NotesColonnes.from_notes(notes, par_etudiant=False, par_matiere=False)
+        return moyennes_matieres(colonnes)[(None, None)]
     
     @staticmethod
     def calculate_semestre_moyenne(notes_semestre, matieres_semestre):
@@ -36,24 +34,8 @@ class MoyenneCalculator:
         if not notes_semestre or not matieres_semestre:
             return None
         
-        moyennes_matieres = {}
-        for matiere in matieres_semestre:
-            notes = [n for n in notes_semestre if n.matiere_id == matiere.id]
-            if notes:
-                moyennes_matieres[matiere.id] = {
-                    'moyenne': MoyenneCalculator.calculate_matiere_moyenne(notes),
-                    'coefficient': matiere.coefficient
-                }
-        
-        if not moyennes_matieres:
-            return None
-        
-        total_coeff = sum(m['coefficient'] for m in moyennes_matieres.values() if m['moyenne'] is not None)
-        if total_coeff == 0:
-            return None
-        
-        total = sum(m['moyenne'] * m['coefficient'] for m in moyennes_matieres.values() if m['moyenne'] is not None)
-        return round(total / total_coeff, 2)
+        colonnes = NotesColonnes.from_notes(notes_semestre, par_etudiant=False)
+        return moyennes_semestre(colonnes, matieres_semestre).get(None)
     
     @staticmethod
     def get_statut(moyenne):
@@ -89,10 +71,10 @@ class StatisticsCalculator:
         matieres_rattrapage = 0
         matieres_echouees = 0
         
+        moyennes = moyennes_matieres(NotesColonnes.from_notes(notes, par_etudiant=False))
         for matiere in etudiant.filiere.matieres:
-            notes_matiere = [n for n in notes if n.matiere_id == matiere.id]
-            if notes_matiere:
-                moyenne = MoyenneCalculator.calculate_matiere_moyenne(notes_matiere)
+            if (None, matiere.id) in moyennes:
+                moyenne = moyennes[(None, matiere.id)]
                 statut = MoyenneCalculator.get_statut(moyenne)
                 
                 if statut == "Validée":
@@ -110,6 +92,36 @@ class StatisticsCalculator:
         }
 
 
+def donnees_releve(etudiant, notes):
+    """Relevé d'un étudiant sous forme de données simples (sérialisables)"""
+    colonnes = NotesColonnes.from_notes(notes, par_etudiant=False)
+    moyennes = {matiere_id: moyenne for (_, matiere_id), moyenne in moyennes_matieres(colonnes).items()}
+    return {
+        'username': etudiant.user.username,
+        'prenom': etudiant.user.prenom,
+        'nom': etudiant.user.nom,
+        'filiere': etudiant.filiere.nom,
+        'specialite': etudiant.specialite.nom,
+        'lignes': lignes_releve(
+            [(m.id, m.nom, m.code, m.coefficient) for m in etudiant.filiere.matieres], moyennes
+        ),
+    }
+
+
+def lignes_releve(matieres, moyennes):
+    """Lignes (nom, code, coefficient, moyenne, statut) des matières notées
+
+    matieres : couples (id, nom, code, coefficient) dans l'ordre d'affichage ;
+    moyennes : {matiere_id: moyenne} pour les seules matières ayant des notes.
+    """
+    lignes = []
+    for matiere_id, nom, code, coefficient in matieres:
+        if matiere_id in moyennes:
+            moyenne = moyennes[matiere_id]
+            lignes.append((nom, code, coefficient, moyenne, MoyenneCalculator.get_statut(moyenne)))
+    return lignes
+
+
 class ExcelExporter:
     """Exporte les données en format Excel"""
     
@@ -119,6 +131,11 @@ class ExcelExporter:
         if filename is None:
             filename = f'notes_{etudiant.user.username}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
         
+        return ExcelExporter.classeur_releve(donnees_releve(etudiant, notes)), filename
+    
+    @staticmethod
+    def classeur_releve(releve):
+        """Construit le classeur d'un relevé (voir donnees_releve)"""
         wb = Workbook()
         ws = wb.active
         ws.title = "Notes"
@@ -128,9 +145,9 @@ class ExcelExporter:
         ws['A1'].font = Font(size=16, bold=True)
         ws.merge_cells('A1:E1')
         
-        ws['A2'] = f"Étudiant: {etudiant.user.prenom} {etudiant.user.nom}"
-        ws['A3'] = f"Filière: {etudiant.filiere.nom}"
-        ws['A4'] = f"Spécialité: {etudiant.specialite.nom}"
+        ws['A2'] = f"Étudiant: {releve['prenom']} {releve['nom']}"
+        ws['A3'] = f"Filière: {releve['filiere']}"
+        ws['A4'] = f"Spécialité: {releve['specialite']}"
         
         # Titres des colonnes
         ws['A6'] = "Matière"
@@ -149,19 +166,14 @@ class ExcelExporter:
         
         # Données
         row = 7
-        for matiere in etudiant.filiere.matieres:
-            notes_matiere = [n for n in notes if n.matiere_id == matiere.id]
-            if notes_matiere:
-                moyenne = MoyenneCalculator.calculate_matiere_moyenne(notes_matiere)
-                statut = MoyenneCalculator.get_statut(moyenne)
-                
-                ws[f'A{row}'] = matiere.nom
-                ws[f'B{row}'] = matiere.code
-                ws[f'C{row}'] = matiere.coefficient
-                ws[f'D{row}'] = moyenne if moyenne else "N/A"
-                ws[f'E{row}'] = statut
-                
-                row += 1
+        for nom, code, coefficient, moyenne, statut in releve['lignes']:
+            ws[f'A{row}'] = nom
+            ws[f'B{row}'] = code
+            ws[f'C{row}'] = coefficient
+            ws[f'D{row}'] = moyenne if moyenne else "N/A"
+            ws[f'E{row}'] = statut
+            
+            row += 1
         
         # Ajuster les largeurs
         ws.column_dimensions['A'].width = 25
@@ -170,7 +182,7 @@ class ExcelExporter:
         ws.column_dimensions['D'].width = 12
         ws.column_dimensions['E'].width = 15
         
-        return wb, filename
+        return wb
 
 
 class PDFExporter:
@@ -182,16 +194,27 @@ class PDFExporter:
         if filename is None:
             filename = f'notes_{etudiant.user.username}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
         
-        # Créer le document PDF
-        doc = SimpleDocTemplate(
-            filename,
+        PDFExporter.document_releve(filename).build(
+            PDFExporter.elements_releve(donnees_releve(etudiant, notes))
+        )
+        
+        return filename
+    
+    @staticmethod
+    def document_releve(destination):
+        """Document A4 des relevés ; destination : chemin ou fichier binaire"""
+        return SimpleDocTemplate(
+            destination,
             pagesize=A4,
             rightMargin=0.5*inch,
             leftMargin=0.5*inch,
             topMargin=0.75*inch,
             bottomMargin=0.5*inch,
         )
-        
+    
+    @staticmethod
+    def elements_releve(releve):
+        """Éléments reportlab d'un relevé (voir donnees_releve)"""
         elements = []
         styles = getSampleStyleSheet()
         
@@ -210,9 +233,9 @@ class PDFExporter:
         
         # Informations étudiant
         info_text = f"""
-        <b>Étudiant:</b> {etudiant.user.prenom} {etudiant.user.nom}<br/>
-        <b>Filière:</b> {etudiant.filiere.nom}<br/>
-        <b>Spécialité:</b> {etudiant.specialite.nom}<br/>
+        <b>Étudiant:</b> {releve['prenom']} {releve['nom']}<br/>
+        <b>Filière:</b> {releve['filiere']}<br/>
+        <b>Spécialité:</b> {releve['specialite']}<br/>
         <b>Date d'édition:</b> {datetime.now().strftime('%d/%m/%Y à %H:%M')}<br/>
         """
         elements.append(Paragraph(info_text, styles['Normal']))
@@ -221,19 +244,14 @@ class PDFExporter:
         # Tableau des notes
         data = [['Matière', 'Code', 'Coefficient', 'Moyenne', 'Statut']]
         
-        for matiere in etudiant.filiere.matieres:
-            notes_matiere = [n for n in notes if n.matiere_id == matiere.id]
-            if notes_matiere:
-                moyenne = MoyenneCalculator.calculate_matiere_moyenne(notes_matiere)
-                statut = MoyenneCalculator.get_statut(moyenne)
-                
-                data.append([
-                    matiere.nom,
-                    matiere.code,
-                    str(matiere.coefficient),
-                    str(moyenne) if moyenne else "N/A",
-                    statut
-                ])
+        for nom, code, coefficient, moyenne, statut in releve['lignes']:
+            data.append([
+                nom,
+                code,
+                str(coefficient),
+                str(moyenne) if moyenne else "N/A",
+                statut
+            ])
         
         table = Table(data, colWidths=[2.5*inch, 1*inch, 1*inch, 1*inch, 1.2*inch])
         table.setStyle(TableStyle([
@@ -250,10 +268,7 @@ class PDFExporter:
         
         elements.append(table)
         
-        # Construire le PDF
-        doc.build(elements)
-        
-        return filename
+        return elements
 
 
 def allowed_file(filename):
@@ -276,6 +291,8 @@ __all__ = [
     'StatisticsCalculator',
     'ExcelExporter',
     'PDFExporter',
+    'donnees_releve',
+    'lignes_releve',
     'allowed_file',
     'format_file_size',
 ]
@@ -0,0 +1,95 @@
+"""
+Identité de l'utilisateur connecté
+L'utilisateur, son rôle et sa fiche étudiant sont lus en une seule requête
+et figés dans un objet détaché de la session SQLAlchemy, réutilisable par le
+décorateur et la vue d'une même requête HTTP. Un cache en mémoire à durée
+de vie courte évite de relire la base à chaque requête ; il est invalidé
+quand le profil ou le rôle d'un utilisateur change.
+"""
+
+import threading
+import time
+
+from sqlalchemy import select
+
+from app.models import Etudiant, User
+
+DUREE_CACHE = 30  # secondes
+
+
+class Identite:
+    """Instantané de l'utilisateur connecté et de sa fiche étudiant"""
+
+    __slots__ = (
+        'id', 'username', 'email', 'prenom', 'nom', 'role', 'actif',
+        'etudiant_id', 'numero_inscription', 'filiere_id', 'specialite_id', 'semestre_id',
+    )
+
+    def __init__(self, **valeurs):
+        for champ in self.__slots__:
+            setattr(self, champ, valeurs.get(champ))
+
+    def is_admin(self):
+        return self.role == "admin"
+
+    def is_student(self):
+        return self.role == "etudiant"
+
+    @property
+    def est_etudiant(self):
+        """Vrai si une fiche étudiant est rattachée au compte"""
+        return self.etudiant_id is not None
+
+    def __repr__(self):
+        return f"<Identite {self.username} ({self.role})>"
+
+
+def charger_identite(db, user_id):
+    """Identite d'un utilisateur en une requête (fiche étudiant en jointure externe), ou None"""
+    ligne = db.execute(
+        select(
+            User.id, User.username, User.email, User.prenom, User.nom, User.role, User.actif,
+            Etudiant.id.label('etudiant_id'), Etudiant.numero_inscription,
+            Etudiant.filiere_id, Etudiant.specialite_id, Etudiant.semestre_id,
+        )
+        .outerjoin(Etudiant, Etudiant.user_id == User.id)
+        .where(User.id == user_id)
+    ).first()
+    return Identite(**ligne._mapping) if ligne else None
+
+
+class CacheIdentites:
+    """Cache {user_id: Identite} partagé par les threads, avec expiration"""
+
+    def __init__(self, duree=DUREE_CACHE):
+        self.duree = duree
+        self._entrees = {}
+        self._verrou = threading.Lock()
+
+    def obtenir(self, db, user_id):
+        maintenant = time.monotonic()
+        with self._verrou:
+            entree = self._entrees.get(user_id)
+        if entree and entree[0] > maintenant:
+            return entree[1]
+
+        identite = charger_identite(db, user_id)
+        if identite is not None and self.duree > 0:
+            with self._verrou:
+                self._entrees[user_id] = (maintenant + self.duree, identite)
+        return identite
+
+    def invalider(self, user_id=None):
+        """Oublie un utilisateur (profil, rôle ou fiche étudiant modifiés), ou tous"""
+        with self._verrou:
+            if user_id is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(user_id, None)
+
+
+__all__ = [
+    'Identite',
+    'CacheIdentites',
+    'charger_identite',
+]
@@ -0,0 +1,273 @@
+"""
+Import en masse des notes d'une session d'examen
+Le fichier (CSV ou XLSX) est lu ligne à ligne, les étudiants et devoirs sont
+résolus par des dictionnaires préchargés, puis les notes sont insérées ou
+mises à jour par lots dans une seule transaction.
+"""
+
+import codecs
+import csv
+import io
+import os
+import time
+import zipfile
+from datetime import datetime
+
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import bindparam, insert, select, update
+
+from app.models import Devoir, Etudiant, Matiere, Note
+from .moyenne_cache import reconstruire_cache
+
+COLONNES = ('numero_inscription', 'devoir', 'valeur')
+TAILLE_LOT = 500
+NOTE_MIN = 0.0
+NOTE_MAX = 20.0
+
+
+class ErreurImport(ValueError):
+    """Fichier illisible ou colonnes manquantes"""
+
+
+def _normaliser(valeur):
+    return str(valeur).strip().lower() if valeur is not None else ''
+
+
+def _lignes_csv(fichier):
+    if isinstance(fichier, (str, os.PathLike)):
+        with open(fichier, newline='', encoding='utf-8-sig') as f:
+            yield from _lignes_csv(f)
+        return
+    texte = fichier if isinstance(fichier, io.TextIOBase) else codecs.getreader('utf-8-sig')(fichier)
+    echantillon = texte.readline()
+    delimiteur = ';' if echantillon.count(';') > echantillon.count(',') else ','
+    yield from csv.reader([echantillon], delimiter=delimiteur)
+    yield from csv.reader(texte, delimiter=delimiteur)
+
+
+def _lignes_xlsx(fichier):
+    classeur = None
+    try:
+        classeur = load_workbook(fichier, read_only=True, data_only=True)
+        for ligne in classeur.active.iter_rows(values_only=True):
+            yield ligne
+    except KeyError as e:
+        # zipfile lève KeyError quand une partie du classeur manque à l'archive
+        raise zipfile.BadZipFile(f"partie absente de l'archive : {e}") from e
+    finally:
+        if classeur is not None:
+            classeur.close()
+
+
+# Fichier corrompu, renommé ou mal encodé : signalé comme une erreur d'import
+ERREURS_LECTURE = (zipfile.BadZipFile, InvalidFileException, UnicodeDecodeError, csv.Error)
+
+
+def _lignes_protegees(lignes, nom_fichier):
+    try:
+        yield from lignes
+    except ERREURS_LECTURE as e:
+        raise ErreurImport(f"Fichier illisible : {nom_fichier} ({e})") from e
+
+
+def lire_lignes(fichier, nom_fichier):
+    """Itère sur les lignes d'un fichier CSV/XLSX : (numéro de ligne, dict)
+
+    La première ligne doit contenir les en-têtes numero_inscription, devoir
+    et valeur ; une colonne matiere (code) optionnelle lève l'ambiguïté entre
+    devoirs de même nom.
+    """
+    extension = nom_fichier.rsplit('.', 1)[-1].lower() if '.' in nom_fichier else ''
+    if extension == 'csv':
+        lignes = _lignes_csv(fichier)
+    elif extension in ('xlsx', 'xlsm'):
+        lignes = _lignes_xlsx(fichier)
+    else:
+        raise ErreurImport(f"Format non supporté : {nom_fichier} (CSV ou XLSX attendu)")
+    lignes = _lignes_protegees(lignes, nom_fichier)
+
+    entetes = [_normaliser(c) for c in next(lignes, ())]
+    manquantes = [c for c in COLONNES if c not in entetes]
+    if manquantes:
+        raise ErreurImport(f"Colonnes manquantes : {', '.join(manquantes)}")
+
+    for numero, valeurs in enumerate(lignes, start=2):
+        if not any(v not in (None, '') for v in valeurs):
+            continue
+        yield numero, dict(zip(entetes, valeurs))
+
+
+class ReferentielImport:
+    """Dictionnaires de résolution préchargés en trois requêtes"""
+
+    def __init__(self, db):
+        self.etudiants = {
+            _normaliser(numero): etudiant_id
+            for etudiant_id, numero in db.execute(select(Etudiant.id, Etudiant.numero_inscription))
+        }
+
+        self.devoirs = {}
+        self.devoirs_par_nom = {}
+        self.devoirs_par_matiere = {}
+        rows = db.execute(
+            select(Devoir.id, Devoir.nom, Devoir.matiere_id, Matiere.code)
+            .join(Matiere, Devoir.matiere_id == Matiere.id)
+        )
+        for devoir_id, nom, matiere_id, code in rows:
+            self.devoirs[devoir_id] = matiere_id
+            self.devoirs_par_nom.setdefault(_normaliser(nom), []).append(devoir_id)
+            self.devoirs_par_matiere[(_normaliser(code), _normaliser(nom))] = devoir_id
+
+        self.notes = {
+            (etudiant_id, devoir_id): note_id
+            for note_id, etudiant_id, devoir_id in db.execute(
+                select(Note.id, Note.etudiant_id, Note.devoir_id).where(Note.devoir_id.isnot(None))
+            )
+        }
+        # Notes insérées par un lot précédent de l'import (identifiant inconnu)
+        self.inserees = set()
+
+    def devoir(self, reference, code_matiere=None):
+        """Identifiant d'un devoir à partir de son id, de son nom ou de (matière, nom)"""
+        cle = _normaliser(reference)
+        if code_matiere:
+            devoir_id = self.devoirs_par_matiere.get((_normaliser(code_matiere), cle))
+            if devoir_id is None:
+                raise ValueError(f"Devoir inconnu pour la matière {code_matiere} : {reference}")
+            return devoir_id
+        if cle.isdigit() and int(cle) in self.devoirs:
+            return int(cle)
+        candidats = self.devoirs_par_nom.get(cle, [])
+        if not candidats:
+            raise ValueError(f"Devoir inconnu : {reference}")
+        if len(candidats) > 1:
+            raise ValueError(f"Devoir ambigu : {reference} (préciser la colonne matiere)")
+        return candidats[0]
+
+
+def _valider(referentiel, ligne):
+    numero = _normaliser(ligne.get('numero_inscription'))
+    etudiant_id = referentiel.etudiants.get(numero)
+    if etudiant_id is None:
+        raise ValueError(f"Étudiant inconnu : {ligne.get('numero_inscription')}")
+
+    devoir_id = referentiel.devoir(ligne.get('devoir'), ligne.get('matiere'))
+
+    brute = ligne.get('valeur')
+    try:
+        valeur = float(str(brute).replace(',', '.')) if not isinstance(brute, (int, float)) else float(brute)
+    except (TypeError, ValueError):
+        raise ValueError(f"Note invalide : {brute}")
+    if not NOTE_MIN <= valeur <= NOTE_MAX:
+        raise ValueError(f"Note hors de l'intervalle [{NOTE_MIN:g}, {NOTE_MAX:g}] : {valeur:g}")
+
+    return etudiant_id, devoir_id, valeur
+
+
+def _ecrire_lot(db, referentiel, lot, rapport):
+    """Écrit un lot {(etudiant_id, devoir_id): valeur} par instructions groupées"""
+    maintenant = datetime.utcnow()
+    insertions = []
+    mises_a_jour = []
+    reecritures = []
+    for (etudiant_id, devoir_id), valeur in lot.items():
+        note_id = referentiel.notes.get((etudiant_id, devoir_id))
+        if (etudiant_id, devoir_id) in referentiel.inserees:
+            reecritures.append({
+                'b_etudiant_id': etudiant_id,
+                'b_devoir_id': devoir_id,
+                'valeur': valeur,
+                'date_modification': maintenant,
+            })
+        elif note_id is None:
+            insertions.append({
+                'etudiant_id': etudiant_id,
+                'devoir_id': devoir_id,
+                'matiere_id': referentiel.devoirs[devoir_id],
+                'valeur': valeur,
+                'date_creation': maintenant,
+            })
+        else:
+            mises_a_jour.append({'id': note_id, 'valeur': valeur, 'date_modification': maintenant})
+
+    if insertions:
+        db.execute(insert(Note), insertions)
+        referentiel.inserees.update((n['etudiant_id'], n['devoir_id']) for n in insertions)
+    if mises_a_jour:
+        db.execute(update(Note), mises_a_jour)
+    if reecritures:
+        db.connection().execute(
+            update(Note.__table__)
+            .where(
+                Note.etudiant_id == bindparam('b_etudiant_id'),
+                Note.devoir_id == bindparam('b_devoir_id'),
+            )
+            .values(valeur=bindparam('valeur'), date_modification=bindparam('date_modification')),
+            reecritures,
+        )
+    rapport['inserees'] += len(insertions)
+    rapport['mises_a_jour'] += len(mises_a_jour) + len(reecritures)
+
+
+def importer_notes(db, lignes, taille_lot=TAILLE_LOT, simulation=False):
+    """Importe les notes d'un itérable de lignes (voir lire_lignes)
+
+    Toutes les écritures se font dans la transaction courante, validée à la
+    fin (annulée en mode simulation). Une même note présente plusieurs fois
+    dans le fichier prend la dernière valeur. Retourne un rapport : nombre de
+    lignes, insertions, mises à jour, erreurs par ligne, durée et débit.
+    """
+    debut = time.perf_counter()
+    referentiel = ReferentielImport(db)
+    rapport = {
+        'lignes': 0,
+        'inserees': 0,
+        'mises_a_jour': 0,
+        'erreurs': [],
+        'duree': 0.0,
+        'lignes_par_seconde': 0.0,
+    }
+
+    lot = {}
+    etudiants_modifies = set()
+    try:
+        for numero, ligne in lignes:
+            rapport['lignes'] += 1
+            try:
+                etudiant_id, devoir_id, valeur = _valider(referentiel, ligne)
+            except ValueError as e:
+                rapport['erreurs'].append((numero, str(e)))
+                continue
+
+            cle = (etudiant_id, devoir_id)
+            if cle not in lot and len(lot) >= taille_lot:
+                _ecrire_lot(db, referentiel, lot, rapport)
+                lot = {}
+            lot[cle] = valeur
+            etudiants_modifies.add(etudiant_id)
+        if lot:
+            _ecrire_lot(db, referentiel, lot, rapport)
+
+        if simulation:
+            db.rollback()
+        else:
+            if etudiants_modifies:
+                reconstruire_cache(db, etudiant_ids=etudiants_modifies)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    rapport['duree'] = time.perf_counter() - debut
+    if rapport['duree'] > 0:
+        rapport['lignes_par_seconde'] = rapport['lignes'] / rapport['duree']
+    return rapport
+
+
+__all__ = [
+    'ErreurImport',
+    'ReferentielImport',
+    'lire_lignes',
+    'importer_notes',
+]
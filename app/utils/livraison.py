@@ -0,0 +1,91 @@
+"""
+Livraison des fichiers déposés (documents de cours, pièces jointes du chat)
+Trois modes, choisis par la variable d'environnement LIVRAISON_FICHIERS :
+
+- 'direct' (défaut) : Flask envoie le fichier lui-même, avec requêtes
+  partielles (Range / 206), ETag taille+mtime et 304. Le corps passe par
+  wsgi.file_wrapper, que gunicorn sert par sendfile() sans copie en Python.
+- 'x-accel' : la réponse ne porte que l'en-tête X-Accel-Redirect ; nginx lit
+  le fichier sous le préfixe interne LIVRAISON_PREFIXE, par exemple :
+      location /fichiers-internes/ { internal; alias /srv/supnum/uploads/; }
+- 'x-sendfile' : en-tête X-Sendfile avec le chemin absolu (Apache
+  mod_xsendfile, lighttpd).
+
+Dans les deux derniers modes le worker Python est libéré dès les en-têtes
+envoyés ; le proxy gère lui-même Range et les requêtes conditionnelles.
+"""
+
+import mimetypes
+import os
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response, send_file
+
+from app import UPLOAD_FOLDER
+
+MODES = ('direct', 'x-accel', 'x-sendfile')
+MODE = os.environ.get('LIVRAISON_FICHIERS', 'direct')
+PREFIXE_INTERNE = os.environ.get('LIVRAISON_PREFIXE', '/fichiers-internes/')
+DUREE_CACHE = 24 * 3600  # secondes ; les noms stockés sont uniques (uuid)
+
+
+def empreinte_fichier(infos):
+    """ETag d'un fichier stocké : taille et date de modification (os.stat)"""
+    return f"{infos.st_size:x}-{infos.st_mtime_ns:x}"
+
+
+def _disposition(nom):
+    """Content-Disposition attachment, nom UTF-8 encodé selon la RFC 6266"""
+    ascii_nom = unicodedata.normalize('NFKD', nom).encode('ascii', 'ignore').decode() or 'fichier'
+    ascii_nom = ascii_nom.replace('"', '').replace('\\', '')
+    return f"attachment; filename=\"{ascii_nom}\"; filename*=UTF-8''{quote(nom)}"
+
+
+def envoyer_fichier(chemin, nom, mode=None, racine=UPLOAD_FOLDER, max_age=DUREE_CACHE):
+    """Réponse de téléchargement de chemin sous le nom nom
+
+    Lève FileNotFoundError si le fichier n'existe plus. Un fichier situé hors
+    de racine est toujours servi en mode direct (le proxy ne le connaît pas).
+    """
+    mode = mode or MODE
+    nom = nom or os.path.basename(chemin)
+    if mode not in MODES:
+        raise ValueError(f"Mode de livraison inconnu : {mode}")
+    chemin = os.path.abspath(chemin)
+    infos = os.stat(chemin)
+    relatif = os.path.relpath(chemin, os.path.abspath(racine))
+    if relatif.startswith(os.pardir):
+        mode = 'direct'
+
+    if mode == 'direct':
+        reponse = send_file(
+            chemin,
+            as_attachment=True,
+            download_name=nom,
+            conditional=True,
+            etag=empreinte_fichier(infos),
+            last_modified=infos.st_mtime,
+            max_age=max_age,
+        )
+    else:
+        reponse = Response(mimetype=mimetypes.guess_type(nom)[0] or 'application/octet-stream')
+        if mode == 'x-accel':
+            reponse.headers['X-Accel-Redirect'] = PREFIXE_INTERNE.rstrip('/') + '/' + quote(relatif.replace(os.sep, '/'))
+        else:
+            reponse.headers['X-Sendfile'] = chemin
+        reponse.headers['Content-Disposition'] = _disposition(nom)
+        reponse.set_etag(empreinte_fichier(infos))
+        reponse.last_modified = infos.st_mtime
+        reponse.cache_control.max_age = max_age
+    # Fichiers réservés aux utilisateurs connectés : jamais dans un cache partagé
+    reponse.cache_control.public = False
+    reponse.cache_control.private = True
+    return reponse
+
+
+__all__ = [
+    'MODES',
+    'empreinte_fichier',
+    'envoyer_fichier',
+]
@@ -0,0 +1,198 @@
+"""
+Migrations versionnées du schéma
+create_all crée les tables manquantes mais ne modifie jamais une table
+existante : les index et contraintes ajoutés après coup sont appliqués ici,
+dans l'ordre, et chaque version appliquée est enregistrée dans la table
+schema_version. Une migration déjà présente (base neuve créée avec les
+modèles à jour) est simplement enregistrée.
+"""
+
+import os
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, delete, func, inspect, select, text, update,
+)
+from sqlalchemy.orm import Session as SessionORM
+
+from app import UPLOAD_FOLDER
+from app.models import Document, DocumentVote, Matiere, Message, Note, Notification
+from .moyenne_cache import reconstruire_cache
+
+_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('nom', String(100), nullable=False),
+    Column('date_application', DateTime, nullable=False),
+)
+
+
+def _index(modele, nom):
+    return next(i for i in modele.__table__.indexes if i.name == nom)
+
+
+def _creer_index(connexion, *index):
+    existants = {}
+    for i in index:
+        table = i.table.name
+        if table not in existants:
+            existants[table] = {x['name'] for x in inspect(connexion).get_indexes(table)}
+        if i.name not in existants[table]:
+            i.create(connexion)
+
+
+def _doublons(connexion, modele, colonnes):
+    """Identifiants à supprimer pour ne garder que la ligne la plus récente de chaque groupe"""
+    renseignees = [c.isnot(None) for c in colonnes]
+    conservees = select(func.max(modele.id)).where(*renseignees).group_by(*colonnes)
+    return connexion.execute(
+        select(modele.id).where(*renseignees, modele.id.notin_(conservees))
+    ).scalars().all()
+
+
+# ======================== MIGRATIONS ========================
+
+def _index_requetes(connexion):
+    """Index composites des filtres et tris des routes"""
+    _creer_index(
+        connexion,
+        _index(Note, 'ix_notes_etudiant_matiere'),
+        _index(Note, 'ix_notes_matiere'),
+        _index(Note, 'ix_notes_devoir'),
+        _index(Matiere, 'ix_matieres_semestre'),
+        _index(Document, 'ix_documents_promotion_date'),
+        _index(Document, 'ix_documents_date'),
+        _index(Message, 'ix_messages_type_semestre_date'),
+        _index(Notification, 'ix_notifications_user_lue'),
+    )
+
+
+def _unicite_votes(connexion):
+    """Un vote par (document, étudiant) : les votes en double gardent le plus récent"""
+    doublons = _doublons(connexion, DocumentVote, [DocumentVote.document_id, DocumentVote.etudiant_id])
+    if doublons:
+        connexion.execute(delete(DocumentVote).where(DocumentVote.id.in_(doublons)))
+    _creer_index(connexion, _index(DocumentVote, 'uq_document_votes_document_etudiant'))
+
+
+def _unicite_notes(connexion):
+    """Une note par (étudiant, devoir) : les notes en double gardent la plus récente"""
+    doublons = _doublons(connexion, Note, [Note.etudiant_id, Note.devoir_id])
+    if doublons:
+        etudiants = connexion.execute(
+            select(Note.etudiant_id).where(Note.id.in_(doublons)).distinct()
+        ).scalars().all()
+        connexion.execute(delete(Note).where(Note.id.in_(doublons)))
+        db = SessionORM(bind=connexion)
+        reconstruire_cache(db, etudiant_ids=etudiants)
+        db.flush()
+        db.close()
+    _creer_index(connexion, _index(Note, 'uq_notes_etudiant_devoir'))
+
+
+def _chemins_relatifs(connexion):
+    """fichier_path devient la clé du stockage, relative à UPLOAD_FOLDER"""
+    prefixe = os.path.join(UPLOAD_FOLDER, '')
+    for modele in (Document, Message):
+        connexion.execute(
+            update(modele)
+            .where(modele.fichier_path.startswith(prefixe, autoescape=True))
+            .values(fichier_path=func.replace(func.substr(modele.fichier_path, len(prefixe) + 1), os.sep, '/'))
+        )
+
+
+MIGRATIONS = [
+    (1, 'index des requêtes fréquentes', _index_requetes),
+    (2, 'vote unique par document et étudiant', _unicite_votes),
+    (3, 'note unique par étudiant et devoir', _unicite_notes),
+    (4, 'chemins des fichiers relatifs au stockage', _chemins_relatifs),
+]
+
+
+def versions_appliquees(engine):
+    schema_version.create(engine, checkfirst=True)
+    with engine.connect() as connexion:
+        return set(connexion.execute(select(schema_version.c.version)).scalars())
+
+
+def migrer(engine, journal=None):
+    """Applique les migrations en attente, chacune dans sa transaction
+
+    journal(version, nom) est appelée avant chaque migration. Retourne la
+    liste des versions appliquées.
+    """
+    deja = versions_appliquees(engine)
+    appliquees = []
+    for version, nom, migration in MIGRATIONS:
+        if version in deja:
+            continue
+        if journal:
+            journal(version, nom)
+        with engine.begin() as connexion:
+            migration(connexion)
+            connexion.execute(schema_version.insert().values(
+                version=version, nom=nom, date_application=datetime.utcnow(),
+            ))
+        appliquees.append(version)
+    return appliquees
+
+
+# ======================== VÉRIFICATION DES PLANS ========================
+
+def requetes_frequentes():
+    """Requêtes des routes chaudes et index acceptés dans leur plan d'exécution"""
+    return [
+        ('notes d\'un étudiant', ('ix_notes_etudiant_matiere', 'uq_notes_etudiant_devoir'),
+         select(Note.id).where(Note.etudiant_id == 1)),
+        ('notes d\'un étudiant dans une matière', 'ix_notes_etudiant_matiere',
+         select(Note.valeur, Note.devoir_id).where(Note.etudiant_id == 1, Note.matiere_id == 1)),
+        ('notes d\'une matière', 'ix_notes_matiere',
+         select(Note.id, Note.valeur).where(Note.matiere_id == 1)),
+        ('notes d\'un devoir', 'ix_notes_devoir',
+         select(Note.id, Note.valeur).where(Note.devoir_id == 1)),
+        ('note d\'un étudiant pour un devoir', 'uq_notes_etudiant_devoir',
+         select(Note.id).where(Note.etudiant_id == 1, Note.devoir_id == 1)),
+        ('matières d\'un semestre', 'ix_matieres_semestre',
+         select(Matiere.id, Matiere.nom).where(Matiere.semestre_id == 1)),
+        ('documents d\'une promotion', 'ix_documents_promotion_date',
+         select(Document.id, Document.titre)
+         .where(Document.semestre_id == 1, Document.filiere_id == 1, Document.specialite_id == 1)
+         .order_by(Document.date_upload.desc())),
+        ('fil public d\'un semestre', 'ix_messages_type_semestre_date',
+         select(Message.id, Message.contenu)
+         .where(Message.type_message == 'public', Message.semestre_id == 1)
+         .order_by(Message.date_creation.desc()).limit(50)),
+        ('notifications non lues', 'ix_notifications_user_lue',
+         select(func.count(Notification.id)).where(Notification.user_id == 1, Notification.lue.is_(False))),
+        ('vote d\'un étudiant sur un document', 'uq_document_votes_document_etudiant',
+         select(DocumentVote.id).where(DocumentVote.document_id == 1, DocumentVote.etudiant_id == 1)),
+    ]
+
+
+def _plan(connexion, requete):
+    sql = str(requete.compile(dialect=connexion.dialect, compile_kwargs={'literal_binds': True}))
+    if connexion.dialect.name == 'sqlite':
+        return ' | '.join(r[-1] for r in connexion.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+    resultat = connexion.execute(text(f'EXPLAIN {sql}'))
+    return ' | '.join(str(ligne.get('key')) for ligne in resultat.mappings())
+
+
+def verifier_plans(engine):
+    """[(requête, index attendus, utilisé, plan)] pour chaque requête fréquente"""
+    rapport = []
+    with engine.connect() as connexion:
+        for nom, index, requete in requetes_frequentes():
+            index = (index,) if isinstance(index, str) else index
+            plan = _plan(connexion, requete)
+            rapport.append((nom, ' / '.join(index), any(i in plan for i in index), plan))
+    return rapport
+
+
+__all__ = [
+    'MIGRATIONS',
+    'migrer',
+    'versions_appliquees',
+    'requetes_frequentes',
+    'verifier_plans',
+]
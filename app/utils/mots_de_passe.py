@@ -0,0 +1,146 @@
+"""
+Vérification des mots de passe hors des threads de requête
+scrypt et PBKDF2 sont volontairement coûteux : à la publication des
+résultats, toute l'école se connecte en quelques minutes et les
+vérifications saturent les CPU des workers. Elles sont confiées à un pool de
+processus borné ; au-delà de FILE_MAX vérifications en attente, la connexion
+est refusée tout de suite (Surcharge) plutôt que de faire attendre tous les
+utilisateurs.
+
+Un mot de passe correct haché avec une autre méthode ou un autre coût que
+METHODE_MOT_DE_PASSE est rehaché dans la foulée : changer la variable
+d'environnement suffit à migrer les comptes au fil des connexions.
+
+Réglages : MOTS_DE_PASSE_PROCESSUS (0 = vérification dans le thread de la
+requête), MOTS_DE_PASSE_FILE et MOTS_DE_PASSE_DELAI (secondes).
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as DelaiDepasse
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.models import METHODE_MOT_DE_PASSE
+
+PROCESSUS = int(os.environ.get('MOTS_DE_PASSE_PROCESSUS', max(1, (os.cpu_count() or 2) // 2)))
+FILE_MAX = int(os.environ.get('MOTS_DE_PASSE_FILE', PROCESSUS * 8))
+DELAI = float(os.environ.get('MOTS_DE_PASSE_DELAI', 10))
+
+
+class Surcharge(RuntimeError):
+    """Trop de vérifications en attente : réessayer plus tard"""
+
+
+_prefixes = {}
+
+
+def prefixe_methode(methode):
+    """Partie 'méthode:paramètres' des hachages produits par methode"""
+    if methode not in _prefixes:
+        _prefixes[methode] = generate_password_hash('', method=methode).split('$', 1)[0]
+    return _prefixes[methode]
+
+
+def a_rehacher(password_hash, methode=METHODE_MOT_DE_PASSE):
+    return password_hash.split('$', 1)[0] != prefixe_methode(methode)
+
+
+def _verifier(password_hash, mot_de_passe, methode):
+    """(correct, nouveau hachage ou None) ; exécuté dans les processus du pool"""
+    if not check_password_hash(password_hash, mot_de_passe):
+        return False, None
+    if a_rehacher(password_hash, methode):
+        return True, generate_password_hash(mot_de_passe, method=methode)
+    return True, None
+
+
+class VerificateurMotsDePasse:
+    """Pool de processus partagé par les threads d'un worker, avec file bornée"""
+
+    def __init__(self, processus=PROCESSUS, file_max=FILE_MAX, delai=DELAI, methode=METHODE_MOT_DE_PASSE):
+        self.processus = processus
+        self.file_max = file_max
+        self.delai = delai
+        self.methode = methode
+        self._pool = None
+        self._pid = None
+        self._en_cours = 0
+        self._refusees = 0
+        self._verrou = threading.Lock()
+
+    def _executeur(self):
+        # Un pool par processus : les workers gunicorn forkés recréent le leur
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.processus)
+            self._pid = os.getpid()
+        return self._pool
+
+    def _liberer(self, tache=None):
+        with self._verrou:
+            self._en_cours -= 1
+
+    def _abandonner_pool(self, pool):
+        """Pool cassé (processus tué) : le suivant sera recréé au prochain appel"""
+        with self._verrou:
+            self._refusees += 1
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+
+    def _executer(self, fonction, *args):
+        if not self.processus:
+            return fonction(*args)
+        with self._verrou:
+            if self._en_cours >= self.file_max:
+                self._refusees += 1
+                raise Surcharge("Trop de connexions simultanées")
+            self._en_cours += 1
+            pool = self._executeur()
+        try:
+            tache = pool.submit(fonction, *args)
+        except BrokenProcessPool:
+            self._liberer()
+            self._abandonner_pool(pool)
+            raise Surcharge("Pool de vérification indisponible")
+        # La place n'est rendue qu'à la fin réelle de la tâche : une tâche déjà
+        # lancée continue après l'expiration du délai et occupe son processus
+        tache.add_done_callback(self._liberer)
+        try:
+            return tache.result(timeout=self.delai)
+        except DelaiDepasse:
+            tache.cancel()
+            with self._verrou:
+                self._refusees += 1
+            raise Surcharge("Vérification du mot de passe trop lente")
+        except BrokenProcessPool:
+            self._abandonner_pool(pool)
+            raise Surcharge("Pool de vérification indisponible")
+
+    def verifier(self, password_hash, mot_de_passe):
+        """(correct, nouveau hachage à enregistrer ou None) ; lève Surcharge"""
+        if not password_hash or mot_de_passe is None:
+            return False, None
+        return self._executer(_verifier, password_hash, mot_de_passe, self.methode)
+
+    def hacher(self, mot_de_passe):
+        """Hachage d'un nouveau mot de passe, calculé dans le pool"""
+        return self._executer(generate_password_hash, mot_de_passe, self.methode)
+
+    def statistiques(self):
+        with self._verrou:
+            return {
+                'processus': self.processus,
+                'file_max': self.file_max,
+                'en_cours': self._en_cours,
+                'refusees': self._refusees,
+                'methode': self.methode,
+            }
+
+
+__all__ = [
+    'Surcharge',
+    'VerificateurMotsDePasse',
+    'a_rehacher',
+]
@@ -0,0 +1,182 @@
+"""
+Cache matérialisé des moyennes par (étudiant, matière)
+Les agrégats sont mis à jour de façon incrémentale dans la transaction qui
+écrit la note ; les pages de résultats n'ont plus qu'à lire la table.
+"""
+
+from sqlalchemy import delete, func, insert, select
+
+from app.models import Devoir, Matiere, MoyenneCache, Note
+from .helpers import MoyenneCalculator
+
+# Sommes flottantes tenues par ajouts et retraits : en deçà, les coefficients
+# sont un résidu d'arrondi (0.3 + 0.3 + 0.4 retirés dans un autre ordre)
+EPSILON = 1e-9
+
+
+def _moyenne(somme_ponderee, somme_coefficients):
+    if abs(somme_coefficients) < EPSILON:
+        return None
+    return round(somme_ponderee / somme_coefficients, 2)
+
+
+def _coefficient(db, devoir_id):
+    if not devoir_id:
+        return None
+    return db.query(Devoir.coefficient).filter_by(id=devoir_id).scalar()
+
+
+def appliquer_note(db, etudiant_id, matiere_id, valeur, coefficient, sens=1):
+    """Ajoute (sens=1) ou retire (sens=-1) une note des agrégats, sans commit"""
+    entree = (
+        db.query(MoyenneCache)
+        .filter_by(etudiant_id=etudiant_id, matiere_id=matiere_id)
+        .first()
+    )
+    if entree is None:
+        if sens < 0:
+            return None
+        entree = MoyenneCache(
+            etudiant_id=etudiant_id,
+            matiere_id=matiere_id,
+            somme_ponderee=0.0,
+            somme_coefficients=0.0,
+            somme_notes=0.0,
+            nb_notes=0,
+        )
+        db.add(entree)
+
+    entree.nb_notes += sens
+    if entree.nb_notes <= 0:
+        db.delete(entree)
+        db.flush()
+        return None
+
+    entree.somme_notes += sens * valeur
+    if coefficient is not None:
+        entree.somme_ponderee += sens * valeur * coefficient
+        entree.somme_coefficients += sens * coefficient
+        if abs(entree.somme_coefficients) < EPSILON:
+            entree.somme_ponderee = 0.0
+            entree.somme_coefficients = 0.0
+    entree.moyenne = _moyenne(entree.somme_ponderee, entree.somme_coefficients)
+    entree.statut = MoyenneCalculator.get_statut(entree.moyenne)
+    return entree
+
+
+def ajouter_note(db, note):
+    """Répercute une note nouvelle (ou ses nouvelles valeurs) dans le cache"""
+    return appliquer_note(
+        db, note.etudiant_id, note.matiere_id, note.valeur, _coefficient(db, note.devoir_id), 1
+    )
+
+
+def retirer_note(db, note):
+    """Retire une note (ou ses anciennes valeurs) du cache"""
+    return appliquer_note(
+        db, note.etudiant_id, note.matiere_id, note.valeur, _coefficient(db, note.devoir_id), -1
+    )
+
+
+def reconstruire_cache(db, etudiant_ids=None, matiere_ids=None):
+    """Recalcule les agrégats depuis les notes en une requête groupée, sans commit"""
+    query = (
+        select(
+            Note.etudiant_id,
+            Note.matiere_id,
+            func.coalesce(func.sum(Note.valeur * Devoir.coefficient), 0.0),
+            func.coalesce(func.sum(Devoir.coefficient), 0.0),
+            func.sum(Note.valeur),
+            func.count(Note.id),
+        )
+        .outerjoin(Devoir, Note.devoir_id == Devoir.id)
+        .group_by(Note.etudiant_id, Note.matiere_id)
+    )
+    suppression = delete(MoyenneCache)
+    if etudiant_ids is not None:
+        etudiant_ids = list(etudiant_ids)
+        query = query.where(Note.etudiant_id.in_(etudiant_ids))
+        suppression = suppression.where(MoyenneCache.etudiant_id.in_(etudiant_ids))
+    if matiere_ids is not None:
+        matiere_ids = list(matiere_ids)
+        query = query.where(Note.matiere_id.in_(matiere_ids))
+        suppression = suppression.where(MoyenneCache.matiere_id.in_(matiere_ids))
+
+    entrees = []
+    for etudiant_id, matiere_id, somme_ponderee, somme_coefficients, somme_notes, nb in db.execute(query):
+        moyenne = _moyenne(somme_ponderee, somme_coefficients)
+        entrees.append({
+            'etudiant_id': etudiant_id,
+            'matiere_id': matiere_id,
+            'somme_ponderee': somme_ponderee,
+            'somme_coefficients': somme_coefficients,
+            'somme_notes': somme_notes,
+            'nb_notes': nb,
+            'moyenne': moyenne,
+            'statut': MoyenneCalculator.get_statut(moyenne),
+        })
+
+    db.execute(suppression)
+    if entrees:
+        db.execute(insert(MoyenneCache), entrees)
+    return len(entrees)
+
+
+def reconstruire_si_vide(db):
+    """Construit le cache au premier démarrage sur une base qui a déjà des notes"""
+    if db.query(MoyenneCache.id).first() is None and db.query(Note.id).first() is not None:
+        reconstruire_cache(db)
+        db.commit()
+
+
+def moyennes_etudiant(db, etudiant_id):
+    """Couples (MoyenneCache, Matiere) d'un étudiant, en une lecture indexée"""
+    return (
+        db.query(MoyenneCache, Matiere)
+        .join(Matiere, MoyenneCache.matiere_id == Matiere.id)
+        .filter(MoyenneCache.etudiant_id == etudiant_id)
+        .order_by(Matiere.id)
+        .all()
+    )
+
+
+def resume_etudiant(db, etudiant_id):
+    """Nombre de notes et moyenne simple de toutes les notes d'un étudiant"""
+    somme, nb = (
+        db.query(func.sum(MoyenneCache.somme_notes), func.sum(MoyenneCache.nb_notes))
+        .filter(MoyenneCache.etudiant_id == etudiant_id)
+        .one()
+    )
+    if not nb:
+        return 0, 0
+    return nb, round(somme / nb, 2)
+
+
+def version_notes(db, etudiant_id):
+    """(nombre, dernier id, dernière date de modification) des notes d'un étudiant
+
+    Lecture sur l'index ix_notes_etudiant_matiere, sans charger les notes :
+    toute création, modification ou suppression change le triplet.
+    """
+    nb, dernier_id, creation, modification = (
+        db.query(
+            func.count(Note.id), func.max(Note.id),
+            func.max(Note.date_creation), func.max(Note.date_modification),
+        )
+        .filter(Note.etudiant_id == etudiant_id)
+        .one()
+    )
+    dates = [d for d in (creation, modification) if d is not None]
+    return nb, dernier_id, max(dates) if dates else None
+
+
+__all__ = [
+    'appliquer_note',
+    'ajouter_note',
+    'retirer_note',
+    'reconstruire_cache',
+    'reconstruire_si_vide',
+    'moyennes_etudiant',
+    'resume_etudiant',
+    'version_notes',
+]
@@ -0,0 +1,128 @@
+"""
+Calcul des moyennes en colonnes pour l'application SupNum Share
+Les notes sont manipulées sous forme de tableaux plats (étudiant, matière,
+coefficient du devoir, valeur) et réduites par groupe en une seule passe.
+"""
+
+from sqlalchemy import select
+
+from app.models import Devoir, Note
+
+
+class NotesColonnes:
+    """Notes stockées en colonnes parallèles"""
+
+    __slots__ = ('etudiant_ids', 'matiere_ids', 'coefficients', 'valeurs')
+
+    def __init__(self, etudiant_ids, matiere_ids, coefficients, valeurs):
+        self.etudiant_ids = list(etudiant_ids)
+        self.matiere_ids = list(matiere_ids)
+        self.coefficients = list(coefficients)
+        self.valeurs = list(valeurs)
+
+    def __len__(self):
+        return len(self.valeurs)
+
+    @classmethod
+    def from_notes(cls, notes, par_etudiant=True, par_matiere=True):
+        """Construit les colonnes à partir d'objets Note.
+
+        Le coefficient vaut None pour une note sans devoir : elle compte
+        dans le groupe mais pas dans la moyenne pondérée. Avec
+        par_etudiant / par_matiere à False, la clé correspondante vaut None
+        et toutes les notes tombent dans le même groupe.
+        """
+        etudiant_ids, matiere_ids, coefficients, valeurs = [], [], [], []
+        for n in notes:
+            etudiant_ids.append(n.etudiant_id if par_etudiant else None)
+            matiere_ids.append(n.matiere_id if par_matiere else None)
+            coefficients.append(n.devoir.coefficient if n.devoir else None)
+            valeurs.append(n.valeur)
+        return cls(etudiant_ids, matiere_ids, coefficients, valeurs)
+
+    @classmethod
+    def from_query(cls, db, etudiant_ids=None, matiere_ids=None):
+        """Charge les colonnes en une seule requête, sans passer par l'ORM"""
+        query = (
+            select(Note.etudiant_id, Note.matiere_id, Devoir.coefficient, Note.valeur)
+            .outerjoin(Devoir, Note.devoir_id == Devoir.id)
+            .order_by(Note.id)
+        )
+        if etudiant_ids is not None:
+            query = query.where(Note.etudiant_id.in_(list(etudiant_ids)))
+        if matiere_ids is not None:
+            query = query.where(Note.matiere_id.in_(list(matiere_ids)))
+
+        rows = db.execute(query).all()
+        if not rows:
+            return cls([], [], [], [])
+        return cls(*zip(*rows))
+
+
+def _sommes_par_groupe(colonnes):
+    """Somme des coefficients et somme pondérée par (étudiant, matière).
+
+    Les sommes démarrent à 0 et s'accumulent dans l'ordre des notes, comme
+    sum() sur la liste d'origine : les résultats sont identiques au bit près.
+    """
+    groupes = {}
+    for etudiant_id, matiere_id, coefficient, valeur in zip(
+        colonnes.etudiant_ids, colonnes.matiere_ids, colonnes.coefficients, colonnes.valeurs
+    ):
+        sommes = groupes.get((etudiant_id, matiere_id))
+        if sommes is None:
+            sommes = groupes[(etudiant_id, matiere_id)] = [0, 0]
+        if coefficient is not None:
+            sommes[0] += coefficient
+            sommes[1] += valeur * coefficient
+    return groupes
+
+
+def moyennes_matieres(colonnes):
+    """Moyenne pondérée de chaque (étudiant, matière) présent dans les colonnes"""
+    moyennes = {}
+    for cle, (total_coeff, total) in _sommes_par_groupe(colonnes).items():
+        moyennes[cle] = round(total / total_coeff, 2) if total_coeff != 0 else None
+    return moyennes
+
+
+def moyennes_semestre(colonnes, matieres_semestre):
+    """Moyenne du semestre de chaque étudiant présent dans les colonnes.
+
+    matieres_semestre : objets Matiere ou couples (id, coefficient).
+    """
+    coefficients = {}
+    for matiere in matieres_semestre:
+        if isinstance(matiere, tuple):
+            coefficients[matiere[0]] = matiere[1]
+        else:
+            coefficients[matiere.id] = matiere.coefficient
+
+    par_etudiant = {}
+    for (etudiant_id, matiere_id), moyenne in moyennes_matieres(colonnes).items():
+        par_etudiant.setdefault(etudiant_id, {})[matiere_id] = moyenne
+
+    resultats = {}
+    for etudiant_id, moyennes in par_etudiant.items():
+        total_coeff = 0
+        total = 0
+        evaluee = False
+        for matiere_id, coefficient in coefficients.items():
+            if matiere_id not in moyennes:
+                continue
+            evaluee = True
+            if moyennes[matiere_id] is not None:
+                total_coeff += coefficient
+                total += moyennes[matiere_id] * coefficient
+        if not evaluee or total_coeff == 0:
+            resultats[etudiant_id] = None
+        else:
+            resultats[etudiant_id] = round(total / total_coeff, 2)
+    return resultats
+
+
+__all__ = [
+    'NotesColonnes',
+    'moyennes_matieres',
+    'moyennes_semestre',
+]
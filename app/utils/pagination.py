@@ -0,0 +1,163 @@
+"""
+Listes d'administration paginées par clé
+Chaque liste décrit sa requête, ses tris et ses filtres ; la lecture d'une
+page (curseurs, WHERE sur les clés de tri) est faite par pagination_cle.
+"""
+
+from sqlalchemy import func, or_, select
+
+from app.models import Document, Filiere, Matiere, Note, Devoir, Etudiant, Specialite, User
+from pagination_cle import PAR_PAGE, PAR_PAGE_MAX, Page, decoder_curseur, encoder_curseur, paginer
+
+
+# ======================== LISTES D'ADMINISTRATION ========================
+
+class Liste:
+    """Description d'une liste paginée : requête, tris proposés et filtres
+
+    tris : {nom: [(colonne, descendant), ...]} — le premier est le tri par
+    défaut ; filtres : {paramètre: fonction(valeur) -> condition SQL}.
+    """
+
+    def __init__(self, requete, tris, filtres):
+        self.requete = requete
+        self.tris = tris
+        self.filtres = filtres
+
+    def conditions(self, args):
+        conditions = []
+        for parametre, condition in self.filtres.items():
+            valeur = args.get(parametre)
+            if valeur not in (None, ''):
+                conditions.append(condition(valeur))
+        return conditions
+
+    def page(self, db, args, avec_total=False):
+        """Page décrite par les paramètres de requête (tri, curseur, par_page, filtres)"""
+        nom_tri = args.get('tri') or next(iter(self.tris))
+        if nom_tri not in self.tris:
+            raise ValueError(f'Tri inconnu : {nom_tri}')
+        try:
+            par_page = int(args.get('par_page') or PAR_PAGE)
+        except ValueError:
+            raise ValueError('par_page doit être un entier')
+        par_page = min(max(par_page, 1), PAR_PAGE_MAX)
+
+        conditions = self.conditions(args)
+        query = self.requete().where(*conditions)
+        page = paginer(db, query, self.tris[nom_tri], nom_tri, args.get('curseur'), par_page)
+        if avec_total:
+            page.total = db.execute(
+                select(func.count()).select_from(query.subquery())
+            ).scalar()
+        return page
+
+
+def _entier(valeur):
+    try:
+        return int(valeur)
+    except (TypeError, ValueError):
+        raise ValueError(f'Identifiant invalide : {valeur}')
+
+
+def _requete_utilisateurs():
+    return select(
+        User.id.label('id'), User.username.label('username'), User.email.label('email'),
+        User.prenom.label('prenom'), User.nom.label('nom'), User.role.label('role'),
+        User.actif.label('actif'),
+    )
+
+
+def _requete_notes():
+    return (
+        select(
+            Note.id.label('id'), Filiere.nom.label('filiere'), Specialite.nom.label('specialite'),
+            User.prenom.label('prenom'), User.nom.label('nom'), Matiere.nom.label('matiere'),
+            Devoir.nom.label('devoir'), Note.valeur.label('valeur'), Note.date_creation.label('date_creation'),
+        )
+        .select_from(Note)
+        .join(Etudiant, Note.etudiant_id == Etudiant.id)
+        .join(User, Etudiant.user_id == User.id)
+        .join(Filiere, Etudiant.filiere_id == Filiere.id)
+        .join(Specialite, Etudiant.specialite_id == Specialite.id)
+        .join(Matiere, Note.matiere_id == Matiere.id)
+        .outerjoin(Devoir, Note.devoir_id == Devoir.id)
+    )
+
+
+def _requete_documents():
+    return (
+        select(
+            Document.id.label('id'), Document.titre.label('titre'),
+            Document.type_document.label('type_document'), Matiere.nom.label('matiere'),
+            Document.date_upload.label('date_upload'),
+        )
+        .select_from(Document)
+        .outerjoin(Matiere, Document.matiere_id == Matiere.id)
+    )
+
+
+LISTES = {
+    'utilisateurs': Liste(
+        _requete_utilisateurs,
+        tris={
+            'id': [(User.id, False)],
+            'nom': [(User.nom, False), (User.prenom, False), (User.id, False)],
+            'username': [(User.username, False), (User.id, False)],
+            'recent': [(User.id, True)],
+        },
+        filtres={
+            'role': lambda v: User.role == v,
+            'actif': lambda v: User.actif.is_(v in ('1', 'true', 'oui')),
+            'q': lambda v: or_(
+                User.username.ilike(f'%{v}%'), User.email.ilike(f'%{v}%'), User.nom.ilike(f'%{v}%')
+            ),
+        },
+    ),
+    'notes': Liste(
+        _requete_notes,
+        tris={
+            'filiere': [(Filiere.nom, False), (Specialite.nom, False), (Note.id, False)],
+            'recent': [(Note.id, True)],
+            'valeur': [(Note.valeur, True), (Note.id, True)],
+        },
+        filtres={
+            'filiere_id': lambda v: Etudiant.filiere_id == _entier(v),
+            'specialite_id': lambda v: Etudiant.specialite_id == _entier(v),
+            'matiere_id': lambda v: Note.matiere_id == _entier(v),
+            'etudiant_id': lambda v: Note.etudiant_id == _entier(v),
+        },
+    ),
+    'documents': Liste(
+        _requete_documents,
+        tris={
+            'recent': [(Document.date_upload, True), (Document.id, True)],
+            'titre': [(Document.titre, False), (Document.id, False)],
+        },
+        filtres={
+            'type_document': lambda v: Document.type_document == v,
+            'matiere_id': lambda v: Document.matiere_id == _entier(v),
+            'filiere_id': lambda v: Document.filiere_id == _entier(v),
+            'specialite_id': lambda v: Document.specialite_id == _entier(v),
+            'semestre_id': lambda v: Document.semestre_id == _entier(v),
+        },
+    ),
+}
+
+
+def lister(db, nom, args, avec_total=False):
+    """Page de la liste d'administration nom ; ValueError si les paramètres sont invalides"""
+    if nom not in LISTES:
+        raise LookupError(f'Liste inconnue : {nom}')
+    return LISTES[nom].page(db, args, avec_total=avec_total)
+
+
+__all__ = [
+    'Page',
+    'Liste',
+    'LISTES',
+    'encoder_curseur',
+    'decoder_curseur',
+    'paginer',
+    'lister',
+]
@@ -0,0 +1,210 @@
+"""
+Génération des relevés de notes d'une promotion entière
+Les données de la cohorte sont chargées en trois requêtes, puis le rendu
+(PDF ou Excel) de chaque étudiant est réparti sur un pool de processus.
+Le résultat est une archive ZIP ou un PDF unique.
+
+Chaque génération écrit dans un fichier qui lui est propre (reserver_sortie,
+puis un temporaire mkstemp renommé par-dessus) : deux demandes simultanées
+pour la même filière ne se marchent pas dessus. Un fichier réservé reste
+vide tant que la génération est en cours ; en cas d'échec, le message est
+écrit à côté (<sortie>.erreur).
+"""
+
+import glob
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.platypus import PageBreak
+from sqlalchemy import select
+
+from app.models import Etudiant, Filiere, Matiere, Specialite, User
+from .helpers import ExcelExporter, PDFExporter, lignes_releve
+from .moyennes import NotesColonnes, moyennes_matieres
+
+FORMATS = ('pdf', 'excel')
+PREFIXE_SORTIE = 'releves-'
+DUREE_CONSERVATION = 24 * 3600  # secondes
+DUREE_MAX_GENERATION = 3600  # au-delà, une sortie encore vide est considérée perdue
+
+
+def reserver_sortie(dossier, fusion=False):
+    """Crée (vide) un fichier de sortie unique dans dossier et retourne son chemin"""
+    descripteur, chemin = tempfile.mkstemp(
+        prefix=PREFIXE_SORTIE, suffix='.pdf' if fusion else '.zip', dir=dossier
+    )
+    os.close(descripteur)
+    return chemin
+
+
+def etat_sortie(chemin):
+    """('termine' | 'en_cours' | 'erreur', message d'erreur ou None)"""
+    try:
+        with open(f"{chemin}.erreur", encoding='utf-8') as f:
+            return 'erreur', f.read()
+    except FileNotFoundError:
+        pass
+    infos = os.stat(chemin)
+    if infos.st_size > 0:
+        return 'termine', None
+    if time.time() - infos.st_mtime > DUREE_MAX_GENERATION:
+        return 'erreur', "La génération a été interrompue."
+    return 'en_cours', None
+
+
+def nettoyer_sorties(dossier, age=DUREE_CONSERVATION):
+    """Supprime les sorties réservées (et leurs .erreur) plus anciennes que age secondes"""
+    limite = time.time() - age
+    for chemin in glob.glob(os.path.join(dossier, f"{PREFIXE_SORTIE}*")):
+        try:
+            if os.path.getmtime(chemin) < limite:
+                os.remove(chemin)
+        except FileNotFoundError:
+            pass
+
+
+def charger_cohorte(db, filiere_id, specialite_id=None):
+    """Relevés (voir donnees_releve) de tous les étudiants d'une filière"""
+    filiere = db.get(Filiere, filiere_id)
+    if filiere is None:
+        raise LookupError(f"Filière introuvable : {filiere_id}")
+
+    query = (
+        select(Etudiant.id, User.username, User.prenom, User.nom, Specialite.nom)
+        .join(User, Etudiant.user_id == User.id)
+        .join(Specialite, Etudiant.specialite_id == Specialite.id)
+        .where(Etudiant.filiere_id == filiere_id)
+        .order_by(User.nom, User.prenom)
+    )
+    if specialite_id:
+        query = query.where(Etudiant.specialite_id == specialite_id)
+    etudiants = db.execute(query).all()
+
+    matieres = db.execute(
+        select(Matiere.id, Matiere.nom, Matiere.code, Matiere.coefficient)
+        .where(Matiere.filiere_id == filiere_id)
+        .order_by(Matiere.id)
+    ).all()
+
+    par_etudiant = {}
+    if etudiants:
+        colonnes = NotesColonnes.from_query(db, etudiant_ids=[e[0] for e in etudiants])
+        for (etudiant_id, matiere_id), moyenne in moyennes_matieres(colonnes).items():
+            par_etudiant.setdefault(etudiant_id, {})[matiere_id] = moyenne
+
+    return [
+        {
+            'username': username,
+            'prenom': prenom,
+            'nom': nom,
+            'filiere': filiere.nom,
+            'specialite': specialite,
+            'lignes': lignes_releve(matieres, par_etudiant.get(etudiant_id, {})),
+        }
+        for etudiant_id, username, prenom, nom, specialite in etudiants
+    ]
+
+
+def rendre_releve(releve, format_releve):
+    """Rendu d'un relevé en octets ; exécuté dans les processus du pool"""
+    sortie = BytesIO()
+    if format_releve == 'pdf':
+        PDFExporter.document_releve(sortie).build(PDFExporter.elements_releve(releve))
+    else:
+        ExcelExporter.classeur_releve(releve).save(sortie)
+    return sortie.getvalue()
+
+
+def _pypdf2():
+    """Classes (PdfReader, PdfWriter) de PyPDF2, ou None s'il n'est pas installé"""
+    try:
+        from PyPDF2 import PdfReader, PdfWriter
+    except ImportError:
+        return None
+    return PdfReader, PdfWriter
+
+
+def _pdf_unique(releves, sortie, progression):
+    """Sans PyPDF2 : un seul document construit dans ce processus"""
+    elements = []
+    for i, releve in enumerate(releves, start=1):
+        if elements:
+            elements.append(PageBreak())
+        elements.extend(PDFExporter.elements_releve(releve))
+        if progression:
+            progression(i, len(releves))
+    PDFExporter.document_releve(sortie).build(elements)
+
+
+def generer_releves(db, filiere_id, sortie, format_releve='pdf', fusion=False,
+                    specialite_id=None, processus=None, progression=None):
+    """Écrit les relevés d'une filière dans sortie (ZIP, ou PDF unique si fusion)
+
+    progression(fait, total) est appelée après chaque étudiant. Retourne un
+    rapport : nombre d'étudiants, durée et étudiants par seconde.
+    """
+    if format_releve not in FORMATS:
+        raise ValueError(f"Format inconnu : {format_releve}")
+    if fusion and format_releve != 'pdf':
+        raise ValueError("La fusion n'est possible qu'en PDF")
+
+    debut = time.perf_counter()
+    releves = charger_cohorte(db, filiere_id, specialite_id)
+    total = len(releves)
+    processus = processus or os.cpu_count() or 1
+    lot = max(1, total // (processus * 4))
+    descripteur, temporaire = tempfile.mkstemp(
+        prefix=f".{os.path.basename(sortie)}-", suffix='.part', dir=os.path.dirname(os.path.abspath(sortie))
+    )
+    os.close(descripteur)
+
+    try:
+        if fusion and _pypdf2() is None:
+            _pdf_unique(releves, temporaire, progression)
+        elif fusion:
+            PdfReader, PdfWriter = _pypdf2()
+            writer = PdfWriter()
+            with ProcessPoolExecutor(max_workers=processus) as pool:
+                contenus = pool.map(rendre_releve, releves, [format_releve] * total, chunksize=lot)
+                for i, contenu in enumerate(contenus, start=1):
+                    for page in PdfReader(BytesIO(contenu)).pages:
+                        writer.add_page(page)
+                    if progression:
+                        progression(i, total)
+            with open(temporaire, 'wb') as f:
+                writer.write(f)
+        else:
+            extension = 'pdf' if format_releve == 'pdf' else 'xlsx'
+            with zipfile.ZipFile(temporaire, 'w', zipfile.ZIP_DEFLATED) as archive, \
+                    ProcessPoolExecutor(max_workers=processus) as pool:
+                contenus = pool.map(rendre_releve, releves, [format_releve] * total, chunksize=lot)
+                for i, (releve, contenu) in enumerate(zip(releves, contenus), start=1):
+                    archive.writestr(f"releve_{releve['username']}.{extension}", contenu)
+                    if progression:
+                        progression(i, total)
+        os.replace(temporaire, sortie)
+    finally:
+        if os.path.exists(temporaire):
+            os.remove(temporaire)
+
+    duree = time.perf_counter() - debut
+    return {
+        'etudiants': total,
+        'fichier': sortie,
+        'duree': duree,
+        'etudiants_par_seconde': total / duree if duree > 0 else 0.0,
+    }
+
+
+__all__ = [
+    'charger_cohorte',
+    'etat_sortie',
+    'generer_releves',
+    'nettoyer_sorties',
+    'rendre_releve',
+    'reserver_sortie',
+]
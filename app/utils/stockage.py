@@ -0,0 +1,396 @@
+"""
+Stockage des fichiers déposés : disque local, S3 (ou compatible) et hiérarchisé
+Les routes ne manipulent que des clés relatives (blobs/ab/cd/<sha256>) ;
+le backend décide où vivent les octets et comment ils sont livrés.
+
+- StockageLocal : fichiers sous un dossier (UPLOAD_FOLDER), livrés par
+  envoyer_fichier (Range, ETag, X-Accel-Redirect).
+- StockageS3 : bucket S3 ou service compatible (MinIO...) via boto3 ;
+  téléchargement par redirection vers une URL présignée, ou relayé en flux.
+- StockageHierarchise : S3 derrière un cache local borné ; les contenus
+  récemment lus restent sur le disque de l'instance, les moins récemment
+  utilisés sont évincés au-delà de la taille maximale ; un contenu plus
+  grand que le cache entier est lu directement sur S3.
+
+Le backend est choisi par la variable d'environnement STOCKAGE (local, s3,
+hierarchise) ; voir stockage_par_defaut().
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import quote
+
+from flask import Response, redirect
+
+from app import UPLOAD_FOLDER
+from .livraison import envoyer_fichier, DUREE_CACHE
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 n'est requis que pour STOCKAGE=s3 ou hierarchise
+    boto3 = None
+
+    class ClientError(Exception):
+        """Remplace botocore.exceptions.ClientError (client S3 fourni sans boto3)"""
+
+        def __init__(self, response, operation_name=None):
+            super().__init__(response)
+            self.response = response
+
+TAILLE_BLOC = 256 * 1024  # octets
+DUREE_URL = 300  # secondes de validité d'une URL présignée
+
+
+class StockageLocal:
+    """Fichiers rangés sous un dossier du disque"""
+
+    nom = 'local'
+
+    def __init__(self, racine=UPLOAD_FOLDER):
+        self.racine = os.path.abspath(racine)
+
+    def chemin(self, cle):
+        # Les chemins absolus antérieurs aux clés restent utilisables tels quels
+        return os.path.join(self.racine, cle)
+
+    def destination(self, cle):
+        """Chemin où écrire un dépôt avant recevoir() : l'emplacement définitif"""
+        return self.chemin(cle)
+
+    def recevoir(self, cle, chemin_local):
+        """Range le fichier chemin_local sous cle (déplacement, sans copie)"""
+        chemin = self.chemin(cle)
+        if os.path.abspath(chemin_local) == chemin:
+            return
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        if os.path.exists(chemin):
+            os.remove(chemin_local)
+            os.utime(chemin)
+        else:
+            os.replace(chemin_local, chemin)
+
+    def existe(self, cle):
+        return os.path.exists(self.chemin(cle))
+
+    def ouvrir(self, cle):
+        return open(self.chemin(cle), 'rb')
+
+    def supprimer(self, cle):
+        try:
+            os.remove(self.chemin(cle))
+        except FileNotFoundError:
+            pass
+
+    def lister(self, prefixe=''):
+        """(clé, taille, date de modification) des fichiers sous prefixe"""
+        for dossier, _, fichiers in os.walk(self.chemin(prefixe)):
+            for nom in fichiers:
+                chemin = os.path.join(dossier, nom)
+                infos = os.stat(chemin)
+                yield os.path.relpath(chemin, self.racine).replace(os.sep, '/'), infos.st_size, infos.st_mtime
+
+    def reponse(self, cle, nom):
+        """Réponse de téléchargement ; FileNotFoundError si le fichier a disparu"""
+        return envoyer_fichier(self.chemin(cle), nom)
+
+
+class StockageS3:
+    """Objets d'un bucket S3 ou compatible (endpoint_url pour MinIO)"""
+
+    nom = 's3'
+
+    def __init__(self, bucket, prefixe='', client=None, endpoint_url=None, url_signee=True,
+                 duree_url=DUREE_URL, dossier_transit=UPLOAD_FOLDER):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("boto3 est requis pour le stockage S3 (pip install boto3)")
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefixe = prefixe.strip('/') + '/' if prefixe.strip('/') else ''
+        self.url_signee = url_signee
+        self.duree_url = duree_url
+        self.dossier_transit = os.path.join(dossier_transit, '.transit')
+
+    def _objet(self, cle):
+        return self.prefixe + cle
+
+    def destination(self, cle):
+        """Fichier local de transit, unique par dépôt, envoyé puis supprimé par recevoir()"""
+        os.makedirs(self.dossier_transit, exist_ok=True)
+        return os.path.join(self.dossier_transit, f"{os.path.basename(cle)}.{uuid.uuid4().hex}")
+
+    def envoyer(self, cle, chemin_local):
+        """Copie chemin_local sous cle ; si le contenu y est déjà, rafraîchit sa date"""
+        if self.existe(cle):
+            self.toucher(cle)
+        else:
+            self.client.upload_file(chemin_local, self.bucket, self._objet(cle))
+
+    def toucher(self, cle):
+        """Remet LastModified à maintenant (copie de l'objet sur lui-même)
+
+        Équivalent d'os.utime pour le ramasse-miettes : un contenu de nouveau
+        référencé n'est pas supprimé pendant le délai de grâce.
+        """
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=self._objet(cle),
+            CopySource={'Bucket': self.bucket, 'Key': self._objet(cle)},
+            MetadataDirective='REPLACE',
+        )
+
+    def recevoir(self, cle, chemin_local):
+        """Envoie chemin_local sous cle puis supprime le fichier local"""
+        try:
+            self.envoyer(cle, chemin_local)
+        finally:
+            os.remove(chemin_local)
+
+    def _entete(self, cle):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._objet(cle))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(cle) from e
+            raise
+
+    def existe(self, cle):
+        try:
+            self._entete(cle)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def ouvrir(self, cle):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._objet(cle))['Body']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(cle) from e
+            raise
+
+    def taille(self, cle):
+        return self._entete(cle)['ContentLength']
+
+    def telecharger(self, cle, chemin_local):
+        """Copie l'objet cle dans chemin_local"""
+        self._entete(cle)
+        self.client.download_file(self.bucket, self._objet(cle), chemin_local)
+
+    def supprimer(self, cle):
+        self.client.delete_object(Bucket=self.bucket, Key=self._objet(cle))
+
+    def lister(self, prefixe=''):
+        pages = self.client.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket, Prefix=self._objet(prefixe)
+        )
+        for page in pages:
+            for objet in page.get('Contents', ()):
+                yield objet['Key'][len(self.prefixe):], objet['Size'], objet['LastModified'].timestamp()
+
+    def reponse(self, cle, nom):
+        """Redirection vers une URL présignée, ou contenu relayé en flux"""
+        disposition = f"attachment; filename*=UTF-8''{quote(nom)}"
+        if self.url_signee:
+            self._entete(cle)
+            url = self.client.generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': self.bucket,
+                    'Key': self._objet(cle),
+                    'ResponseContentDisposition': disposition,
+                },
+                ExpiresIn=self.duree_url,
+            )
+            reponse = redirect(url, code=302)
+            reponse.cache_control.private = True
+            reponse.cache_control.max_age = max(self.duree_url - 60, 0)
+            return reponse
+
+        entete = self._entete(cle)
+        corps = self.ouvrir(cle)
+        reponse = Response(corps.iter_chunks(TAILLE_BLOC), mimetype='application/octet-stream', direct_passthrough=True)
+        reponse.headers['Content-Disposition'] = disposition
+        reponse.headers['Content-Length'] = str(entete['ContentLength'])
+        if entete.get('ETag'):
+            reponse.headers['ETag'] = entete['ETag']
+        reponse.cache_control.private = True
+        reponse.cache_control.max_age = DUREE_CACHE
+        return reponse
+
+
+class StockageHierarchise:
+    """Stockage distant (S3) derrière un cache LRU sur le disque local"""
+
+    nom = 'hierarchise'
+
+    def __init__(self, distant, cache, taille_max):
+        self.distant = distant
+        self.cache = cache
+        self.taille_max = taille_max
+        self._verrou = threading.Lock()
+        self._servis = {}  # clé -> lectures en cours ; jamais évincée entre-temps
+
+    def destination(self, cle):
+        return self.cache.destination(cle)
+
+    def recevoir(self, cle, chemin_local):
+        """Envoie le contenu au stockage distant et en garde une copie en cache"""
+        self.cache.recevoir(cle, chemin_local)
+        self.distant.envoyer(cle, self.cache.chemin(cle))
+        self._evincer()
+
+    def existe(self, cle):
+        return self.cache.existe(cle) or self.distant.existe(cle)
+
+    def _reserver(self, cle, delta):
+        with self._verrou:
+            nombre = self._servis.get(cle, 0) + delta
+            if nombre:
+                self._servis[cle] = nombre
+            else:
+                del self._servis[cle]
+
+    def _rapatrier(self, cle):
+        """Chemin local de cle, téléchargé dans le cache au besoin
+
+        None si le contenu dépasse à lui seul taille_max : il est lu sur le
+        stockage distant sans passer par le cache.
+        """
+        chemin = self.cache.chemin(cle)
+        try:
+            # Ordre LRU porté par la date d'accès : la date de modification,
+            # dont envoyer_fichier tire ETag et Last-Modified, ne change pas
+            os.utime(chemin, ns=(time.time_ns(), os.stat(chemin).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        else:
+            return chemin
+        if self.distant.taille(cle) > self.taille_max:
+            return None
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        descripteur, temporaire = tempfile.mkstemp(prefix='.cache-', dir=os.path.dirname(chemin))
+        os.close(descripteur)
+        try:
+            self.distant.telecharger(cle, temporaire)
+            os.replace(temporaire, chemin)
+        except BaseException:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            raise
+        return chemin
+
+    def ouvrir(self, cle):
+        self._reserver(cle, 1)
+        try:
+            chemin = self._rapatrier(cle)
+            try:
+                fichier = open(chemin, 'rb') if chemin else self.distant.ouvrir(cle)
+            except FileNotFoundError:  # évincé par un autre processus
+                fichier = self.distant.ouvrir(cle)
+        finally:
+            self._reserver(cle, -1)
+        self._evincer(garder=cle)
+        return fichier
+
+    def supprimer(self, cle):
+        self.cache.supprimer(cle)
+        self.distant.supprimer(cle)
+
+    def lister(self, prefixe=''):
+        return self.distant.lister(prefixe)
+
+    def occupation(self):
+        return sum(taille for _, taille, _ in self.cache.lister())
+
+    def _evincer(self, garder=None):
+        """Supprime du cache les contenus les moins récemment utilisés au-delà de taille_max
+
+        Ne touche ni à garder, ni aux contenus en cours de lecture, ni aux
+        téléchargements pas encore terminés (.cache-*).
+        """
+        with self._verrou:
+            entrees = []
+            total = 0
+            for cle, taille, _ in self.cache.lister():
+                total += taille
+                if cle == garder or cle in self._servis or os.path.basename(cle).startswith('.cache-'):
+                    continue
+                try:
+                    entrees.append((os.stat(self.cache.chemin(cle)).st_atime, cle, taille))
+                except FileNotFoundError:  # évincé par un autre processus
+                    total -= taille
+            entrees.sort()
+            for _, cle, taille in entrees:
+                if total <= self.taille_max:
+                    break
+                self.cache.supprimer(cle)
+                total -= taille
+
+    def reponse(self, cle, nom):
+        """Réponse servie depuis le cache, sinon (contenu trop grand, évincé
+        par un autre processus) par le stockage distant"""
+        self._reserver(cle, 1)
+        try:
+            chemin = self._rapatrier(cle)
+            try:
+                reponse = self.cache.reponse(cle, nom) if chemin else None
+            except FileNotFoundError:
+                reponse = None
+        finally:
+            self._reserver(cle, -1)
+        if reponse is None:
+            return self.distant.reponse(cle, nom)
+        self._evincer(garder=cle)
+        return reponse
+
+
+_stockage = None
+
+
+def creer_stockage(type_stockage=None):
+    """Backend décrit par les variables d'environnement
+
+    STOCKAGE : local (défaut), s3 ou hierarchise ; S3_BUCKET, S3_PREFIXE,
+    S3_ENDPOINT_URL (service compatible), S3_URL_SIGNEE (1 par défaut : le
+    navigateur télécharge directement depuis S3), STOCKAGE_CACHE_MO (taille du
+    cache local du mode hiérarchisé, 2048 par défaut).
+    """
+    type_stockage = type_stockage or os.environ.get('STOCKAGE', 'local')
+    if type_stockage == 'local':
+        return StockageLocal()
+
+    distant = StockageS3(
+        os.environ['S3_BUCKET'],
+        prefixe=os.environ.get('S3_PREFIXE', ''),
+        endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+        url_signee=os.environ.get('S3_URL_SIGNEE', '1') == '1',
+    )
+    if type_stockage == 's3':
+        return distant
+    if type_stockage == 'hierarchise':
+        cache = StockageLocal(os.path.join(UPLOAD_FOLDER, 'cache'))
+        return StockageHierarchise(distant, cache, int(os.environ.get('STOCKAGE_CACHE_MO', 2048)) * 1024 * 1024)
+    raise ValueError(f"Stockage inconnu : {type_stockage}")
+
+
+def stockage_par_defaut():
+    """Backend partagé par les routes, créé au premier usage"""
+    global _stockage
+    if _stockage is None:
+        _stockage = creer_stockage()
+    return _stockage
+
+
+__all__ = [
+    'StockageLocal',
+    'StockageS3',
+    'StockageHierarchise',
+    'creer_stockage',
+    'stockage_par_defaut',
+]
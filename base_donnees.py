@@ -0,0 +1,168 @@
+"""
+Fabrique des moteurs SQLAlchemy partagée par app/, app.py et app-rds-template.py
+Chaque profil regroupe les réglages du pool de connexions et, pour SQLite,
+les pragmas appliqués à chaque nouvelle connexion. Le profil est choisi par
+la variable d'environnement DB_PROFIL, sinon d'après le dialecte de l'URL ;
+les tailles de pool peuvent être ajustées par DB_POOL_SIZE, DB_MAX_OVERFLOW,
+DB_POOL_RECYCLE et DB_POOL_TIMEOUT.
+
+Ce module ne dépend que de SQLAlchemy : il est importé par app.py sans
+charger le paquet app.
+"""
+
+import os
+import threading
+import weakref
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+PROFILS = {
+    # SQLite local : WAL pour que les lectures ne bloquent pas l'écriture,
+    # attente des verrous plutôt qu'une erreur "database is locked"
+    'dev': {
+        'pool': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30},
+        'connect_args': {'timeout': 15, 'check_same_thread': False},
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 15000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -16000,  # 16 Mo
+            'temp_store': 'MEMORY',
+        },
+    },
+    # RDS MySQL derrière gunicorn : pool par worker, connexions vérifiées et
+    # recyclées avant le wait_timeout du serveur, réutilisation LIFO pour
+    # laisser expirer les connexions en trop après un pic
+    'prod': {
+        'pool': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 10,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+            'pool_use_lifo': True,
+        },
+        'connect_args': {'connect_timeout': 10},
+        'pragmas': {},
+    },
+    # Processus de travail éphémères (exports, relevés) : une seule connexion
+    'worker': {
+        'pool': {'pool_size': 1, 'max_overflow': 0, 'pool_pre_ping': True},
+        'connect_args': {},
+        'pragmas': {'busy_timeout': 15000},
+    },
+}
+
+_ENV_POOL = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+}
+
+_compteurs = weakref.WeakKeyDictionary()
+
+
+def profil_par_defaut(url):
+    """DB_PROFIL s'il est défini, sinon 'dev' pour SQLite et 'prod' ailleurs"""
+    profil = os.environ.get('DB_PROFIL')
+    if profil:
+        return profil
+    return 'dev' if make_url(url).get_backend_name() == 'sqlite' else 'prod'
+
+
+def _appliquer_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def _pragmas(connexion_dbapi, _):
+        curseur = connexion_dbapi.cursor()
+        for nom, valeur in pragmas.items():
+            curseur.execute(f'PRAGMA {nom}={valeur}')
+        curseur.close()
+
+
+def _compter(engine):
+    compteurs = {'connexions': 0, 'emprunts': 0, 'restitutions': 0, 'invalidations': 0}
+    verrou = threading.Lock()
+
+    def incrementer(cle):
+        def _ecouteur(*_):
+            with verrou:
+                compteurs[cle] += 1
+        return _ecouteur
+
+    event.listen(engine, 'connect', incrementer('connexions'))
+    event.listen(engine, 'checkout', incrementer('emprunts'))
+    event.listen(engine, 'checkin', incrementer('restitutions'))
+    event.listen(engine, 'invalidate', incrementer('invalidations'))
+    _compteurs[engine] = compteurs
+
+
+def creer_moteur(url, profil=None, **options):
+    """Moteur SQLAlchemy configuré selon un profil ('dev', 'prod', 'worker')
+
+    options complète ou remplace les réglages du profil (echo, pool_size...).
+    """
+    profil = profil or profil_par_defaut(url)
+    if profil not in PROFILS:
+        raise ValueError(f"Profil de base de données inconnu : {profil}")
+    reglages = PROFILS[profil]
+    url = make_url(url)
+    sqlite = url.get_backend_name() == 'sqlite'
+    memoire = sqlite and url.database in (None, '', ':memory:')
+
+    arguments = {'echo': False}
+    if not memoire:
+        arguments.update(reglages['pool'])
+        arguments['poolclass'] = QueuePool
+        for variable, cle in _ENV_POOL.items():
+            if os.environ.get(variable):
+                arguments[cle] = int(os.environ[variable])
+    connect_args = {
+        cle: valeur for cle, valeur in reglages['connect_args'].items()
+        if sqlite == (cle in ('timeout', 'check_same_thread'))
+    }
+    if connect_args:
+        arguments['connect_args'] = connect_args
+    arguments.update(options)
+
+    engine = create_engine(url, **arguments)
+    pragmas = dict(reglages['pragmas'])
+    if sqlite and pragmas:
+        if memoire:
+            pragmas.pop('journal_mode', None)
+            pragmas.pop('mmap_size', None)
+        _appliquer_pragmas(engine, pragmas)
+    _compter(engine)
+    engine.profil = profil
+    return engine
+
+
+def statistiques_pool(engine):
+    """État du pool (taille, connexions prêtées...) et compteurs depuis le démarrage"""
+    pool = engine.pool
+    statistiques = {
+        'profil': getattr(engine, 'profil', None),
+        'dialecte': engine.dialect.name,
+        'pool': type(pool).__name__,
+        'etat': pool.status(),
+    }
+    if isinstance(pool, QueuePool):
+        statistiques.update({
+            'taille': pool.size(),
+            'disponibles': pool.checkedin(),
+            'pretees': pool.checkedout(),
+            'debordement': pool.overflow(),
+        })
+    statistiques.update(_compteurs.get(engine, {}))
+    return statistiques
+
+
+__all__ = [
+    'PROFILS',
+    'creer_moteur',
+    'profil_par_defaut',
+    'statistiques_pool',
+]
@@ -3,33 +3,110 @@ SupNum Share - Plateforme Académique Moderne 2026
 Design Professionnel avec Interface Responsive
 """
 
-from flask import Flask, render_template_string, redirect, url_for, session, flash, request, send_file
+from flask import (
+    Flask, render_template, redirect, url_for, session, flash, request, send_file, send_from_directory,
+    jsonify, g, abort,
+)
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+import click
 from werkzeug.utils import secure_filename
 from markupsafe import Markup
-import uuid
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 import os
+import hashlib
 
 from app import (
     engine, Session, Base, User, Filiere, Specialite, Semestre, 
     Matiere, Devoir, Etudiant, Note, Message, Document, UPLOAD_FOLDER,
-    MAX_UPLOAD_SIZE, ALLOWED_EXTENSIONS
+    EXPORT_FOLDER, MAX_UPLOAD_SIZE, ALLOWED_EXTENSIONS
+)
+from app.utils.moyenne_cache import (
+    ajouter_note, retirer_note, reconstruire_cache, reconstruire_si_vide, resume_etudiant,
+    version_notes,
+)
+from app.utils.import_notes import ErreurImport, lire_lignes, importer_notes
+from app.utils.releves import (
+    FORMATS as FORMATS_RELEVES, etat_sortie, generer_releves, nettoyer_sorties, reserver_sortie,
 )
+from app.utils.pagination import lister
+from app.utils.migrations import migrer, verifier_plans
+from app.utils.identite import CacheIdentites
+from app.utils.fragments import CacheFragments
+from app.utils.compteurs import CompteursTableauBord
+from app.utils.stockage import stockage_par_defaut
+from app.utils.mots_de_passe import Surcharge, VerificateurMotsDePasse
+from app.utils.depot import RequeteDepot
+from app.utils.blobs import collecter, deposer, importer_anciens
+from base_donnees import statistiques_pool
+from reponses_http import conditionnel, installer_compression
 
 app = Flask(__name__)
+app.request_class = RequeteDepot  # fichiers déposés écrits et hachés pendant la réception
 app.config['SECRET_KEY'] = 'supnum-share-secret-2026'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
 Base.metadata.create_all(engine)
+installer_compression(app)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Identités en cache quelques secondes ; invalider après toute modification d'un utilisateur
+identites = CacheIdentites()
+
+def utilisateur_courant():
+    """Identité de l'utilisateur connecté, résolue une seule fois par requête (flask.g)"""
+    if 'identite' not in g:
+        g.identite = None
+        if 'user_id' in session:
+            db = Session()
+            try:
+                g.identite = identites.obtenir(db, session['user_id'])
+            finally:
+                db.close()
+    return g.identite
+
+# Gabarits de pages compilés une seule fois (les sources sont des chaînes constantes)
+_gabarits = {}
+
+def rendre_page(source, **contexte):
+    """render_template_string sans recompilation : les données passent par le contexte"""
+    gabarit = _gabarits.get(source)
+    if gabarit is None:
+        gabarit = _gabarits[source] = app.jinja_env.from_string(source)
+    return render_template(gabarit, **contexte)
+
+# Fragments coûteux (tableaux de notes, matières par semestre), invalidés à chaque écriture
+fragments = CacheFragments()
+
+# Compteurs du tableau de bord admin : une requête, invalidés au commit des écritures concernées
+compteurs = CompteursTableauBord()
+compteurs.suivre(Session)
+
+# Vérifications de mots de passe dans un pool de processus borné
+verificateur = VerificateurMotsDePasse()
+
+def version_resultats():
+    """Version des pages de résultats de l'étudiant connecté, pour l'ETag"""
+    user = utilisateur_courant()
+    if user is None or not user.est_etudiant:
+        return None
+    db = Session()
+    try:
+        notes = version_notes(db, user.etudiant_id)
+        matieres = db.query(func.count(Matiere.id), func.max(Matiere.id)).filter_by(semestre_id=user.semestre_id).one()
+    finally:
+        db.close()
+    return notes, tuple(matieres), user.filiere_id, user.specialite_id, user.semestre_id
+
 def login_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        if 'user_id' not in session:
+        if utilisateur_courant() is None:
+            session.clear()
             flash('Veuillez vous connecter.', 'warning')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -40,58 +117,84 @@ def admin_required(f):
     def decorated(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('login'))
-        user = Session().query(User).filter_by(id=session['user_id']).first()
+        user = utilisateur_courant()
         if not user or not user.is_admin():
             flash('Accès refusé.', 'danger')
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated
 
-def get_navbar(active='', is_admin=False, username=''):
-    """Barre de navigation réutilisable"""
-    admin_items = """
-    <li class="nav-item"><a class="nav-link" href="/admin/dashboard"><i class="fas fa-chart-line"></i> Tableau de Bord</a></li>
-    <li class="nav-item"><a class="nav-link" href="/admin/utilisateurs"><i class="fas fa-users"></i> Utilisateurs</a></li>
-    <li class="nav-item"><a class="nav-link" href="/admin/matieres"><i class="fas fa-book"></i> Matières</a></li>
-    <li class="nav-item"><a class="nav-link" href="/admin/documents"><i class="fas fa-folder-open"></i> Cours/Archives</a></li>
-    <li class="nav-item"><a class="nav-link" href="/admin/notes"><i class="fas fa-chart-bar"></i> Notes</a></li>
-    """
-    student_items = """
-    <li class="nav-item"><a class="nav-link" href="/student/dashboard"><i class="fas fa-home"></i> Tableau de Bord</a></li>
-    <li class="nav-item"><a class="nav-link" href="/student/matieres"><i class="fas fa-book"></i> Mes Matières</a></li>
-    <li class="nav-item"><a class="nav-link" href="/student/resultats"><i class="fas fa-award"></i> Résultats</a></li>
-    <li class="nav-item"><a class="nav-link" href="/etudiant/ressources"><i class="fas fa-archive"></i> Ressources</a></li>
-    <li class="nav-item"><a class="nav-link" href="/etudiant/chat"><i class="fas fa-comments"></i> Communication</a></li>
+def pagination_nav(page, endpoint):
+    """Liens Précédent / Suivant d'une page keyset, en conservant tri et filtres"""
+    params = {k: v for k, v in request.args.to_dict().items() if k != 'curseur' and v != ''}
+
+    def lien(curseur, libelle):
+        if not curseur:
+            return f'<li class="page-item disabled"><span class="page-link">{libelle}</span></li>'
+        return f'<li class="page-item"><a class="page-link" href="{url_for(endpoint, curseur=curseur, **params)}">{libelle}</a></li>'
+
+    total = f'{page.total} élément(s)' if page.total is not None else ''
+    return f"""
+    <nav style="display: flex; justify-content: space-between; align-items: center; margin: 15px 0;">
+        <span style="color: #6b7a8a;">{total}</span>
+        <ul class="pagination" style="margin: 0;">{lien(page.precedent, 'Précédent')}{lien(page.suivant, 'Suivant')}</ul>
+    </nav>
     """
-    
-    items = admin_items if is_admin else student_items
-    
-    return Markup(f"""
-    <style>
-        body {{
-            background: #eef1f5 !important;
-            color: #2f3b4a;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }}
-        .container-fluid {{ padding: 24px 20px; max-width: 1200px; }}
-        .title {{ color: #3b4a5a !important; font-weight: 700; }}
-        .subtitle {{ color: #6b7a8a !important; }}
-        .card {{
-            background: #ffffff !important;
-            border: 1px solid #e2e8f0 !important;
-            border-radius: 8px !important;
-            box-shadow: 0 2px 6px rgba(0,0,0,0.06) !important;
-        }}
-        .table thead {{ background-color: #f5f7fb !important; }}
-        .btn-primary {{ background: #2f6fb2 !important; border: none !important; }}
-        .btn-success {{ background: #2f8f55 !important; border: none !important; }}
-        .btn-danger {{ background: #d14b4b !important; border: none !important; }}
-    </style>
-    <nav class="navbar navbar-expand-lg navbar-dark sticky-top" style="background: #2f6fb2; box-shadow: 0 2px 8px rgba(0,0,0,0.12);">
+
+# Feuille de style commune servie sous un nom à empreinte, mise en cache un an par les navigateurs
+DOSSIER_STATIC = os.path.join(app.root_path, 'static')
+ACTIFS = {}
+
+def actif_empreinte(chemin):
+    """URL /actifs/<nom>.<empreinte>.<ext> d'un fichier de static/ ; l'empreinte change avec le contenu"""
+    with open(os.path.join(DOSSIER_STATIC, chemin), 'rb') as f:
+        empreinte = hashlib.sha256(f.read()).hexdigest()[:12]
+    base, extension = os.path.splitext(os.path.basename(chemin))
+    nom = f"{base}.{empreinte}{extension}"
+    ACTIFS[nom] = chemin
+    return f"/actifs/{nom}"
+
+CSS_COMMUN = actif_empreinte('css/supnum.css')
+
+@app.route('/actifs/<nom>')
+def actif_statique(nom):
+    if nom not in ACTIFS:
+        abort(404)
+    reponse = send_from_directory(DOSSIER_STATIC, ACTIFS[nom], max_age=365 * 24 * 3600)
+    reponse.cache_control.public = True
+    reponse.cache_control.immutable = True
+    return reponse
+
+# Entrées de menu : (éléments actifs, lien, icône, libellé)
+MENU_ADMIN = [
+    (('admin_dashboard',), '/admin/dashboard', 'fa-chart-line', 'Tableau de Bord'),
+    (('utilisateurs', 'ajouter_utilisateur'), '/admin/utilisateurs', 'fa-users', 'Utilisateurs'),
+    (('matieres', 'ajouter_matiere'), '/admin/matieres', 'fa-book', 'Matières'),
+    (('documents',), '/admin/documents', 'fa-folder-open', 'Cours/Archives'),
+    (('notes',), '/admin/notes', 'fa-chart-bar', 'Notes'),
+]
+MENU_ETUDIANT = [
+    (('student_dashboard',), '/student/dashboard', 'fa-home', 'Tableau de Bord'),
+    (('matieres',), '/student/matieres', 'fa-book', 'Mes Matières'),
+    (('resultats',), '/student/resultats', 'fa-award', 'Résultats'),
+    (('ressources',), '/etudiant/ressources', 'fa-archive', 'Ressources'),
+    (('chat',), '/etudiant/chat', 'fa-comments', 'Communication'),
+]
+
+def construire_navbar(active, is_admin):
+    """Barre de navigation d'un (rôle, élément actif) : HTML avant et après le nom de l'utilisateur"""
+    items = ''.join(
+        f'<li class="nav-item"><a class="nav-link{" active" if active in actifs else ""}" href="{lien}">'
+        f'<i class="fas {icone}"></i> {libelle}</a></li>'
+        for actifs, lien, icone, libelle in (MENU_ADMIN if is_admin else MENU_ETUDIANT)
+    )
+    avant = f"""
+    <link rel="stylesheet" href="{CSS_COMMUN}">
+    <nav class="navbar navbar-expand-lg navbar-dark sticky-top navbar-supnum">
         <div class="container-fluid">
-            <a class="navbar-brand fw-bold" href="/" style="font-size: 22px; cursor: pointer; text-decoration: none;">
-                <i class="fas fa-graduation-cap" style="color: #3b82f6;"></i> 
-                <span style="color: #fff;">SupNum</span><span style="color: #3b82f6;">Share</span>
+            <a class="navbar-brand fw-bold" href="/">
+                <i class="fas fa-graduation-cap"></i>
+                <span class="marque-supnum">SupNum</span><span class="marque-share">Share</span>
             </a>
             <button class="navbar-toggler" type="button" data-bs-toggle="collapse" data-bs-target="#navbarNav">
                 <span class="navbar-toggler-icon"></span>
@@ -100,8 +203,9 @@ def get_navbar(active='', is_admin=False, username=''):
                 <ul class="navbar-nav ms-auto">
                     {items}
                     <li class="nav-item dropdown">
-                        <a class="nav-link dropdown-toggle" href="#" id="userDropdown" role="button" data-bs-toggle="dropdown">
-                            <i class="fas fa-user-circle"></i> {username}
+                        <a class="nav-link dropdown-toggle{' active' if active == 'profile' else ''}" href="#" id="userDropdown" role="button" data-bs-toggle="dropdown">
+                            <i class="fas fa-user-circle"></i> """
+    apres = """
                         </a>
                         <ul class="dropdown-menu dropdown-menu-end">
                             <li><a class="dropdown-item" href="/profile"><i class="fas fa-cog"></i> Profil</a></li>
@@ -113,27 +217,56 @@ def get_navbar(active='', is_admin=False, username=''):
             </div>
         </div>
     </nav>
-    """)
+    """
+    return Markup(avant), Markup(apres)
+
+# Précalculées au démarrage pour chaque élément de menu
+NAVBARS = {
+    (is_admin, active): construire_navbar(active, is_admin)
+    for is_admin, menu in ((True, MENU_ADMIN), (False, MENU_ETUDIANT))
+    for active in [''] + ['profile'] + [a for actifs, _, _, _ in menu for a in actifs]
+}
+
+def get_navbar(active='', is_admin=False, username=''):
+    """Barre de navigation réutilisable (le nom de l'utilisateur est échappé)"""
+    cle = (bool(is_admin), active)
+    if cle not in NAVBARS:
+        NAVBARS[cle] = construire_navbar(active, bool(is_admin))
+    avant, apres = NAVBARS[cle]
+    return avant + (username or '') + apres
 
 @app.route('/')
 def index():
-    if 'user_id' in session:
-        user = Session().query(User).filter_by(id=session['user_id']).first()
+    user = utilisateur_courant()
+    if user:
         return redirect(url_for('admin_dashboard' if user.is_admin() else 'student_dashboard'))
     return redirect(url_for('login'))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    statut = 200
     if request.method == 'POST':
-        user = Session().query(User).filter_by(username=request.form['username']).first()
-        if user and user.check_password(request.form['password']):
-            session['user_id'] = user.id
-            session['username'] = user.username
-            flash(f'Bienvenue {user.prenom}!', 'success')
-            return redirect(url_for('index'))
-        flash('⚠️ Identifiants invalides', 'danger')
+        db = Session()
+        try:
+            user = db.query(User).filter_by(username=request.form['username']).first()
+            correct, nouveau_hash = verificateur.verifier(user.password_hash if user else None, request.form['password'])
+            if correct:
+                if nouveau_hash:
+                    user.password_hash = nouveau_hash
+                    db.commit()
+                identites.invalider(user.id)
+                session['user_id'] = user.id
+                session['username'] = user.username
+                flash(f'Bienvenue {user.prenom}!', 'success')
+                return redirect(url_for('index'))
+            flash('⚠️ Identifiants invalides', 'danger')
+        except Surcharge:
+            statut = 503
+            flash('Trop de connexions en cours, réessayez dans quelques secondes.', 'warning')
+        finally:
+            db.close()
     
-    return render_template_string("""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -242,10 +375,12 @@ def login():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """)
+    """), statut, {'Retry-After': '5'} if statut == 503 else {}
 
 @app.route('/logout')
 def logout():
+    if 'user_id' in session:
+        identites.invalider(session['user_id'])
     session.clear()
     flash('Déconnecté avec succès.', 'info')
     return redirect(url_for('login'))
@@ -254,19 +389,14 @@ def logout():
 @admin_required
 def admin_dashboard():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
+    user = utilisateur_courant()
     
     # Créer les données de statistiques
     username = user.prenom
-    stats = {
-        'etudiants': db.query(User).filter_by(role='etudiant', actif=True).count(),
-        'matieres': db.query(Matiere).count(),
-        'admins': db.query(User).filter_by(role='admin', actif=True).count(),
-        'total': db.query(User).count()
-    }
+    stats = compteurs.obtenir(db)
     db.close()
     
-    return render_template_string("""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -399,6 +529,39 @@ def admin_dashboard():
                         </div>
                     </div>
                 </div>
+                <div class="col-md-4">
+                    <div class="stat-card">
+                        <div class="d-flex justify-content-between">
+                            <div>
+                                <p class="stat-label">Devoirs</p>
+                                <p class="stat-number">{{ stats['devoirs'] }}</p>
+                            </div>
+                            <div class="stat-icon blue"><i class="fas fa-tasks"></i></div>
+                        </div>
+                    </div>
+                </div>
+                <div class="col-md-4">
+                    <div class="stat-card">
+                        <div class="d-flex justify-content-between">
+                            <div>
+                                <p class="stat-label">Notes saisies</p>
+                                <p class="stat-number">{{ stats['notes'] }}</p>
+                            </div>
+                            <div class="stat-icon green"><i class="fas fa-pen"></i></div>
+                        </div>
+                    </div>
+                </div>
+                <div class="col-md-4">
+                    <div class="stat-card">
+                        <div class="d-flex justify-content-between">
+                            <div>
+                                <p class="stat-label">Moyenne générale</p>
+                                <p class="stat-number">{{ stats['moyenne_generale'] if stats['moyenne_generale'] is not none else '-' }}</p>
+                            </div>
+                            <div class="stat-icon purple"><i class="fas fa-chart-line"></i></div>
+                        </div>
+                    </div>
+                </div>
             </div>
 
             <div class="action-card">
@@ -429,10 +592,11 @@ def admin_dashboard():
 
 @app.route('/student/dashboard')
 @login_required
+@conditionnel(version_resultats)
 def student_dashboard():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
+    user = utilisateur_courant()
+    etudiant = db.get(Etudiant, user.etudiant_id) if user.est_etudiant else None
     
     # Charger les relations avant de fermer la session
     if etudiant:
@@ -441,17 +605,14 @@ def student_dashboard():
         semestre_nom = etudiant.semestre.nom if etudiant.semestre else "—"
         numero_inscription = etudiant.numero_inscription
         matieres = db.query(Matiere).filter_by(semestre_id=etudiant.semestre_id).all()
-        notes = db.query(Note).filter_by(etudiant_id=etudiant.id).all()
+        nb_notes, moyenne = resume_etudiant(db, etudiant.id)
     else:
         filiere_nom = specialite_code = semestre_nom = numero_inscription = "—"
         matieres = []
-        notes = []
-    
-    moyenne = round(sum(n.valeur for n in notes) / len(notes), 2) if notes else 0
+        nb_notes, moyenne = 0, 0
     
     # Créer des copie des données avant de fermer
     matieres_data = [(m.nom, m.code, m.coefficient) for m in matieres]
-    notes_data = [(n.valeur, n.matiere.nom if n.matiere else "—") for n in notes]
     
     db.close()
     
@@ -467,7 +628,7 @@ def student_dashboard():
     </div>
     """ for nom, code, coef in matieres_data])
     
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -476,19 +637,19 @@ def student_dashboard():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; font-family: 'Segoe UI'; }}
-            .container-fluid {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 10px; }}
-            .subtitle {{ color: #cbd5e1; font-size: 14px; margin-bottom: 30px; }}
-            .profile-card {{
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; font-family: 'Segoe UI'; }
+            .container-fluid { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 10px; }
+            .subtitle { color: #cbd5e1; font-size: 14px; margin-bottom: 30px; }
+            .profile-card {
                 background: white;
                 border-radius: 12px;
                 padding: 25px;
                 box-shadow: 0 4px 15px rgba(0,0,0,0.1);
                 border-top: 5px solid #3b82f6;
                 margin-bottom: 25px;
-            }}
-            .profile-avatar {{
+            }
+            .profile-avatar {
                 width: 80px;
                 height: 80px;
                 border-radius: 50%;
@@ -498,15 +659,15 @@ def student_dashboard():
                 justify-content: center;
                 color: white;
                 font-size: 40px;
-            }}
-            .footer {{ text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }}
+            }
+            .footer { text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <main class="container-fluid">
             <h1 class="title"><i class="fas fa-home"></i> Tableau de Bord</h1>
-            <p class="subtitle">Bienvenue {user.prenom}, consultez vos cours et résultats</p>
+            <p class="subtitle">Bienvenue {{ user.prenom }}, consultez vos cours et résultats</p>
 
             <div class="profile-card">
                 <div style="display: flex; gap: 20px; align-items: center;">
@@ -515,13 +676,13 @@ def student_dashboard():
                     </div>
                     <div>
                         <h5 style="color: #1f2937; font-weight: 700; margin-bottom: 5px;">
-                            {user.prenom} {user.nom}
+                            {{ user.prenom }} {{ user.nom }}
                         </h5>
-                        <p style="color: #6b7280; margin-bottom: 8px;"><i class="fas fa-id-badge"></i> #{numero_inscription}</p>
+                        <p style="color: #6b7280; margin-bottom: 8px;"><i class="fas fa-id-badge"></i> #{{ numero_inscription }}</p>
                         <p style="color: #6b7280; margin-bottom: 0;">
-                            <strong>{filiere_nom}</strong> • 
-                            <strong>{specialite_code}</strong> • 
-                            <strong>{semestre_nom}</strong>
+                            <strong>{{ filiere_nom }}</strong> • 
+                            <strong>{{ specialite_code }}</strong> • 
+                            <strong>{{ semestre_nom }}</strong>
                         </p>
                     </div>
                 </div>
@@ -530,9 +691,9 @@ def student_dashboard():
             <div class="row g-4">
                 <div class="col-md-8">
                     <h6 style="color: white; font-weight: 700; margin-bottom: 15px;">
-                        <i class="fas fa-book"></i> Mes Matières ({len(matieres_data)})
+                        <i class="fas fa-book"></i> Mes Matières ({{ matieres_data|length }})
                     </h6>
-                    {matieres_html if matieres_html else '<p style="color: #cbd5e1;">Aucune matière assignée.</p>'}
+                    {% if matieres_html %}{{ matieres_html|safe }}{% else %}<p style="color: #cbd5e1;">Aucune matière assignée.</p>{% endif %}
                 </div>
 
                 <div class="col-md-4">
@@ -541,11 +702,11 @@ def student_dashboard():
                     </h6>
                     <div style="background: white; border-radius: 10px; padding: 20px; box-shadow: 0 2px 10px rgba(0,0,0,0.08);">
                         <div style="text-align: center; padding: 15px 0; border-bottom: 1px solid #e5e7eb;">
-                            <div style="font-size: 32px; font-weight: 700; color: #3b82f6;">{len(notes_data)}</div>
+                            <div style="font-size: 32px; font-weight: 700; color: #3b82f6;">{{ nb_notes }}</div>
                             <div style="color: #6b7280; font-size: 14px;">Notes Enregistrées</div>
                         </div>
                         <div style="text-align: center; padding: 15px 0;">
-                            <div style="font-size: 28px; font-weight: 700; color: #10b981; margin-bottom: 5px;">{moyenne}</div>
+                            <div style="font-size: 28px; font-weight: 700; color: #10b981; margin-bottom: 5px;">{{ moyenne }}</div>
                             <div style="color: #6b7280; font-size: 14px;">Moyenne Générale</div>
                         </div>
                     </div>
@@ -558,25 +719,38 @@ def student_dashboard():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('student_dashboard', False, session.get('username')))
+    """,
+        user=user,
+        numero_inscription=numero_inscription,
+        filiere_nom=filiere_nom,
+        specialite_code=specialite_code,
+        semestre_nom=semestre_nom,
+        matieres_data=matieres_data,
+        matieres_html=matieres_html,
+        nb_notes=nb_notes,
+        moyenne=moyenne,
+        navbar=get_navbar('student_dashboard', False, session.get('username')),
+    )
 
 @app.route('/student/matieres')
 @login_required
 def student_matieres():
-    db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
+    user = utilisateur_courant()
 
-    if not etudiant:
-        db.close()
+    if not user.est_etudiant:
         return redirect(url_for('student_dashboard'))
-
-    matieres = db.query(Matiere).filter_by(semestre_id=etudiant.semestre_id).all()
-    matieres_data = [(m.nom, m.code, m.coefficient, m.seuil_validation) for m in matieres]
     username = user.prenom
-    db.close()
 
-    matieres_html = ''.join([f"""
+    def calcul():
+        db = Session()
+        try:
+            matieres_data = db.execute(
+                select(Matiere.nom, Matiere.code, Matiere.coefficient, Matiere.seuil_validation)
+                .where(Matiere.semestre_id == user.semestre_id)
+            ).all()
+        finally:
+            db.close()
+        return ''.join([f"""
     <tr>
         <td><strong>{nom}</strong></td>
         <td><span class="badge bg-light text-dark">{code}</span></td>
@@ -585,7 +759,9 @@ def student_matieres():
     </tr>
     """ for nom, code, coeff, seuil in matieres_data])
 
-    return render_template_string(f"""
+    matieres_html = fragments.obtenir('matieres', ('semestre', user.semestre_id), calcul)
+
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -594,14 +770,14 @@ def student_matieres():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container-fluid {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container-fluid { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <main class="container-fluid">
             <h1 class="title"><i class="fas fa-book"></i> Mes Matières du Semestre</h1>
 
@@ -617,7 +793,7 @@ def student_matieres():
                             </tr>
                         </thead>
                         <tbody>
-                            {matieres_html if matieres_html else '<tr><td colspan="4" style="text-align: center; color: #6b7280;">Aucune matière</td></tr>'}
+                            {% if matieres_html %}{{ matieres_html|safe }}{% else %}<tr><td colspan="4" style="text-align: center; color: #6b7280;">Aucune matière</td></tr>{% endif %}
                         </tbody>
                     </table>
                 </div>
@@ -626,15 +802,15 @@ def student_matieres():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('matieres', False, username))
+    """, matieres_html=matieres_html, navbar=get_navbar('matieres', False, username))
 
 @app.route('/student/resultats')
 @login_required
+@conditionnel(version_resultats)
 def student_resultats():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
-    notes = db.query(Note).filter_by(etudiant_id=etudiant.id).all() if etudiant else []
+    user = utilisateur_courant()
+    notes = db.query(Note).filter_by(etudiant_id=user.etudiant_id).all() if user.est_etudiant else []
     
     # Charger les données avant de fermer la session
     notes_data = []
@@ -662,7 +838,7 @@ def student_resultats():
     </div>
     """ for n in notes_data])
     
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html> 
     <html lang="fr">
     <head>
@@ -671,23 +847,23 @@ def student_resultats():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; font-family: 'Segoe UI'; }}
-            .container-fluid {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 10px; }}
-            .subtitle {{ color: #cbd5e1; font-size: 14px; margin-bottom: 30px; }}
-            .footer {{ text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; font-family: 'Segoe UI'; }
+            .container-fluid { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 10px; }
+            .subtitle { color: #cbd5e1; font-size: 14px; margin-bottom: 30px; }
+            .footer { text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <main class="container-fluid">
             <h1 class="title"><i class="fas fa-award"></i> Mes Résultats</h1>
             <p class="subtitle">Consultez vos notes et résultats académiques</p>
 
             <div class="row">
                 <div class="col-md-12">
-                    {notes_html}
-                    {'<p style="color: #cbd5e1; text-align: center; padding: 40px;">Aucune note enregistrée pour le moment.</p>' if not notes_data else ''}
+                    {{ notes_html|safe }}
+                    {% if not notes_data %}<p style="color: #cbd5e1; text-align: center; padding: 40px;">Aucune note enregistrée pour le moment.</p>{% endif %}
                 </div>
             </div>
         </main>
@@ -697,15 +873,21 @@ def student_resultats():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('resultats', False, session.get('username')))
+    """, notes_html=notes_html, notes_data=notes_data, navbar=get_navbar('resultats', False, session.get('username')))
 
 @app.route('/admin/utilisateurs')
 @admin_required
 def admin_utilisateurs():
     db = Session()
-    users = db.query(User).all()
-    # Load all data BEFORE closing session
-    users_data = [(u.username, u.email, u.prenom, u.nom, u.role, u.actif) for u in users]
+    try:
+        page = lister(db, 'utilisateurs', request.args, avec_total=True)
+    except ValueError as e:
+        db.close()
+        flash(f'Erreur: {str(e)}', 'danger')
+        return redirect(url_for('admin_utilisateurs'))
+    users_data = [
+        (u['username'], u['email'], u['prenom'], u['nom'], u['role'], u['actif']) for u in page.lignes
+    ]
     db.close()
     
     users_html = ''.join([f"""
@@ -718,7 +900,7 @@ def admin_utilisateurs():
     </tr>
     """ for username, email, prenom, nom, role, actif in users_data])
     
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -727,17 +909,17 @@ def admin_utilisateurs():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container-fluid {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }}
-            .btn-primary {{ background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none; }}
-            .btn-primary:hover {{ color: white; }}
-            .footer {{ text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container-fluid { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
+            .btn-primary { background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none; }
+            .btn-primary:hover { color: white; }
+            .footer { text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <main class="container-fluid">
             <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px;">
                 <h1 class="title"><i class="fas fa-users"></i> Gestion des Utilisateurs</h1>
@@ -757,9 +939,10 @@ def admin_utilisateurs():
                             </tr>
                         </thead>
                         <tbody>
-                            {users_html}
+                            {{ users_html|safe }}
                         </tbody>
                     </table>
+                    {{ pagination_html|safe }}
                 </div>
             </div>
         </main>
@@ -769,7 +952,11 @@ def admin_utilisateurs():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('utilisateurs', True, session.get('username')))
+    """,
+        users_html=users_html,
+        pagination_html=pagination_nav(page, 'admin_utilisateurs'),
+        navbar=get_navbar('utilisateurs', True, session.get('username')),
+    )
 
 @app.route('/admin/utilisateur/ajouter', methods=['GET', 'POST'])
 @admin_required
@@ -800,6 +987,7 @@ def admin_ajouter_utilisateur():
                 db.add(etudiant)
                 db.commit()
             
+            identites.invalider(user.id)
             db.close()
             flash(f'✓ Utilisateur {user.username} créé avec succès!', 'success')
             return redirect(url_for('admin_utilisateurs'))
@@ -817,7 +1005,7 @@ def admin_ajouter_utilisateur():
     semestres_data = [(s.id, s.nom) for s in semestres]
     db.close()
     
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -826,17 +1014,17 @@ def admin_ajouter_utilisateur():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }}
-            .btn-primary {{ background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none; }}
-            .btn-primary:hover {{ color: white; }}
-            .footer {{ text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
+            .btn-primary { background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none; }
+            .btn-primary:hover { color: white; }
+            .footer { text-align: center; color: #94a3b8; padding: 30px; border-top: 1px solid #334155; margin-top: 40px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <div class="container" style="max-width: 600px;">
             <h1 class="title"><i class="fas fa-user-plus"></i> Ajouter Utilisateur</h1>
 
@@ -876,21 +1064,21 @@ def admin_ajouter_utilisateur():
                                 <label class="form-label">Filière</label>
                                 <select class="form-control" name="filiere_id">
                                     <option>-- Sélectionner --</option>
-                                    {''.join([f'<option value="{fid}">{fname}</option>' for fid, fname in filieres_data])}
+                                    {% for fid, fname in filieres_data %}<option value="{{ fid }}">{{ fname }}</option>{% endfor %}
                                 </select>
                             </div>
                             <div class="mb-3">
                                 <label class="form-label">Spécialité</label>
                                 <select class="form-control" name="specialite_id">
                                     <option>-- Sélectionner --</option>
-                                    {''.join([f'<option value="{sid}">{snom}</option>' for sid, snom in specialites_data])}
+                                    {% for sid, snom in specialites_data %}<option value="{{ sid }}">{{ snom }}</option>{% endfor %}
                                 </select>
                             </div>
                             <div class="mb-3">
                                 <label class="form-label">Semestre</label>
                                 <select class="form-control" name="semestre_id">
                                     <option>-- Sélectionner --</option>
-                                    {''.join([f'<option value="{sid}">{snom}</option>' for sid, snom in semestres_data])}
+                                    {% for sid, snom in semestres_data %}<option value="{{ sid }}">{{ snom }}</option>{% endfor %}
                                 </select>
                             </div>
                             <div class="mb-3">
@@ -908,35 +1096,31 @@ def admin_ajouter_utilisateur():
         </div>
 
         <script>
-            function toggleStudentFields() {{
+            function toggleStudentFields() {
                 document.getElementById('studentFields').style.display = 
                     document.getElementById('role').value === 'etudiant' ? 'block' : 'none';
-            }}
+            }
         </script>
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('ajouter_utilisateur', True, session.get('username')))
-
-@app.route('/admin/matieres')
-@admin_required
-def admin_matieres():
-    db = Session()
-    semestres = db.query(Semestre).order_by(Semestre.numero).all()
-    semestres_data = []
-    for semestre in semestres:
-        matieres = (
-            db.query(Matiere)
-            .filter_by(semestre_id=semestre.id)
-            .order_by(Matiere.nom)
-            .all()
-        )
-        matieres_rows = [(m.code, m.nom, m.coefficient, m.seuil_validation) for m in matieres]
-        semestres_data.append((semestre.nom, matieres_rows))
+    """,
+        filieres_data=filieres_data,
+        specialites_data=specialites_data,
+        semestres_data=semestres_data,
+        navbar=get_navbar('ajouter_utilisateur', True, session.get('username')),
+    )
 
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    username = user.prenom if user else ''
-    db.close()
+def tableaux_semestres(db):
+    """Tableaux des matières de chaque semestre (une requête pour toutes les matières)"""
+    semestres = db.execute(select(Semestre.id, Semestre.nom).order_by(Semestre.numero)).all()
+    par_semestre = {}
+    for semestre_id, code, nom, coefficient, seuil in db.execute(
+        select(Matiere.semestre_id, Matiere.code, Matiere.nom, Matiere.coefficient, Matiere.seuil_validation)
+        .order_by(Matiere.nom)
+    ):
+        par_semestre.setdefault(semestre_id, []).append((code, nom, coefficient, seuil))
+    semestres_data = [(semestre_nom, par_semestre.get(semestre_id, [])) for semestre_id, semestre_nom in semestres]
 
     semestres_html = ""
     for semestre_nom, matieres_rows in semestres_data:
@@ -972,8 +1156,24 @@ def admin_matieres():
             </div>
         </div>
         """
+    return semestres_html
+
+@app.route('/admin/matieres')
+@admin_required
+def admin_matieres():
+    user = utilisateur_courant()
+    username = user.prenom if user else ''
+
+    def calcul():
+        db = Session()
+        try:
+            return tableaux_semestres(db)
+        finally:
+            db.close()
+
+    semestres_html = fragments.obtenir('matieres', 'admin', calcul)
 
-    return render_template_string("""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -1027,6 +1227,7 @@ def admin_ajouter_matiere():
             db.add(matiere)
             db.commit()
             db.close()
+            fragments.invalider('matieres', 'notes')
             flash('✓ Matière ajoutée avec succès!', 'success')
             return redirect(url_for('admin_matieres'))
         except Exception as e:
@@ -1043,7 +1244,7 @@ def admin_ajouter_matiere():
     specialites_data = [(s.id, s.nom) for s in specialites]
     db.close()
     
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -1052,16 +1253,16 @@ def admin_ajouter_matiere():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }}
-            .btn-success {{ background: linear-gradient(135deg, #10b981 0%, #059669 100%); border: none; }}
-            .btn-success:hover {{ color: white; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
+            .btn-success { background: linear-gradient(135deg, #10b981 0%, #059669 100%); border: none; }
+            .btn-success:hover { color: white; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <div class="container" style="max-width: 600px;">
             <h1 class="title"><i class="fas fa-plus"></i> Ajouter Matière</h1>
 
@@ -1084,21 +1285,21 @@ def admin_ajouter_matiere():
                             <label class="form-label">Semestre</label>
                             <select class="form-control" name="semestre_id" required>
                                 <option>-- Sélectionner --</option>
-                                {''.join([f'<option value="{sid}">{snom}</option>' for sid, snom in semestres_data])}
+                                {% for sid, snom in semestres_data %}<option value="{{ sid }}">{{ snom }}</option>{% endfor %}
                             </select>
                         </div>
                         <div class="mb-3">
                             <label class="form-label">Filière</label>
                             <select class="form-control" name="filiere_id" required>
                                 <option>-- Sélectionner --</option>
-                                {''.join([f'<option value="{fid}">{fname}</option>' for fid, fname in filieres_data])}
+                                {% for fid, fname in filieres_data %}<option value="{{ fid }}">{{ fname }}</option>{% endfor %}
                             </select>
                         </div>
                         <div class="mb-3">
                             <label class="form-label">Spécialité</label>
                             <select class="form-control" name="specialite_id" required>
                                 <option>-- Sélectionner --</option>
-                                {''.join([f'<option value="{sid}">{snom}</option>' for sid, snom in specialites_data])}
+                                {% for sid, snom in specialites_data %}<option value="{{ sid }}">{{ snom }}</option>{% endfor %}
                             </select>
                         </div>
                         <div class="mb-3">
@@ -1115,52 +1316,27 @@ def admin_ajouter_matiere():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('ajouter_matiere', True, session.get('username')))
-
-@app.route('/admin/notes', methods=['GET', 'POST'])
-@admin_required
-def admin_notes():
-    db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    username = user.prenom if user else ''
-
-    if request.method == 'POST':
-        try:
-            note = Note(
-                valeur=float(request.form.get('valeur')),
-                etudiant_id=int(request.form.get('etudiant_id')),
-                matiere_id=int(request.form.get('matiere_id')),
-                devoir_id=int(request.form.get('devoir_id')) if request.form.get('devoir_id') else None
-            )
-            db.add(note)
-            db.commit()
-            flash('Note ajoutée.', 'success')
-        except Exception as e:
-            db.rollback()
-            flash(f'Erreur: {str(e)}', 'danger')
+    """,
+        semestres_data=semestres_data,
+        filieres_data=filieres_data,
+        specialites_data=specialites_data,
+        navbar=get_navbar('ajouter_matiere', True, session.get('username')),
+    )
 
-    etudiants = db.query(Etudiant).all()
-    matieres = db.query(Matiere).all()
-    devoirs = db.query(Devoir).all()
-    notes = db.query(Note).all()
-
-    etudiants_data = [
-        (e.id, f"{e.user.prenom} {e.user.nom} ({e.numero_inscription})")
-        for e in etudiants
-    ]
-    matieres_data = [(m.id, f"{m.nom} ({m.code})") for m in matieres]
-    devoirs_data = [(d.id, d.nom) for d in devoirs]
+def tables_notes(db, args):
+    """Tableaux des notes par filière et spécialité, et liens de pagination ; ValueError si args invalides"""
+    # Une seule requête jointe pour la page affichée (pagination par clé)
+    page = lister(db, 'notes', args, avec_total=True)
 
     notes_rows = []
-    for n in notes:
-        etu = n.etudiant
-        filiere = etu.filiere.nom if etu and etu.filiere else '—'
-        specialite = etu.specialite.nom if etu and etu.specialite else '—'
-        etu_nom = f"{etu.user.prenom} {etu.user.nom}" if etu and etu.user else '—'
-        matiere_nom = n.matiere.nom if n.matiere else '—'
-        devoir_nom = n.devoir.nom if n.devoir else '—'
-        date_note = n.date_creation.strftime('%d/%m/%Y') if n.date_creation else '—'
-        notes_rows.append((filiere, specialite, etu_nom, matiere_nom, devoir_nom, n.valeur, date_note, n.id))
+    for n in page.lignes:
+        date_note = n['date_creation'].strftime('%d/%m/%Y') if n['date_creation'] else '—'
+        notes_rows.append((
+            n['filiere'], n['specialite'], f"{n['prenom']} {n['nom']}", n['matiere'], n['devoir'] or '—',
+            n['valeur'], date_note, n['id']
+        ))
+
+    pagination_html = pagination_nav(page, 'admin_notes')
 
     grouped = {}
     for row in notes_rows:
@@ -1214,70 +1390,319 @@ def admin_notes():
     else:
         sections_html = "<div class=\"card\"><div class=\"card-body\"><p>Aucune note enregistrée.</p></div></div>"
 
+    return sections_html, pagination_html
+
+@app.route('/admin/notes', methods=['GET', 'POST'])
+@admin_required
+def admin_notes():
+    db = Session()
+    user = utilisateur_courant()
+    username = user.prenom if user else ''
+
+    if request.method == 'POST':
+        try:
+            note = Note(
+                valeur=float(request.form.get('valeur')),
+                etudiant_id=int(request.form.get('etudiant_id')),
+                matiere_id=int(request.form.get('matiere_id')),
+                devoir_id=int(request.form.get('devoir_id')) if request.form.get('devoir_id') else None
+            )
+            db.add(note)
+            ajouter_note(db, note)
+            db.commit()
+            fragments.invalider('notes')
+            flash('Note ajoutée.', 'success')
+        except IntegrityError:
+            db.rollback()
+            flash('Cet étudiant a déjà une note pour ce devoir.', 'danger')
+        except Exception as e:
+            db.rollback()
+            flash(f'Erreur: {str(e)}', 'danger')
+
+    filiere_id = request.args.get('filiere_id', type=int)
+    specialite_id = request.args.get('specialite_id', type=int)
+    matiere_id = request.args.get('matiere_id', type=int)
+
+    # Listes des formulaires : projections, sans chargement d'objets
+    etudiants_data = [
+        (eid, f"{prenom} {nom} ({numero})")
+        for eid, prenom, nom, numero in db.execute(
+            select(Etudiant.id, User.prenom, User.nom, Etudiant.numero_inscription)
+            .join(User, Etudiant.user_id == User.id)
+            .order_by(User.nom, User.prenom)
+        )
+    ]
+    matieres_data = [
+        (mid, f"{nom} ({code})")
+        for mid, nom, code in db.execute(select(Matiere.id, Matiere.nom, Matiere.code).order_by(Matiere.nom))
+    ]
+    devoirs_data = db.execute(select(Devoir.id, Devoir.nom).order_by(Devoir.nom)).all()
+    filieres_data = db.execute(select(Filiere.id, Filiere.nom).order_by(Filiere.nom)).all()
+    specialites_data = db.execute(select(Specialite.id, Specialite.nom).order_by(Specialite.nom)).all()
+
+    # Tableaux par filière de la page affichée, mis en cache par paramètres de requête
+    cle = tuple(sorted(request.args.items(multi=True)))
+    try:
+        sections_html, pagination_html = fragments.obtenir('notes', cle, lambda: tables_notes(db, request.args))
+    except ValueError as e:
+        db.close()
+        flash(f'Erreur: {str(e)}', 'danger')
+        return redirect(url_for('admin_notes'))
+
     db.close()
 
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
-    <html lang=\"fr\">
+    <html lang="fr">
     <head>
-        <meta charset=\"UTF-8\">
+        <meta charset="UTF-8">
         <title>Gestion des Notes</title>
-        <link href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css\" rel=\"stylesheet\">
-        <link rel=\"stylesheet\" href=\"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css\">
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: #eef1f5; min-height: 100vh; }}
-            .container-fluid {{ padding: 24px 20px; max-width: 1200px; }}
-            .title {{ color: #3b4a5a; font-weight: 700; font-size: 26px; margin-bottom: 20px; }}
-            .card {{ background: white; border-radius: 8px; border: 1px solid #e2e8f0; box-shadow: 0 2px 6px rgba(0,0,0,0.06); }}
+            body { background: #eef1f5; min-height: 100vh; }
+            .container-fluid { padding: 24px 20px; max-width: 1200px; }
+            .title { color: #3b4a5a; font-weight: 700; font-size: 26px; margin-bottom: 20px; }
+            .card { background: white; border-radius: 8px; border: 1px solid #e2e8f0; box-shadow: 0 2px 6px rgba(0,0,0,0.06); }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
-        <main class=\"container-fluid\">
-            <h1 class=\"title\"><i class=\"fas fa-chart-bar\"></i> Gestion des Notes</h1>
+        {{ navbar }}
+        <main class="container-fluid">
+            <h1 class="title"><i class="fas fa-chart-bar"></i> Gestion des Notes</h1>
 
-            <div class=\"card\" style=\"margin-bottom: 20px;\">
-                <div class=\"card-body\">
-                    <h5 style=\"margin-bottom: 15px;\">Ajouter une note</h5>
-                    <form method=\"POST\">
-                        <div class=\"row g-3\">
-                            <div class=\"col-md-3\">
-                                <label class=\"form-label\">Étudiant</label>
-                                <select class=\"form-control\" name=\"etudiant_id\" required>
-                                    {''.join([f'<option value="{eid}">{ename}</option>' for eid, ename in etudiants_data])}
+            <div class="card" style="margin-bottom: 20px;">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Ajouter une note</h5>
+                    <form method="POST">
+                        <div class="row g-3">
+                            <div class="col-md-3">
+                                <label class="form-label">Étudiant</label>
+                                <select class="form-control" name="etudiant_id" required>
+                                    {% for eid, ename in etudiants_data %}<option value="{{ eid }}">{{ ename }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-3\">
-                                <label class=\"form-label\">Matière</label>
-                                <select class=\"form-control\" name=\"matiere_id\" required>
-                                    {''.join([f'<option value="{mid}">{mname}</option>' for mid, mname in matieres_data])}
+                            <div class="col-md-3">
+                                <label class="form-label">Matière</label>
+                                <select class="form-control" name="matiere_id" required>
+                                    {% for mid, mname in matieres_data %}<option value="{{ mid }}">{{ mname }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-3\">
-                                <label class=\"form-label\">Devoir (optionnel)</label>
-                                <select class=\"form-control\" name=\"devoir_id\">
-                                    <option value=\"\">—</option>
-                                    {''.join([f'<option value="{did}">{dname}</option>' for did, dname in devoirs_data])}
+                            <div class="col-md-3">
+                                <label class="form-label">Devoir (optionnel)</label>
+                                <select class="form-control" name="devoir_id">
+                                    <option value="">—</option>
+                                    {% for did, dname in devoirs_data %}<option value="{{ did }}">{{ dname }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-3\">
-                                <label class=\"form-label\">Note</label>
-                                <input type=\"number\" name=\"valeur\" step=\"0.5\" class=\"form-control\" required>
+                            <div class="col-md-3">
+                                <label class="form-label">Note</label>
+                                <input type="number" name="valeur" step="0.5" class="form-control" required>
                             </div>
                         </div>
-                        <div style=\"margin-top: 15px;\">
-                            <button class=\"btn btn-primary\" type=\"submit\">Ajouter</button>
+                        <div style="margin-top: 15px;">
+                            <button class="btn btn-primary" type="submit">Ajouter</button>
                         </div>
                     </form>
                 </div>
             </div>
 
-            {sections_html}
+            <div class="card" style="margin-bottom: 20px;">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Importer des notes (CSV / XLSX)</h5>
+                    <form method="POST" action="/admin/notes/import" enctype="multipart/form-data">
+                        <div class="row g-3 align-items-end">
+                            <div class="col-md-8">
+                                <label class="form-label">Colonnes : numero_inscription, devoir, valeur (matiere optionnelle)</label>
+                                <input type="file" name="fichier" accept=".csv,.xlsx" class="form-control" required>
+                            </div>
+                            <div class="col-md-4">
+                                <button class="btn btn-outline-primary" type="submit"><i class="fas fa-file-import"></i> Importer</button>
+                            </div>
+                        </div>
+                    </form>
+                </div>
+            </div>
+
+            <div class="card" style="margin-bottom: 20px;">
+                <div class="card-body">
+                    <form method="GET" class="row g-3 align-items-end">
+                        <div class="col-md-3">
+                            <label class="form-label">Filière</label>
+                            <select class="form-control" name="filiere_id">
+                                <option value="">Toutes</option>
+                                {% for oid, libelle in filieres_data %}<option value="{{ oid }}"{% if oid == filiere_id %} selected{% endif %}>{{ libelle }}</option>{% endfor %}
+                            </select>
+                        </div>
+                        <div class="col-md-3">
+                            <label class="form-label">Spécialité</label>
+                            <select class="form-control" name="specialite_id">
+                                <option value="">Toutes</option>
+                                {% for oid, libelle in specialites_data %}<option value="{{ oid }}"{% if oid == specialite_id %} selected{% endif %}>{{ libelle }}</option>{% endfor %}
+                            </select>
+                        </div>
+                        <div class="col-md-4">
+                            <label class="form-label">Matière</label>
+                            <select class="form-control" name="matiere_id">
+                                <option value="">Toutes</option>
+                                {% for oid, libelle in matieres_data %}<option value="{{ oid }}"{% if oid == matiere_id %} selected{% endif %}>{{ libelle }}</option>{% endfor %}
+                            </select>
+                        </div>
+                        <div class="col-md-2">
+                            <button class="btn btn-outline-secondary" type="submit"><i class="fas fa-filter"></i> Filtrer</button>
+                        </div>
+                    </form>
+                </div>
+            </div>
+
+            {{ pagination_html|safe }}
+            {{ sections_html|safe }}
         </main>
-        <script src=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js\"></script>
+        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('notes', True, username))
+    """,
+        etudiants_data=etudiants_data,
+        matieres_data=matieres_data,
+        devoirs_data=devoirs_data,
+        filieres_data=filieres_data,
+        filiere_id=filiere_id,
+        specialites_data=specialites_data,
+        specialite_id=specialite_id,
+        matiere_id=matiere_id,
+        pagination_html=pagination_html,
+        sections_html=sections_html,
+        navbar=get_navbar('notes', True, username),
+    )
+
+@app.route('/admin/notes/import', methods=['POST'])
+@admin_required
+def admin_notes_import():
+    fichier = request.files.get('fichier')
+    if not fichier or not fichier.filename:
+        flash('Aucun fichier sélectionné.', 'danger')
+        return redirect(url_for('admin_notes'))
+
+    db = Session()
+    try:
+        rapport = importer_notes(db, lire_lignes(fichier.stream, fichier.filename))
+    except ErreurImport as e:
+        flash(f'Import impossible : {e}', 'danger')
+        return redirect(url_for('admin_notes'))
+    finally:
+        db.close()
+
+    fragments.invalider('notes')
+    flash(
+        f"Import terminé : {rapport['inserees']} note(s) ajoutée(s), {rapport['mises_a_jour']} mise(s) à jour, "
+        f"{len(rapport['erreurs'])} erreur(s) sur {rapport['lignes']} ligne(s) "
+        f"({rapport['lignes_par_seconde']:.0f} lignes/s).",
+        'success' if not rapport['erreurs'] else 'warning'
+    )
+    for numero, message in rapport['erreurs'][:10]:
+        flash(f'Ligne {numero} : {message}', 'danger')
+    if len(rapport['erreurs']) > 10:
+        flash(f"… et {len(rapport['erreurs']) - 10} autre(s) erreur(s).", 'danger')
+    return redirect(url_for('admin_notes'))
+
+# Relevés de promotion générés hors des requêtes, un à la fois par worker
+generations_releves = ThreadPoolExecutor(max_workers=1)
+
+def generer_releves_fond(sortie, filiere_id, format_releve, fusion):
+    """Tâche de fond : génère les relevés dans sortie, ou écrit <sortie>.erreur"""
+    db = Session()
+    try:
+        rapport = generer_releves(db, filiere_id, sortie, format_releve=format_releve, fusion=fusion)
+        app.logger.info(
+            "Relevés filière %s : %d étudiant(s) en %.2fs (%.1f étudiants/s)",
+            filiere_id, rapport['etudiants'], rapport['duree'], rapport['etudiants_par_seconde']
+        )
+    except Exception as e:
+        app.logger.exception("Échec de la génération des relevés (filière %s)", filiere_id)
+        with open(f"{sortie}.erreur", 'w', encoding='utf-8') as f:
+            f.write(str(e))
+    finally:
+        db.close()
+        Session.remove()
+
+@app.route('/admin/releves/<int:filiere_id>')
+@admin_required
+def admin_releves_filiere(filiere_id):
+    format_releve = request.args.get('format', 'pdf')
+    fusion = request.args.get('fusion') == '1'
+    if format_releve not in FORMATS_RELEVES or (fusion and format_releve != 'pdf'):
+        flash('Format de relevés invalide.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    db = Session()
+    filiere = db.query(Filiere).filter_by(id=filiere_id).first()
+    db.close()
+    if not filiere:
+        flash('Filière introuvable.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+
+    # Fichier propre à cette demande ; la génération se poursuit en arrière-plan
+    nettoyer_sorties(EXPORT_FOLDER)
+    sortie = reserver_sortie(EXPORT_FOLDER, fusion)
+    generations_releves.submit(generer_releves_fond, sortie, filiere_id, format_releve, fusion)
+    return redirect(url_for('admin_releves_fichier', filiere_id=filiere_id, jeton=os.path.basename(sortie)))
+
+@app.route('/admin/releves/<int:filiere_id>/<jeton>')
+@admin_required
+def admin_releves_fichier(filiere_id, jeton):
+    """Relevés générés : téléchargement une fois prêts, page d'attente sinon"""
+    chemin = os.path.join(EXPORT_FOLDER, secure_filename(jeton))
+    if secure_filename(jeton) != jeton or not os.path.isfile(chemin):
+        abort(404)
+    etat, erreur = etat_sortie(chemin)
+    if etat == 'erreur':
+        flash(f'Erreur: {erreur}', 'danger')
+        return redirect(url_for('admin_dashboard'))
+    if etat == 'en_cours':
+        return rendre_page("""
+        <!DOCTYPE html>
+        <html lang="fr">
+        <head>
+            <meta charset="UTF-8">
+            <meta http-equiv="refresh" content="2">
+            <title>Relevés en préparation</title>
+            <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+        </head>
+        <body class="d-flex align-items-center justify-content-center" style="min-height: 100vh;">
+            <div class="text-center">
+                <div class="spinner-border text-primary mb-3"></div>
+                <p>Génération des relevés en cours… le téléchargement démarrera automatiquement.</p>
+            </div>
+        </body>
+        </html>
+        """), 202
+
+    db = Session()
+    filiere = db.query(Filiere).filter_by(id=filiere_id).first()
+    db.close()
+    extension = os.path.splitext(chemin)[1]
+    nom = f"releves_{filiere.nom if filiere else filiere_id}_{date.today().strftime('%Y%m%d')}{extension}"
+    return send_file(chemin, as_attachment=True, download_name=nom)
+
+@app.route('/admin/pool')
+@admin_required
+def admin_pool():
+    """Statistiques du pool de connexions et du pool de mots de passe (supervision)"""
+    return jsonify(dict(statistiques_pool(engine), mots_de_passe=verificateur.statistiques()))
+
+@app.route('/admin/api/<nom>')
+@admin_required
+def admin_api_liste(nom):
+    """Listes d'administration paginées en JSON (?tri=&curseur=&par_page=&filtres...)"""
+    db = Session()
+    try:
+        page = lister(db, nom, request.args, avec_total=request.args.get('total') == '1')
+        return jsonify(page.to_dict())
+    except LookupError as e:
+        return jsonify({'erreur': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'erreur': str(e)}), 400
+    finally:
+        db.close()
 
 @app.route('/admin/note/edit/<int:note_id>', methods=['GET', 'POST'])
 @admin_required
@@ -1291,12 +1716,15 @@ def admin_note_edit(note_id):
 
     if request.method == 'POST':
         try:
+            retirer_note(db, note)
             note.valeur = float(request.form.get('valeur'))
             note.etudiant_id = int(request.form.get('etudiant_id'))
             note.matiere_id = int(request.form.get('matiere_id'))
             note.devoir_id = int(request.form.get('devoir_id')) if request.form.get('devoir_id') else None
+            ajouter_note(db, note)
             db.commit()
             db.close()
+            fragments.invalider('notes')
             flash('Note modifiée.', 'success')
             return redirect(url_for('admin_notes'))
         except Exception as e:
@@ -1318,63 +1746,69 @@ def admin_note_edit(note_id):
     }
     db.close()
 
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
-    <html lang=\"fr\">
+    <html lang="fr">
     <head>
-        <meta charset=\"UTF-8\">
+        <meta charset="UTF-8">
         <title>Modifier Note</title>
-        <link href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css\" rel=\"stylesheet\">
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <style>
-            body {{ background: #eef1f5; min-height: 100vh; }}
-            .container {{ padding: 24px 20px; max-width: 700px; }}
-            .card {{ background: white; border-radius: 8px; border: 1px solid #e2e8f0; box-shadow: 0 2px 6px rgba(0,0,0,0.06); }}
+            body { background: #eef1f5; min-height: 100vh; }
+            .container { padding: 24px 20px; max-width: 700px; }
+            .card { background: white; border-radius: 8px; border: 1px solid #e2e8f0; box-shadow: 0 2px 6px rgba(0,0,0,0.06); }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
-        <div class=\"container\">
-            <div class=\"card\">
-                <div class=\"card-body\">
-                    <h5 style=\"margin-bottom: 15px;\">Modifier une note</h5>
-                    <form method=\"POST\">
-                        <div class=\"row g-3\">
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Étudiant</label>
-                                <select class=\"form-control\" name=\"etudiant_id\" required>
-                                    {''.join([f'<option value="{eid}" {"selected" if eid == selected["etudiant_id"] else ""}>{ename}</option>' for eid, ename in etudiants_data])}
+        {{ navbar }}
+        <div class="container">
+            <div class="card">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Modifier une note</h5>
+                    <form method="POST">
+                        <div class="row g-3">
+                            <div class="col-md-6">
+                                <label class="form-label">Étudiant</label>
+                                <select class="form-control" name="etudiant_id" required>
+                                    {% for eid, ename in etudiants_data %}<option value="{{ eid }}" {% if eid == selected['etudiant_id'] %}selected{% endif %}>{{ ename }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Matière</label>
-                                <select class=\"form-control\" name=\"matiere_id\" required>
-                                    {''.join([f'<option value="{mid}" {"selected" if mid == selected["matiere_id"] else ""}>{mname}</option>' for mid, mname in matieres_data])}
+                            <div class="col-md-6">
+                                <label class="form-label">Matière</label>
+                                <select class="form-control" name="matiere_id" required>
+                                    {% for mid, mname in matieres_data %}<option value="{{ mid }}" {% if mid == selected['matiere_id'] %}selected{% endif %}>{{ mname }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Devoir (optionnel)</label>
-                                <select class=\"form-control\" name=\"devoir_id\">
-                                    <option value=\"\">—</option>
-                                    {''.join([f'<option value="{did}" {"selected" if selected["devoir_id"] == did else ""}>{dname}</option>' for did, dname in devoirs_data])}
+                            <div class="col-md-6">
+                                <label class="form-label">Devoir (optionnel)</label>
+                                <select class="form-control" name="devoir_id">
+                                    <option value="">—</option>
+                                    {% for did, dname in devoirs_data %}<option value="{{ did }}" {% if selected['devoir_id'] == did %}selected{% endif %}>{{ dname }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Note</label>
-                                <input type=\"number\" name=\"valeur\" step=\"0.5\" class=\"form-control\" value=\"{selected['valeur']}\" required>
+                            <div class="col-md-6">
+                                <label class="form-label">Note</label>
+                                <input type="number" name="valeur" step="0.5" class="form-control" value="{{ selected['valeur'] }}" required>
                             </div>
                         </div>
-                        <div style=\"margin-top: 15px;\">
-                            <button class=\"btn btn-primary\" type=\"submit\">Enregistrer</button>
-                            <a href=\"/admin/notes\" class=\"btn btn-secondary\">Annuler</a>
+                        <div style="margin-top: 15px;">
+                            <button class="btn btn-primary" type="submit">Enregistrer</button>
+                            <a href="/admin/notes" class="btn btn-secondary">Annuler</a>
                         </div>
                     </form>
                 </div>
             </div>
         </div>
-        <script src=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js\"></script>
+        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('notes', True, session.get('username')))
+    """,
+        etudiants_data=etudiants_data,
+        selected=selected,
+        matieres_data=matieres_data,
+        devoirs_data=devoirs_data,
+        navbar=get_navbar('notes', True, session.get('username')),
+    )
 
 @app.route('/admin/note/delete/<int:note_id>')
 @admin_required
@@ -1382,8 +1816,10 @@ def admin_note_delete(note_id):
     db = Session()
     note = db.query(Note).filter_by(id=note_id).first()
     if note:
+        retirer_note(db, note)
         db.delete(note)
         db.commit()
+        fragments.invalider('notes')
         flash('Note supprimée.', 'success')
     else:
         flash('Note introuvable.', 'danger')
@@ -1393,8 +1829,7 @@ def admin_note_delete(note_id):
 @app.route('/documents')
 @login_required
 def documents():
-    user = Session().query(User).filter_by(id=session['user_id']).first()
-    if user and user.is_admin():
+    if utilisateur_courant().is_admin():
         return redirect(url_for('admin_documents'))
     return redirect(url_for('etudiant_ressources'))
 
@@ -1402,7 +1837,7 @@ def documents():
 @admin_required
 def admin_documents():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
+    user = utilisateur_courant()
     username = user.prenom if user else ''
 
     if request.method == 'POST':
@@ -1413,9 +1848,7 @@ def admin_documents():
             flash('Type de fichier non autorisé.', 'danger')
         else:
             safe_name = secure_filename(fichier.filename)
-            unique_name = f"{uuid.uuid4().hex}_{safe_name}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-            fichier.save(file_path)
+            depot = deposer(db, fichier)
 
             doc = Document(
                 titre=request.form.get('titre', safe_name),
@@ -1426,8 +1859,8 @@ def admin_documents():
                 filiere_id=int(request.form.get('filiere_id')),
                 specialite_id=int(request.form.get('specialite_id')),
                 filename=safe_name,
-                fichier_path=file_path,
-                taille_fichier=os.path.getsize(file_path)
+                fichier_path=depot.chemin,
+                taille_fichier=depot.taille
             )
             db.add(doc)
             db.commit()
@@ -1443,10 +1876,15 @@ def admin_documents():
     semestres_data = [(s.id, s.nom) for s in semestres]
     matieres_data = [(m.id, m.nom) for m in matieres]
 
-    documents = db.query(Document).order_by(Document.date_upload.desc()).all()
+    try:
+        page = lister(db, 'documents', request.args, avec_total=True)
+    except ValueError as e:
+        db.close()
+        flash(f'Erreur: {str(e)}', 'danger')
+        return redirect(url_for('admin_documents'))
     documents_data = [
-        (d.id, d.titre, d.type_document, d.matiere.nom if d.matiere else 'N/A', d.date_upload.strftime('%d/%m/%Y'))
-        for d in documents
+        (d['id'], d['titre'], d['type_document'], d['matiere'] or 'N/A', d['date_upload'].strftime('%d/%m/%Y'))
+        for d in page.lignes
     ]
     db.close()
 
@@ -1464,92 +1902,92 @@ def admin_documents():
     </tr>
     """ for doc_id, titre, type_doc, matiere, date in documents_data])
 
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
-    <html lang=\"fr\">
+    <html lang="fr">
     <head>
-        <meta charset=\"UTF-8\">
+        <meta charset="UTF-8">
         <title>Cours et Archives</title>
-        <link href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css\" rel=\"stylesheet\">
-        <link rel=\"stylesheet\" href=\"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css\">
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container-fluid {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); margin-bottom: 25px; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container-fluid { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); margin-bottom: 25px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
-        <main class=\"container-fluid\">
-            <h1 class=\"title\"><i class=\"fas fa-folder-open\"></i> Cours et Archives</h1>
+        {{ navbar }}
+        <main class="container-fluid">
+            <h1 class="title"><i class="fas fa-folder-open"></i> Cours et Archives</h1>
 
-            <div class=\"card\">
-                <div class=\"card-body\">
-                    <h5 style=\"margin-bottom: 15px;\">Ajouter un document</h5>
-                    <form method=\"POST\" enctype=\"multipart/form-data\">
-                        <div class=\"row g-3\">
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Titre</label>
-                                <input type=\"text\" name=\"titre\" class=\"form-control\" required>
+            <div class="card">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Ajouter un document</h5>
+                    <form method="POST" enctype="multipart/form-data">
+                        <div class="row g-3">
+                            <div class="col-md-4">
+                                <label class="form-label">Titre</label>
+                                <input type="text" name="titre" class="form-control" required>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Type</label>
-                                <select class=\"form-control\" name=\"type_document\" required>
-                                    <option value=\"Cours\">Cours</option>
-                                    <option value=\"TD\">TD</option>
-                                    <option value=\"TP\">TP</option>
-                                    <option value=\"Examen\">Examen</option>
-                                    <option value=\"Archive\">Archive</option>
+                            <div class="col-md-4">
+                                <label class="form-label">Type</label>
+                                <select class="form-control" name="type_document" required>
+                                    <option value="Cours">Cours</option>
+                                    <option value="TD">TD</option>
+                                    <option value="TP">TP</option>
+                                    <option value="Examen">Examen</option>
+                                    <option value="Archive">Archive</option>
                                 </select>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Fichier</label>
-                                <input type=\"file\" name=\"fichier\" class=\"form-control\" required>
+                            <div class="col-md-4">
+                                <label class="form-label">Fichier</label>
+                                <input type="file" name="fichier" class="form-control" required>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Filière</label>
-                                <select class=\"form-control\" name=\"filiere_id\" required>
-                                    {''.join([f'<option value="{fid}">{fname}</option>' for fid, fname in filieres_data])}
+                            <div class="col-md-4">
+                                <label class="form-label">Filière</label>
+                                <select class="form-control" name="filiere_id" required>
+                                    {% for fid, fname in filieres_data %}<option value="{{ fid }}">{{ fname }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Spécialité</label>
-                                <select class=\"form-control\" name=\"specialite_id\" required>
-                                    {''.join([f'<option value="{sid}">{snom}</option>' for sid, snom in specialites_data])}
+                            <div class="col-md-4">
+                                <label class="form-label">Spécialité</label>
+                                <select class="form-control" name="specialite_id" required>
+                                    {% for sid, snom in specialites_data %}<option value="{{ sid }}">{{ snom }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Semestre</label>
-                                <select class=\"form-control\" name=\"semestre_id\" required>
-                                    {''.join([f'<option value="{sid}">{snom}</option>' for sid, snom in semestres_data])}
+                            <div class="col-md-4">
+                                <label class="form-label">Semestre</label>
+                                <select class="form-control" name="semestre_id" required>
+                                    {% for sid, snom in semestres_data %}<option value="{{ sid }}">{{ snom }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Matière</label>
-                                <select class=\"form-control\" name=\"matiere_id\" required>
-                                    {''.join([f'<option value="{mid}">{mnom}</option>' for mid, mnom in matieres_data])}
+                            <div class="col-md-6">
+                                <label class="form-label">Matière</label>
+                                <select class="form-control" name="matiere_id" required>
+                                    {% for mid, mnom in matieres_data %}<option value="{{ mid }}">{{ mnom }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Description</label>
-                                <input type=\"text\" name=\"description\" class=\"form-control\">
+                            <div class="col-md-6">
+                                <label class="form-label">Description</label>
+                                <input type="text" name="description" class="form-control">
                             </div>
                         </div>
-                        <div style=\"margin-top: 15px;\">
-                            <button class=\"btn btn-primary\" style=\"background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none;\">
-                                <i class=\"fas fa-upload\"></i> Publier
+                        <div style="margin-top: 15px;">
+                            <button class="btn btn-primary" style="background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none;">
+                                <i class="fas fa-upload"></i> Publier
                             </button>
                         </div>
                     </form>
                 </div>
             </div>
 
-            <div class=\"card\">
-                <div class=\"card-body\">
-                    <h5 style=\"margin-bottom: 15px;\">Documents publiés</h5>
-                    <table class=\"table table-hover\">
-                        <thead style=\"background-color: #f0f9ff;\">
+            <div class="card">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Documents publiés</h5>
+                    <table class="table table-hover">
+                        <thead style="background-color: #f0f9ff;">
                             <tr>
                                 <th>Titre</th>
                                 <th>Type</th>
@@ -1559,32 +1997,40 @@ def admin_documents():
                             </tr>
                         </thead>
                         <tbody>
-                            {docs_html if docs_html else '<tr><td colspan="5" style="text-align: center; color: #6b7280;">Aucun document</td></tr>'}
+                            {% if docs_html %}{{ docs_html|safe }}{% else %}<tr><td colspan="5" style="text-align: center; color: #6b7280;">Aucun document</td></tr>{% endif %}
                         </tbody>
                     </table>
+                    {{ pagination_html|safe }}
                 </div>
             </div>
         </main>
-        <script src=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js\"></script>
+        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('documents', True, username))
+    """,
+        filieres_data=filieres_data,
+        specialites_data=specialites_data,
+        semestres_data=semestres_data,
+        matieres_data=matieres_data,
+        docs_html=docs_html,
+        pagination_html=pagination_nav(page, 'admin_documents'),
+        navbar=get_navbar('documents', True, username),
+    )
 
 @app.route('/etudiant/ressources')
 @login_required
 def etudiant_ressources():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
+    user = utilisateur_courant()
 
-    if not etudiant:
+    if not user.est_etudiant:
         db.close()
         return redirect(url_for('student_dashboard'))
 
     documents = db.query(Document).filter(
-        Document.semestre_id == etudiant.semestre_id,
-        Document.filiere_id == etudiant.filiere_id,
-        Document.specialite_id == etudiant.specialite_id
+        Document.semestre_id == user.semestre_id,
+        Document.filiere_id == user.filiere_id,
+        Document.specialite_id == user.specialite_id
     ).order_by(Document.date_upload.desc()).all()
 
     docs_data = [
@@ -1592,7 +2038,7 @@ def etudiant_ressources():
         for d in documents
     ]
 
-    matieres = db.query(Matiere).filter_by(semestre_id=etudiant.semestre_id).all()
+    matieres = db.query(Matiere).filter_by(semestre_id=user.semestre_id).all()
     matieres_data = [(m.id, m.nom) for m in matieres]
     username = user.prenom
     db.close()
@@ -1611,74 +2057,74 @@ def etudiant_ressources():
     </tr>
     """ for doc_id, titre, type_doc, matiere, date in docs_data])
 
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
-    <html lang=\"fr\">
+    <html lang="fr">
     <head>
-        <meta charset=\"UTF-8\">
+        <meta charset="UTF-8">
         <title>Ressources</title>
-        <link href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css\" rel=\"stylesheet\">
-        <link rel=\"stylesheet\" href=\"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css\">
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container-fluid {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); margin-bottom: 25px; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container-fluid { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); margin-bottom: 25px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
-        <main class=\"container-fluid\">
-            <h1 class=\"title\"><i class=\"fas fa-archive\"></i> Ressources et Archives</h1>
+        {{ navbar }}
+        <main class="container-fluid">
+            <h1 class="title"><i class="fas fa-archive"></i> Ressources et Archives</h1>
 
-            <div class=\"card\">
-                <div class=\"card-body\">
-                    <h5 style=\"margin-bottom: 15px;\">Partager un document</h5>
-                    <form method=\"POST\" action=\"/etudiant/ressources/upload\" enctype=\"multipart/form-data\">
-                        <div class=\"row g-3\">
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Titre</label>
-                                <input type=\"text\" name=\"titre\" class=\"form-control\" required>
+            <div class="card">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Partager un document</h5>
+                    <form method="POST" action="/etudiant/ressources/upload" enctype="multipart/form-data">
+                        <div class="row g-3">
+                            <div class="col-md-4">
+                                <label class="form-label">Titre</label>
+                                <input type="text" name="titre" class="form-control" required>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Type</label>
-                                <select class=\"form-control\" name=\"type_document\" required>
-                                    <option value=\"Cours\">Cours</option>
-                                    <option value=\"TD\">TD</option>
-                                    <option value=\"TP\">TP</option>
-                                    <option value=\"Examen\">Examen</option>
-                                    <option value=\"Archive\">Archive</option>
+                            <div class="col-md-4">
+                                <label class="form-label">Type</label>
+                                <select class="form-control" name="type_document" required>
+                                    <option value="Cours">Cours</option>
+                                    <option value="TD">TD</option>
+                                    <option value="TP">TP</option>
+                                    <option value="Examen">Examen</option>
+                                    <option value="Archive">Archive</option>
                                 </select>
                             </div>
-                            <div class=\"col-md-4\">
-                                <label class=\"form-label\">Fichier</label>
-                                <input type=\"file\" name=\"fichier\" class=\"form-control\" required>
+                            <div class="col-md-4">
+                                <label class="form-label">Fichier</label>
+                                <input type="file" name="fichier" class="form-control" required>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Matière</label>
-                                <select class=\"form-control\" name=\"matiere_id\" required>
-                                    {''.join([f'<option value="{mid}">{mnom}</option>' for mid, mnom in matieres_data])}
+                            <div class="col-md-6">
+                                <label class="form-label">Matière</label>
+                                <select class="form-control" name="matiere_id" required>
+                                    {% for mid, mnom in matieres_data %}<option value="{{ mid }}">{{ mnom }}</option>{% endfor %}
                                 </select>
                             </div>
-                            <div class=\"col-md-6\">
-                                <label class=\"form-label\">Description</label>
-                                <input type=\"text\" name=\"description\" class=\"form-control\">
+                            <div class="col-md-6">
+                                <label class="form-label">Description</label>
+                                <input type="text" name="description" class="form-control">
                             </div>
                         </div>
-                        <div style=\"margin-top: 15px;\">
-                            <button class=\"btn btn-primary\" style=\"background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none;\">
-                                <i class=\"fas fa-upload\"></i> Partager
+                        <div style="margin-top: 15px;">
+                            <button class="btn btn-primary" style="background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none;">
+                                <i class="fas fa-upload"></i> Partager
                             </button>
                         </div>
                     </form>
                 </div>
             </div>
 
-            <div class=\"card\">
-                <div class=\"card-body\">
-                    <h5 style=\"margin-bottom: 15px;\">Documents disponibles</h5>
-                    <table class=\"table table-hover\">
-                        <thead style=\"background-color: #f0f9ff;\">
+            <div class="card">
+                <div class="card-body">
+                    <h5 style="margin-bottom: 15px;">Documents disponibles</h5>
+                    <table class="table table-hover">
+                        <thead style="background-color: #f0f9ff;">
                             <tr>
                                 <th>Titre</th>
                                 <th>Type</th>
@@ -1688,26 +2134,25 @@ def etudiant_ressources():
                             </tr>
                         </thead>
                         <tbody>
-                            {docs_html if docs_html else '<tr><td colspan="5" style="text-align: center; color: #6b7280;">Aucun document</td></tr>'}
+                            {% if docs_html %}{{ docs_html|safe }}{% else %}<tr><td colspan="5" style="text-align: center; color: #6b7280;">Aucun document</td></tr>{% endif %}
                         </tbody>
                     </table>
                 </div>
             </div>
         </main>
-        <script src=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js\"></script>
+        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('ressources', False, username))
+    """, matieres_data=matieres_data, docs_html=docs_html, navbar=get_navbar('ressources', False, username))
 
 @app.route('/etudiant/ressources/upload', methods=['POST'])
 @login_required
 def etudiant_ressources_upload():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
+    user = utilisateur_courant()
 
     fichier = request.files.get('fichier')
-    if not etudiant:
+    if not user.est_etudiant:
         db.close()
         return redirect(url_for('student_dashboard'))
 
@@ -1722,21 +2167,19 @@ def etudiant_ressources_upload():
         return redirect(url_for('etudiant_ressources'))
 
     safe_name = secure_filename(fichier.filename)
-    unique_name = f"{uuid.uuid4().hex}_{safe_name}"
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-    fichier.save(file_path)
+    depot = deposer(db, fichier)
 
     doc = Document(
         titre=request.form.get('titre', safe_name),
         description=request.form.get('description', ''),
         type_document=request.form.get('type_document', 'Cours'),
         matiere_id=int(request.form.get('matiere_id')),
-        semestre_id=etudiant.semestre_id,
-        filiere_id=etudiant.filiere_id,
-        specialite_id=etudiant.specialite_id,
+        semestre_id=user.semestre_id,
+        filiere_id=user.filiere_id,
+        specialite_id=user.specialite_id,
         filename=safe_name,
-        fichier_path=file_path,
-        taille_fichier=os.path.getsize(file_path)
+        fichier_path=depot.chemin,
+        taille_fichier=depot.taille
     )
     db.add(doc)
     db.commit()
@@ -1749,16 +2192,15 @@ def etudiant_ressources_upload():
 @login_required
 def etudiant_chat():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
+    user = utilisateur_courant()
 
-    if not etudiant:
+    if not user.est_etudiant:
         db.close()
         return redirect(url_for('student_dashboard'))
 
     messages = db.query(Message).filter(
         Message.type_message == 'public',
-        Message.semestre_id == etudiant.semestre_id
+        Message.semestre_id == user.semestre_id
     ).order_by(Message.date_creation.desc()).limit(50).all()
 
     messages_data = [
@@ -1782,60 +2224,59 @@ def etudiant_chat():
     </div>
     """ for expediteur, contenu, date, message_id, filename in messages_data])
 
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
-    <html lang=\"fr\">
+    <html lang="fr">
     <head>
-        <meta charset=\"UTF-8\">
+        <meta charset="UTF-8">
         <title>Communication</title>
-        <link href=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css\" rel=\"stylesheet\">
-        <link rel=\"stylesheet\" href=\"https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css\">
+        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+        <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: #eef1f5; min-height: 100vh; }}
-            .container-fluid {{ padding: 24px 20px; max-width: 1200px; }}
-            .title {{ color: #3b4a5a; font-weight: 700; font-size: 26px; margin-bottom: 20px; }}
-            .chat-box {{ background: white; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.06); min-height: 400px; display: flex; flex-direction: column; }}
-            .messages-area {{ flex: 1; overflow-y: auto; margin-bottom: 20px; }}
-            .form-area {{ border-top: 1px solid #e5e7eb; padding-top: 20px; }}
+            body { background: #eef1f5; min-height: 100vh; }
+            .container-fluid { padding: 24px 20px; max-width: 1200px; }
+            .title { color: #3b4a5a; font-weight: 700; font-size: 26px; margin-bottom: 20px; }
+            .chat-box { background: white; border-radius: 8px; padding: 20px; box-shadow: 0 2px 6px rgba(0,0,0,0.06); min-height: 400px; display: flex; flex-direction: column; }
+            .messages-area { flex: 1; overflow-y: auto; margin-bottom: 20px; }
+            .form-area { border-top: 1px solid #e5e7eb; padding-top: 20px; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
-        <main class=\"container-fluid\">
-            <h1 class=\"title\"><i class=\"fas fa-comments\"></i> Communication du Semestre</h1>
+        {{ navbar }}
+        <main class="container-fluid">
+            <h1 class="title"><i class="fas fa-comments"></i> Communication du Semestre</h1>
 
-            <div class=\"chat-box\">
-                <div class=\"messages-area\">
-                    {messages_html if messages_html else '<p style="color: #cbd5e1; text-align: center;">Aucun message pour le moment</p>'}
+            <div class="chat-box">
+                <div class="messages-area">
+                    {% if messages_html %}{{ messages_html|safe }}{% else %}<p style="color: #cbd5e1; text-align: center;">Aucun message pour le moment</p>{% endif %}
                 </div>
-                <div class=\"form-area\">
-                    <form method=\"POST\" action=\"/etudiant/chat/send\" enctype=\"multipart/form-data\">
-                        <div class=\"input-group\">
-                            <input type=\"text\" class=\"form-control\" name=\"contenu\" placeholder=\"Écrivez votre message...\" required>
-                            <button class=\"btn btn-primary\" type=\"submit\" style=\"background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none;\">
-                                <i class=\"fas fa-paper-plane\"></i>
+                <div class="form-area">
+                    <form method="POST" action="/etudiant/chat/send" enctype="multipart/form-data">
+                        <div class="input-group">
+                            <input type="text" class="form-control" name="contenu" placeholder="Écrivez votre message..." required>
+                            <button class="btn btn-primary" type="submit" style="background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none;">
+                                <i class="fas fa-paper-plane"></i>
                             </button>
                         </div>
-                        <div style=\"margin-top: 10px;\">
-                            <input type=\"file\" class=\"form-control\" name=\"fichier\">
+                        <div style="margin-top: 10px;">
+                            <input type="file" class="form-control" name="fichier">
                         </div>
                     </form>
                 </div>
             </div>
         </main>
-        <script src=\"https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js\"></script>
+        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('chat', False, username))
+    """, messages_html=messages_html, navbar=get_navbar('chat', False, username))
 
 @app.route('/etudiant/chat/send', methods=['POST'])
 @login_required
 def etudiant_chat_send():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
-    etudiant = user.etudiant
+    user = utilisateur_courant()
 
-    if etudiant:
+    if user.est_etudiant:
         contenu = request.form.get('contenu', '').strip()
         fichier = request.files.get('fichier')
         filename = None
@@ -1844,9 +2285,7 @@ def etudiant_chat_send():
         if fichier and fichier.filename:
             if allowed_file(fichier.filename):
                 safe_name = secure_filename(fichier.filename)
-                unique_name = f"{uuid.uuid4().hex}_{safe_name}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-                fichier.save(file_path)
+                file_path = deposer(db, fichier).chemin
                 filename = safe_name
             else:
                 flash('Type de fichier non autorisé.', 'danger')
@@ -1855,7 +2294,7 @@ def etudiant_chat_send():
             message = Message(
                 contenu=contenu if contenu else 'Document partagé',
                 type_message='public',
-                semestre_id=etudiant.semestre_id,
+                semestre_id=user.semestre_id,
                 expediteur_id=user.id,
                 fichier_path=file_path,
                 filename=filename
@@ -1876,11 +2315,13 @@ def etudiant_chat_file(message_id):
     filename = msg.filename if msg else None
     db.close()
 
-    if not file_path or not os.path.exists(file_path):
-        flash('Fichier introuvable.', 'danger')
-        return redirect(url_for('etudiant_chat'))
-
-    return send_file(file_path, as_attachment=True, download_name=filename)
+    if file_path:
+        try:
+            return stockage_par_defaut().reponse(file_path, filename or os.path.basename(file_path))
+        except FileNotFoundError:
+            pass
+    flash('Fichier introuvable.', 'danger')
+    return redirect(url_for('etudiant_chat'))
 
 @app.route('/ressource/download/<int:doc_id>')
 @login_required
@@ -1891,17 +2332,19 @@ def ressource_download(doc_id):
     filename = doc.filename if doc else None
     db.close()
 
-    if not file_path or not os.path.exists(file_path):
-        flash('Fichier introuvable.', 'danger')
-        return redirect(url_for('etudiant_ressources'))
-
-    return send_file(file_path, as_attachment=True, download_name=filename)
+    if file_path:
+        try:
+            return stockage_par_defaut().reponse(file_path, filename or os.path.basename(file_path))
+        except FileNotFoundError:
+            pass
+    flash('Fichier introuvable.', 'danger')
+    return redirect(url_for('etudiant_ressources'))
 
 @app.route('/profile')
 @login_required
 def profile():
     db = Session()
-    user = db.query(User).filter_by(id=session['user_id']).first()
+    user = utilisateur_courant()
     # Extract data BEFORE closing session
     username = user.username
     email = user.email
@@ -1910,7 +2353,7 @@ def profile():
     role = user.role
     db.close()
     
-    return render_template_string(f"""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -1919,35 +2362,35 @@ def profile():
         <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
         <style>
-            body {{ background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }}
-            .container {{ padding: 30px 20px; }}
-            .title {{ color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }}
-            .card {{ background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }}
-            .btn-primary {{ background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none; }}
-            .btn-primary:hover {{ color: white; }}
+            body { background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%); min-height: 100vh; }
+            .container { padding: 30px 20px; }
+            .title { color: white; font-weight: 700; font-size: 28px; margin-bottom: 30px; }
+            .card { background: white; border-radius: 12px; border: none; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
+            .btn-primary { background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%); border: none; }
+            .btn-primary:hover { color: white; }
         </style>
     </head>
     <body>
-        {{{{ navbar }}}}
+        {{ navbar }}
         <div class="container" style="max-width: 600px;">
             <h1 class="title"><i class="fas fa-user-circle"></i> Mon Profil</h1>
             <div class="card">
                 <div class="card-body">
                     <div style="margin-bottom: 20px;">
                         <label style="color: #6b7280; font-weight: 600; font-size: 13px;">Username</label>
-                        <p style="color: #1f2937; font-size: 15px;">{username}</p>
+                        <p style="color: #1f2937; font-size: 15px;">{{ username }}</p>
                     </div>
                     <div style="margin-bottom: 20px;">
                         <label style="color: #6b7280; font-weight: 600; font-size: 13px;">Email</label>
-                        <p style="color: #1f2937; font-size: 15px;">{email}</p>
+                        <p style="color: #1f2937; font-size: 15px;">{{ email }}</p>
                     </div>
                     <div style="margin-bottom: 20px;">
                         <label style="color: #6b7280; font-weight: 600; font-size: 13px;">Nom Complet</label>
-                        <p style="color: #1f2937; font-size: 15px;">{prenom} {nom}</p>
+                        <p style="color: #1f2937; font-size: 15px;">{{ prenom }} {{ nom }}</p>
                     </div>
                     <div style="margin-bottom: 20px;">
                         <label style="color: #6b7280; font-weight: 600; font-size: 13px;">Rôle</label>
-                        <p><span class="badge bg-primary">{role.capitalize()}</span></p>
+                        <p><span class="badge bg-primary">{{ role|capitalize }}</span></p>
                     </div>
                     <a href="/" class="btn btn-primary"><i class="fas fa-arrow-left"></i> Retour au Dashboard</a>
                 </div>
@@ -1956,11 +2399,18 @@ def profile():
         <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
     </body>
     </html>
-    """, navbar=get_navbar('profile', user.is_admin(), user.prenom))
+    """,
+        username=username,
+        email=email,
+        prenom=prenom,
+        nom=nom,
+        role=role,
+        navbar=get_navbar('profile', user.is_admin(), user.prenom),
+    )
 
 @app.errorhandler(404)
 def page_404(e):
-    return render_template_string("""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -1987,9 +2437,17 @@ def page_404(e):
     </html>
     """), 404
 
+@app.errorhandler(413)
+def page_413(e):
+    flash(f'Fichier trop volumineux ({MAX_UPLOAD_SIZE // (1024 * 1024)} Mo maximum).', 'danger')
+    retour = request.referrer
+    if not retour or not retour.startswith(request.host_url):
+        retour = url_for('index')
+    return redirect(retour)
+
 @app.errorhandler(500)
 def page_500(e):
-    return render_template_string("""
+    return rendre_page("""
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -2018,10 +2476,12 @@ def page_500(e):
 
 def init_db():
     """Initialiser la base de données"""
+    migrer(engine, journal=lambda version, nom: print(f"🔧 Migration {version} : {nom}"))
     db = Session()
     
     if db.query(Filiere).count() > 0:
         print("✓ Base de données déjà initialisée")
+        reconstruire_si_vide(db)
         db.close()
         return
     
@@ -2105,6 +2565,7 @@ def init_db():
         Note(valeur=13.5, etudiant_id=1, matiere_id=3, devoir_id=3),
     ]
     db.add_all(notes)
+    reconstruire_cache(db)
     db.commit()
     
     print("✓ Initialisé avec succès!")
@@ -2115,6 +2576,107 @@ def init_db():
     
     db.close()
 
+@app.cli.command('migrer')
+def migrer_command():
+    """Appliquer les migrations de schéma en attente"""
+    appliquees = migrer(engine, journal=lambda version, nom: click.echo(f"  {version} : {nom}"))
+    click.echo(f"{len(appliquees)} migration(s) appliquée(s)" if appliquees else "Schéma à jour")
+
+@app.cli.command('verifier-index')
+def verifier_index_command():
+    """Vérifier (EXPLAIN) que les requêtes fréquentes utilisent leurs index"""
+    manquants = 0
+    for nom, index, utilise, plan in verifier_plans(engine):
+        click.echo(f"  {'✓' if utilise else '✗'} {nom} ({index}) : {plan}")
+        manquants += not utilise
+    if manquants:
+        raise click.ClickException(f"{manquants} requête(s) sans leur index")
+
+@app.cli.command('import-notes')
+@click.argument('fichier', type=click.Path(exists=True, dir_okay=False))
+@click.option('--lot', default=500, show_default=True, help='Nombre de notes par instruction groupée.')
+@click.option('--simulation', is_flag=True, help='Valider le fichier sans rien écrire.')
+def import_notes_command(fichier, lot, simulation):
+    """Importer les notes d'un fichier CSV/XLSX (numero_inscription, devoir, valeur)"""
+    db = Session()
+    try:
+        rapport = importer_notes(db, lire_lignes(fichier, fichier), taille_lot=lot, simulation=simulation)
+    except ErreurImport as e:
+        raise click.ClickException(str(e))
+    finally:
+        db.close()
+
+    for numero, message in rapport['erreurs']:
+        click.echo(f"  ligne {numero}: {message}", err=True)
+    click.echo(
+        f"{'Simulation' if simulation else 'Import'} : {rapport['lignes']} ligne(s), "
+        f"{rapport['inserees']} ajoutée(s), {rapport['mises_a_jour']} mise(s) à jour, "
+        f"{len(rapport['erreurs'])} erreur(s) en {rapport['duree']:.2f}s "
+        f"({rapport['lignes_par_seconde']:.0f} lignes/s)"
+    )
+
+@app.cli.command('releves')
+@click.argument('filiere')
+@click.option('--format', 'format_releve', type=click.Choice(['pdf', 'excel']), default='pdf', show_default=True)
+@click.option('--fusion', is_flag=True, help='Un seul PDF au lieu d\'une archive ZIP.')
+@click.option('--specialite', 'specialite_id', type=int, help='Limiter à une spécialité (id).')
+@click.option('--processus', type=int, help='Taille du pool (par défaut : nombre de CPU).')
+@click.option('--sortie', type=click.Path(dir_okay=False), help='Fichier produit (par défaut dans exports/).')
+def releves_command(filiere, format_releve, fusion, specialite_id, processus, sortie):
+    """Générer les relevés de toute une filière (id ou nom, ex. L3)"""
+    db = Session()
+    try:
+        objet = db.query(Filiere).filter(
+            (Filiere.id == int(filiere)) if filiere.isdigit() else (Filiere.nom == filiere)
+        ).first()
+        if not objet:
+            raise click.ClickException(f'Filière introuvable : {filiere}')
+        if sortie is None:
+            sortie = os.path.join(
+                EXPORT_FOLDER, secure_filename(f"releves_{objet.nom}_{format_releve}.{'pdf' if fusion else 'zip'}")
+            )
+
+        def progression(fait, total):
+            click.echo(f"\r  {fait}/{total} relevé(s)", nl=fait == total)
+
+        rapport = generer_releves(
+            db, objet.id, sortie, format_releve=format_releve, fusion=fusion,
+            specialite_id=specialite_id, processus=processus, progression=progression
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        db.close()
+
+    click.echo(
+        f"{rapport['etudiants']} relevé(s) → {rapport['fichier']} en {rapport['duree']:.2f}s "
+        f"({rapport['etudiants_par_seconde']:.1f} étudiants/s)"
+    )
+
+@app.cli.command('fichiers-gc')
+@click.option('--delai', default=3600, show_default=True, help='Âge minimal (s) d\'un contenu supprimé.')
+@click.option('--importer', is_flag=True, help='Ranger d\'abord les anciens dépôts dans le stockage par contenu.')
+@click.option('--simulation', is_flag=True, help='Afficher le rapport sans rien supprimer.')
+def fichiers_gc_command(delai, importer, simulation):
+    """Recompter les références des fichiers déposés et supprimer les contenus orphelins"""
+    migrer(engine)  # fichier_path en clés de stockage avant de compter les références
+    db = Session()
+    try:
+        if importer and not simulation:
+            importes, liberes = importer_anciens(db)
+            click.echo(f"  {importes} ancien(s) fichier(s) importé(s), {liberes / 1e6:.1f} Mo de doublons libérés")
+        rapport = collecter(db, delai=delai, simulation=simulation)
+    finally:
+        db.close()
+
+    click.echo(
+        f"{'Simulation' if simulation else 'Nettoyage'} : {rapport['references']} contenu(s) référencé(s), "
+        f"{rapport['supprimes']} supprimé(s) ({rapport['octets_liberes'] / 1e6:.1f} Mo libérés), "
+        f"{rapport['octets_economises'] / 1e6:.1f} Mo économisés par la déduplication"
+    )
+    if rapport['manquants']:
+        click.echo(f"  {rapport['manquants']} contenu(s) référencé(s) introuvable(s) sur le disque", err=True)
+
 if __name__ == '__main__':
     init_db()
     print("\n🚀 http://127.0.0.1:5000\n")
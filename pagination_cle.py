@@ -0,0 +1,151 @@
+"""
+Pagination par clé (keyset), partagée par app/ et app.py
+Une page est lue avec WHERE (clés de tri) > (valeurs de la dernière ligne)
+plutôt qu'un OFFSET : le coût ne dépend pas de la position dans la liste et
+les curseurs restent stables quand des lignes sont ajoutées ou supprimées.
+
+Ce module ne dépend que de SQLAlchemy : il est importé par app.py sans
+charger le paquet app.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import and_, or_
+
+PAR_PAGE = 50
+PAR_PAGE_MAX = 200
+
+
+# ======================== CURSEURS ========================
+
+def _encoder_valeur(valeur):
+    if isinstance(valeur, datetime):
+        return {'$dt': valeur.isoformat()}
+    if isinstance(valeur, date):
+        return {'$d': valeur.isoformat()}
+    return valeur
+
+
+def _decoder_valeur(valeur):
+    if isinstance(valeur, dict):
+        if '$dt' in valeur:
+            return datetime.fromisoformat(valeur['$dt'])
+        if '$d' in valeur:
+            return date.fromisoformat(valeur['$d'])
+    return valeur
+
+
+def encoder_curseur(tri, valeurs, apres=True):
+    """Curseur opaque : nom du tri, valeurs des clés et sens de lecture"""
+    contenu = {'t': tri, 'v': [_encoder_valeur(v) for v in valeurs], 's': 'a' if apres else 'p'}
+    return base64.urlsafe_b64encode(json.dumps(contenu, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _encoder_json(valeur):
+    return valeur.isoformat() if isinstance(valeur, (date, datetime)) else valeur
+
+
+def decoder_curseur(curseur):
+    """(tri, valeurs, apres) ; ValueError si le curseur est illisible"""
+    try:
+        brut = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+        contenu = json.loads(brut)
+        return contenu['t'], [_decoder_valeur(v) for v in contenu['v']], contenu['s'] == 'a'
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Curseur invalide')
+
+
+# ======================== PAGINATION ========================
+
+class Page:
+    """Lignes d'une page et curseurs vers les pages voisines"""
+
+    __slots__ = ('lignes', 'suivant', 'precedent', 'par_page', 'tri', 'total')
+
+    def __init__(self, lignes, suivant, precedent, par_page, tri, total=None):
+        self.lignes = lignes
+        self.suivant = suivant
+        self.precedent = precedent
+        self.par_page = par_page
+        self.tri = tri
+        self.total = total
+
+    def to_dict(self):
+        return {
+            'items': [
+                {cle: _encoder_json(valeur) for cle, valeur in ligne.items()}
+                for ligne in self.lignes
+            ],
+            'suivant': self.suivant,
+            'precedent': self.precedent,
+            'par_page': self.par_page,
+            'tri': self.tri,
+            'total': self.total,
+        }
+
+
+def _condition(cles, valeurs, apres):
+    """(k1, k2, ...) après/avant (v1, v2, ...) en respectant le sens de chaque clé"""
+    alternatives = []
+    for i, (colonne, descendant) in enumerate(cles):
+        egalites = [cles[j][0] == valeurs[j] for j in range(i)]
+        depasse = colonne < valeurs[i] if descendant == apres else colonne > valeurs[i]
+        alternatives.append(and_(*egalites, depasse))
+    return or_(*alternatives)
+
+
+def paginer(db, query, cles, nom_tri, curseur=None, par_page=PAR_PAGE):
+    """Exécute une page de query (un select()) triée par cles
+
+    cles : liste de (colonne, descendant) non nulles dont la dernière est
+    unique (en général la clé primaire). Les colonnes de tri sont ajoutées à
+    la sélection pour construire les curseurs, puis retirées des lignes.
+    """
+    apres = True
+    if curseur:
+        tri_curseur, valeurs, apres = decoder_curseur(curseur)
+        if tri_curseur != nom_tri or len(valeurs) != len(cles):
+            raise ValueError('Curseur invalide pour ce tri')
+        query = query.where(_condition(cles, valeurs, apres))
+
+    ordre = [
+        colonne.desc() if descendant == apres else colonne.asc()
+        for colonne, descendant in cles
+    ]
+    n = len(cles)
+    query = query.add_columns(*[colonne.label(f'_cle{i}') for i, (colonne, _) in enumerate(cles)])
+    resultats = db.execute(query.order_by(*ordre).limit(par_page + 1)).all()
+
+    encore = len(resultats) > par_page
+    resultats = resultats[:par_page]
+    if not apres:
+        resultats.reverse()
+
+    lignes = [_sans_cles(r, n) for r in resultats]
+    premier = list(resultats[0][-n:]) if resultats else None
+    dernier = list(resultats[-1][-n:]) if resultats else None
+
+    if apres:
+        suivant = encoder_curseur(nom_tri, dernier) if encore else None
+        precedent = encoder_curseur(nom_tri, premier, apres=False) if curseur and premier else None
+    else:
+        suivant = encoder_curseur(nom_tri, dernier) if dernier else None
+        precedent = encoder_curseur(nom_tri, premier, apres=False) if encore else None
+    return Page(lignes, suivant, precedent, par_page, nom_tri)
+
+
+def _sans_cles(ligne, n):
+    """Ligne sous forme de dict, sans les n colonnes de tri ajoutées en fin"""
+    return dict(zip(list(ligne._fields)[:-n], tuple(ligne)[:-n]))
+
+
+__all__ = [
+    'PAR_PAGE',
+    'PAR_PAGE_MAX',
+    'Page',
+    'encoder_curseur',
+    'decoder_curseur',
+    'paginer',
+]
@@ -0,0 +1,125 @@
+"""
+Compression des réponses et requêtes conditionnelles
+installer_compression() ajoute à une application Flask un hook qui
+compresse (brotli si disponible, sinon gzip) les réponses textuelles au-delà
+d'un seuil. Le décorateur conditionnel() calcule un ETag à partir d'une
+version bon marché des données affichées (dernière modification des notes
+d'un étudiant...) et répond 304 Not Modified sans exécuter la vue quand le
+navigateur possède déjà la page.
+
+Ce module ne dépend que de Flask : il est importé par app.py sans charger
+le paquet app.
+"""
+
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import make_response, request, session
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul
+    brotli = None
+
+SEUIL = 1024  # octets
+TYPES_COMPRESSIBLES = {
+    'text/html', 'text/csv', 'text/css', 'text/plain',
+    'application/json', 'application/javascript',
+}
+
+
+def choisir_encodage(accept_encoding):
+    """'br', 'gzip' ou None selon l'en-tête Accept-Encoding du client"""
+    acceptes = {}
+    for partie in (accept_encoding or '').split(','):
+        nom, _, parametres = partie.strip().partition(';')
+        qualite = 1.0
+        if parametres.strip().startswith('q='):
+            try:
+                qualite = float(parametres.strip()[2:])
+            except ValueError:
+                qualite = 0.0
+        acceptes[nom.strip().lower()] = qualite
+    if brotli is not None and acceptes.get('br', 0) > 0:
+        return 'br'
+    if acceptes.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compresser(donnees, encodage, niveau=None):
+    if encodage == 'br':
+        return brotli.compress(donnees, quality=5 if niveau is None else niveau)
+    return gzip.compress(donnees, compresslevel=6 if niveau is None else niveau)
+
+
+def _compressible(reponse, seuil):
+    return (
+        reponse.status_code == 200
+        and not reponse.direct_passthrough
+        and not reponse.is_streamed
+        and 'Content-Encoding' not in reponse.headers
+        and reponse.mimetype in TYPES_COMPRESSIBLES
+        and (reponse.content_length or 0) >= seuil
+    )
+
+
+def installer_compression(app, seuil=SEUIL, niveau=None):
+    """Compresse les réponses HTML, CSV, JSON... de plus de seuil octets"""
+
+    @app.after_request
+    def _compresser(reponse):
+        if not _compressible(reponse, seuil):
+            return reponse
+        reponse.vary.add('Accept-Encoding')
+        encodage = choisir_encodage(request.headers.get('Accept-Encoding'))
+        if encodage is None:
+            return reponse
+        reponse.set_data(compresser(reponse.get_data(), encodage, niveau))
+        reponse.headers['Content-Encoding'] = encodage
+        return reponse
+
+    return app
+
+
+def conditionnel(version):
+    """Répond 304 quand la version des données affichées n'a pas changé
+
+    version() est appelée dans la requête et retourne une valeur hachable en
+    texte (tuple de compteurs, horodatage...), ou None pour servir la page
+    sans ETag. L'ETag est faible : il reste valable pour les variantes
+    compressées de la même page. Les messages flash en attente entrent dans
+    l'ETag : une page qui les affiche n'est pas resservie une fois consommés.
+    """
+    def decorateur(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            valeur = version()
+            if valeur is None:
+                return f(*args, **kwargs)
+            etag = hashlib.sha1(
+                f"{session.get('user_id')}|{request.full_path}|{valeur}|{session.get('_flashes')}".encode()
+            ).hexdigest()[:32]
+            if request.if_none_match.contains_weak(etag):
+                reponse = make_response('', 304)
+            else:
+                reponse = make_response(f(*args, **kwargs))
+                if reponse.status_code != 200:
+                    return reponse
+            reponse.set_etag(etag, weak=True)
+            reponse.cache_control.private = True
+            reponse.cache_control.no_cache = True
+            return reponse
+        return decorated_function
+    return decorateur
+
+
+__all__ = [
+    'SEUIL',
+    'TYPES_COMPRESSIBLES',
+    'choisir_encodage',
+    'compresser',
+    'conditionnel',
+    'installer_compression',
+]
@@ -6,6 +6,7 @@ Application principale
 
 from flask import Flask, render_template, redirect, url_for, session, flash, request
 from functools import wraps
+from sqlalchemy import func
 import os
 
 # Imports de l'application
@@ -26,6 +27,9 @@ from app import (
     UPLOAD_FOLDER,
     EXPORT_FOLDER,
 )
+from app.utils.moyenne_cache import version_notes
+from app.utils.mots_de_passe import Surcharge, VerificateurMotsDePasse
+from reponses_http import conditionnel, installer_compression
 
 # Créer l'application Flask
 app = Flask(__name__)
@@ -36,9 +40,29 @@ app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10 MB max
 # Créer les tables
 Base.metadata.create_all(engine)
 
+# Compression gzip/brotli des pages, CSV et JSON
+installer_compression(app)
+
+# Vérifications de mots de passe dans un pool de processus borné
+verificateur = VerificateurMotsDePasse()
+
 
 # ======================== DÉCORATEURS ========================
 
+def version_resultats():
+    """Version des pages de résultats de l'étudiant connecté (ETag), ou None"""
+    db_session = Session()
+    try:
+        etudiant = db_session.query(Etudiant.id, Etudiant.semestre_id).filter_by(user_id=session.get('user_id')).first()
+        if etudiant is None:
+            return None
+        matieres = db_session.query(func.count(Matiere.id), func.max(Matiere.id)).filter_by(semestre_id=etudiant.semestre_id).one()
+        notifications = db_session.query(func.count(Notification.id), func.max(Notification.id)).filter_by(user_id=session.get('user_id'), lue=False).one()
+        return version_notes(db_session, etudiant.id), tuple(matieres), tuple(notifications), etudiant.semestre_id
+    finally:
+        db_session.close()
+
+
 def login_required(f):
     """Décorateur pour vérifier l'authentification"""
     @wraps(f)
@@ -94,7 +118,18 @@ def login():
         db_session = Session()
         user = db_session.query(User).filter_by(username=username).first()
         
-        if user and user.check_password(password) and user.actif:
+        try:
+            correct, nouveau_hash = verificateur.verifier(user.password_hash if user else None, password)
+        except Surcharge:
+            db_session.close()
+            flash('Trop de connexions en cours, réessayez dans quelques secondes.', 'warning')
+            return render_template('auth/login.html'), 503, {'Retry-After': '5'}
+        
+        if correct and user.actif:
+            if nouveau_hash:
+                user.password_hash = nouveau_hash
+                db_session.commit()
+            
             session['user_id'] = user.id
             session['username'] = user.username
             session['role'] = user.role
@@ -154,6 +189,7 @@ def admin_dashboard():
 
 @app.route('/student/dashboard')
 @login_required
+@conditionnel(version_resultats)
 def student_dashboard():
     """Dashboard étudiant"""
     db_session = Session()
@@ -340,6 +376,7 @@ def admin_notes():
 
 @app.route('/student/resultats')
 @login_required
+@conditionnel(version_resultats)
 def student_resultats():
     """Résultats académiques de l'étudiant"""
     db_session = Session()
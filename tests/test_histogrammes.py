@@ -0,0 +1,57 @@
+"""Histogrammes des notes (app.py) : tranches uniques et bornes invalides"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setUpModule():
+    # app.py crée et amorce student_grades.db dans le dossier courant
+    global module, dossier, depart
+    depart = os.getcwd()
+    dossier = tempfile.TemporaryDirectory()
+    os.chdir(dossier.name)
+    sys.path.insert(0, RACINE)
+    spec = importlib.util.spec_from_file_location("app_notes", os.path.join(RACINE, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module  # Flask en déduit le dossier des templates
+    spec.loader.exec_module(module)
+
+
+def tearDownModule():
+    os.chdir(depart)
+    dossier.cleanup()
+
+
+class TestHistogrammes(unittest.TestCase):
+    def setUp(self):
+        self.client = module.app.test_client()
+        self.client.post("/login", data={"email": "admin@studentapp.com", "mot_de_passe": "admin123"})
+
+    def test_tranche_unique(self):
+        for url in ("/admin/api/histogramme?bornes=0,20", "/admin/api/histogramme?largeur=20"):
+            reponse = self.client.get(url)
+            self.assertEqual(reponse.status_code, 200, url)
+            donnees = reponse.get_json()
+            self.assertEqual(len(donnees["tranches"]), 1)
+            self.assertEqual(donnees["tranches"][0]["nombre"], donnees["total"])
+        self.assertEqual(self.client.get("/admin/statistiques?largeur=20").status_code, 200)
+
+    def test_bornes_non_finies(self):
+        for bornes in ("0,10,inf", "0,nan,20", "-inf,20"):
+            reponse = self.client.get(f"/admin/api/histogramme?bornes={bornes}")
+            self.assertEqual(reponse.status_code, 400, bornes)
+        self.assertEqual(self.client.get("/admin/api/histogramme?largeur=nan").status_code, 400)
+
+    def test_tranches_par_defaut(self):
+        donnees = self.client.get("/admin/api/histogramme").get_json()
+        self.assertEqual([t["tranche"] for t in donnees["tranches"]], ["0-5", "5-10", "10-15", "15-20"])
+        self.assertEqual(sum(t["nombre"] for t in donnees["tranches"]), donnees["total"])
+
+
+if __name__ == "__main__":
+    unittest.main()